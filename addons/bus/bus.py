@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import collections
 import datetime
 import json
 import logging
@@ -16,6 +17,11 @@ from openerp.tools.misc import DEFAULT_SERVER_DATETIME_FORMAT
 _logger = logging.getLogger(__name__)
 
 TIMEOUT = 50
+# maximal size of the payload of a notification (postgres limits it to 8000
+# bytes); the messages of bigger ones are fetched from the database
+MAX_PAYLOAD_SIZE = 7000
+# delay between two logs of the load of the dispatcher
+STATS_INTERVAL = 300
 
 #----------------------------------------------------------
 # Bus
@@ -23,6 +29,28 @@ TIMEOUT = 50
 def json_dump(v):
     return simplejson.dumps(v, separators=(',', ':'))
 
+def notification_payloads(dbname, items):
+    """ Return the payloads of the notifications of ``items`` (``[id, channel,
+    message]``): a single one with the messages if it fits, or several ones
+    with their ids otherwise.
+    """
+    payload = json_dump([dbname, items])
+    if len(payload) <= MAX_PAYLOAD_SIZE:
+        return [payload]
+    payloads = []
+    ids = []
+    base_size = size = len(json_dump([dbname, []]))
+    for item in items:
+        id_size = len(str(item[0])) + 1
+        if ids and size + id_size > MAX_PAYLOAD_SIZE:
+            payloads.append(json_dump([dbname, ids]))
+            ids = []
+            size = base_size
+        ids.append(item[0])
+        size += id_size
+    payloads.append(json_dump([dbname, ids]))
+    return payloads
+
 def hashable(key):
     if isinstance(key, list):
         key = tuple(key)
@@ -44,20 +72,23 @@ class ImBus(osv.Model):
         self.unlink(cr, openerp.SUPERUSER_ID, ids)
 
     def sendmany(self, cr, uid, notifications):
-        channels = set()
+        items = []
         for channel, message in notifications:
-            channels.add(channel)
             values = {
                 "channel" : json_dump(channel),
                 "message" : json_dump(message)
             }
-            self.pool['bus.bus'].create(cr, openerp.SUPERUSER_ID, values)
+            id = self.pool['bus.bus'].create(cr, openerp.SUPERUSER_ID, values)
+            items.append([id, channel, message])
+        if items:
             cr.commit()
             if random.random() < 0.01:
                 self.gc(cr, uid)
-        if channels:
+            # the notifications carry the messages, or only their ids if
+            # they do not fit in a payload
             with openerp.sql_db.db_connect('postgres').cursor() as cr2:
-                cr2.execute("notify imbus, %s", (json_dump(list(channels)),))
+                for payload in notification_payloads(cr.dbname, items):
+                    cr2.execute("notify imbus, %s", (payload,))
 
     def sendone(self, cr, uid, channel, message):
         self.sendmany(cr, uid, [[channel, message]])
@@ -76,8 +107,31 @@ class ImBus(osv.Model):
         return [{"id":notif["id"], "channel": simplejson.loads(notif["channel"]), "message":simplejson.loads(notif["message"])} for notif in notifications]
 
 class ImDispatch(object):
+    """ Dispatches the notifications of the bus to the polling clients.
+
+    The notifications received through the channel ``imbus`` are kept in
+    memory for a while, so that the clients they wake up, and the clients
+    polling again, get them without querying the database. The database is
+    only queried by the first poll of a client, and when the notifications
+    after the last one of a client may not be in memory anymore.
+    """
     def __init__(self):
+        self.lock = threading.RLock()
+        # {(dbname, channel): [event of a waiting client]}
         self.channels = {}
+        # {dbname: deque([(time, id, channel, notification)])}
+        self.buffers = {}
+        # {(dbname, channel): id of the last notification on channel}
+        self.last_ids = {}
+        # {dbname: id}; the notifications after it are all in memory
+        self.horizons = {}
+        # whether the notifications are received, and how many times the
+        # dispatcher started to listen to them
+        self.listening = False
+        self.generation = 0
+        # load metrics, logged every STATS_INTERVAL seconds
+        self.stats = collections.Counter()
+        self.stats_time = time.time()
 
     def poll(self, dbname, channels, last, timeout=TIMEOUT):
         # Dont hang ctrl-c for a poll request, we need to bypass private
@@ -89,24 +143,131 @@ class ImDispatch(object):
             # rename the thread to avoid tests waiting for a longpolling
             current.setName("openerp.longpolling.request.%s" % current.ident)
 
-        registry = openerp.registry(dbname)
+        keys = [hashable(c) for c in channels]
 
         # immediatly returns if past notifications exist
-        with registry.cursor() as cr:
-            notifications = registry['bus.bus'].poll(cr, openerp.SUPERUSER_ID, channels, last)
+        notifications = self._poll_memory(dbname, keys, last)
+        if notifications is None:
+            notifications = self._poll_database(dbname, channels, last)
         # or wait for future ones
         if not notifications:
             event = self.Event()
-            for c in channels:
-                self.channels.setdefault(hashable(c), []).append(event)
-            try:
-                event.wait(timeout=timeout)
-                with registry.cursor() as cr:
-                    notifications = registry['bus.bus'].poll(cr, openerp.SUPERUSER_ID, channels, last)
-            except Exception:
-                # timeout
-                pass
-        return notifications
+            with self.lock:
+                # a notification may have been received in the meantime
+                notifications = self._poll_memory(dbname, keys, last)
+                if not notifications:
+                    for key in keys:
+                        self.channels.setdefault((dbname, key), []).append(event)
+            if not notifications:
+                self.stats['waits'] += 1
+                try:
+                    event.wait(timeout=timeout)
+                    notifications = self._poll_memory(dbname, keys, last)
+                    if notifications is None:
+                        notifications = self._poll_database(dbname, channels, last)
+                except Exception:
+                    # timeout
+                    notifications = []
+                finally:
+                    self._discard(dbname, keys, event)
+        return notifications or []
+
+    def _poll_memory(self, dbname, keys, last):
+        """ Return the notifications on the channels ``keys`` after ``last``,
+        or ``None`` if they are not all in memory.
+        """
+        with self.lock:
+            horizon = self.horizons.get(dbname)
+            if not (self.listening and last and horizon is not None and last >= horizon):
+                return None
+            self.stats['memory_polls'] += 1
+            if all(self.last_ids.get((dbname, key), 0) <= last for key in keys):
+                return []
+            keys = set(keys)
+            return [notification
+                    for _time, id, key, notification in self.buffers.get(dbname, ())
+                    if id > last and key in keys]
+
+    def _poll_database(self, dbname, channels, last):
+        """ Return the notifications on ``channels`` after ``last`` from the
+        database, and determine which notifications of the database are in
+        memory, if not done yet.
+        """
+        self.stats['database_polls'] += 1
+        registry = openerp.registry(dbname)
+        with registry.cursor() as cr:
+            generation = self.generation
+            if self.listening and dbname not in self.horizons:
+                # the notifications after the current ones are received
+                cr.execute("SELECT max(id) FROM bus_bus")
+                horizon = cr.fetchone()[0] or 0
+                with self.lock:
+                    if generation == self.generation:
+                        self.horizons.setdefault(dbname, horizon)
+            return registry['bus.bus'].poll(cr, openerp.SUPERUSER_ID, channels, last)
+
+    def _discard(self, dbname, keys, event):
+        with self.lock:
+            for key in keys:
+                events = self.channels.get((dbname, key))
+                if events and event in events:
+                    events.remove(event)
+                    if not events:
+                        del self.channels[(dbname, key)]
+
+    def _fetch(self, dbname, ids):
+        """ Return the notifications ``ids`` of database ``dbname``. """
+        with openerp.sql_db.db_connect(dbname).cursor() as cr:
+            cr.execute("SELECT id, channel, message FROM bus_bus WHERE id IN %s", (tuple(ids),))
+            return [[id, simplejson.loads(channel), simplejson.loads(message)]
+                    for id, channel, message in cr.fetchall()]
+
+    def dispatch(self, dbname, items):
+        """ Keep the notifications ``items`` (``[id, channel, message]``) of
+        database ``dbname``, and wake up the clients waiting for them.
+        """
+        now = time.time()
+        events = set()
+        with self.lock:
+            buffer = self.buffers.setdefault(dbname, collections.deque())
+            for id, channel, message in sorted(items):
+                key = hashable(channel)
+                notification = {"id": id, "channel": channel, "message": message}
+                buffer.append((now, id, key, notification))
+                self.last_ids[(dbname, key)] = max(id, self.last_ids.get((dbname, key), 0))
+                events.update(self.channels.pop((dbname, key), []))
+            self.stats['notifications'] += len(items)
+            self.stats['wakeups'] += len(events)
+        for e in events:
+            e.set()
+
+    def gc(self):
+        """ Forget the notifications that the clients no longer poll. """
+        limit = time.time() - TIMEOUT * 2
+        with self.lock:
+            for dbname, buffer in self.buffers.items():
+                while buffer and buffer[0][0] < limit:
+                    _time, id, key, _notification = buffer.popleft()
+                    if dbname in self.horizons:
+                        self.horizons[dbname] = max(self.horizons[dbname], id)
+                    if self.last_ids.get((dbname, key)) == id:
+                        del self.last_ids[(dbname, key)]
+                if not buffer:
+                    del self.buffers[dbname]
+
+    def log_stats(self, force=False):
+        now = time.time()
+        if not force and now - self.stats_time < STATS_INTERVAL:
+            return
+        with self.lock:
+            waiting = len(set(e for events in self.channels.itervalues() for e in events))
+            stats, self.stats = self.stats, collections.Counter()
+        if stats or waiting:
+            _logger.info("%d waiting clients; in %ds: %d notifications, %d waits, "
+                         "%d wake-ups, %d polls from memory, %d polls from database",
+                         waiting, now - self.stats_time, stats['notifications'], stats['waits'],
+                         stats['wakeups'], stats['memory_polls'], stats['database_polls'])
+        self.stats_time = now
 
     def loop(self):
         """ Dispatch postgres notifications to the relevant polling threads/greenlets """
@@ -115,20 +276,27 @@ class ImDispatch(object):
             conn = cr._cnx
             cr.execute("listen imbus")
             cr.commit();
-            while True:
-                if select.select([conn], [], [], TIMEOUT) == ([],[],[]):
-                    pass
-                else:
-                    conn.poll()
-                    channels = []
-                    while conn.notifies:
-                        channels.extend(json.loads(conn.notifies.pop().payload))
-                    # dispatch to local threads/greenlets
-                    events = set()
-                    for c in channels:
-                        events.update(self.channels.pop(hashable(c),[]))
-                    for e in events:
-                        e.set()
+            with self.lock:
+                # the notifications sent so far may have been missed
+                self.generation += 1
+                self.horizons.clear()
+                self.listening = True
+            try:
+                while True:
+                    if select.select([conn], [], [], TIMEOUT) != ([],[],[]):
+                        conn.poll()
+                        payloads = []
+                        while conn.notifies:
+                            payloads.append(json.loads(conn.notifies.pop(0).payload))
+                        for dbname, items in payloads:
+                            if items and not isinstance(items[0], list):
+                                # only the ids fit in the payload
+                                items = self._fetch(dbname, items)
+                            self.dispatch(dbname, items)
+                    self.gc()
+                    self.log_stats()
+            finally:
+                self.listening = False
 
     def run(self):
         while True:
@@ -145,7 +313,8 @@ class ImDispatch(object):
             self.Event = gevent.event.Event
             gevent.spawn(self.run)
         elif openerp.multi_process:
-            # disabled in prefork mode
+            # disabled in prefork mode, where the longpolling requests are
+            # handled by the evented gateway process
             return
         else:
             # threaded mode
@@ -93,6 +93,7 @@ class product_uom_categ(osv.osv):
 class product_uom(osv.osv):
     _name = 'product.uom'
     _description = 'Product Unit of Measure'
+    _cache_shared = True
 
     def _compute_factor_inv(self, factor):
         return factor and (1.0 / factor) or 0.0
@@ -287,6 +288,7 @@ class product_category(osv.osv):
     _parent_name = "parent_id"
     _parent_store = True
     _parent_order = 'sequence, name'
+    _parent_path = True
     _order = 'parent_left'
 
     _constraints = [
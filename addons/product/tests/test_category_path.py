@@ -0,0 +1,51 @@
+from openerp.osv.orm import except_orm
+from openerp.tests.common import TransactionCase
+
+
+class TestCategoryPath(TransactionCase):
+    """ Tests the materialized path of product categories """
+
+    def setUp(self):
+        super(TestCategoryPath, self).setUp()
+        self.Category = self.env['product.category']
+        self.root = self.Category.create({'name': 'Root'})
+        self.a = self.Category.create({'name': 'A', 'parent_id': self.root.id})
+        self.a1 = self.Category.create({'name': 'A1', 'parent_id': self.a.id})
+        self.b = self.Category.create({'name': 'B', 'parent_id': self.root.id})
+
+    def get_path(self, category):
+        self.cr.execute("SELECT parent_path FROM product_category WHERE id=%s", (category.id,))
+        return self.cr.fetchone()[0]
+
+    def search(self, operator, category):
+        return self.Category.search([('id', operator, category.id)])
+
+    def test_paths(self):
+        self.assertEqual(self.get_path(self.root), '%d/' % self.root.id)
+        self.assertEqual(self.get_path(self.a1), '%d/%d/%d/' % (self.root.id, self.a.id, self.a1.id))
+
+    def test_child_of(self):
+        self.assertEqual(self.search('child_of', self.root), self.root | self.a | self.a1 | self.b)
+        self.assertEqual(self.search('child_of', self.a), self.a | self.a1)
+        self.assertEqual(self.search('child_of', self.a1), self.a1)
+        children = self.Category.search([('parent_id', 'child_of', self.a.id)])
+        self.assertEqual(children, self.a1)
+
+    def test_parent_of(self):
+        self.assertEqual(self.search('parent_of', self.a1), self.root | self.a | self.a1)
+        self.assertEqual(self.search('parent_of', self.b), self.root | self.b)
+        self.assertEqual(self.search('parent_of', self.root), self.root)
+
+    def test_move(self):
+        self.a.parent_id = self.b
+        self.assertEqual(self.get_path(self.a1), '%d/%d/%d/%d/' % (self.root.id, self.b.id, self.a.id, self.a1.id))
+        self.assertEqual(self.search('child_of', self.b), self.b | self.a | self.a1)
+        self.assertEqual(self.search('parent_of', self.a1), self.root | self.b | self.a | self.a1)
+
+        self.a.parent_id = False
+        self.assertEqual(self.get_path(self.a1), '%d/%d/' % (self.a.id, self.a1.id))
+        self.assertEqual(self.search('child_of', self.root), self.root | self.b)
+
+    def test_recursion(self):
+        with self.assertRaises(except_orm):
+            self.root.write({'parent_id': self.a1.id})
@@ -59,7 +59,9 @@ class ReportController(Controller):
             context.update(data_context)
 
         if converter == 'html':
-            html = report_obj.get_html(cr, uid, docids, reportname, data=options_data, context=context)
+            html = report_obj.get_html(cr, uid, docids, reportname, data=options_data, context=context, stream=True)
+            if not isinstance(html, basestring):
+                html = request.stream(html)
             return request.make_response(html)
         elif converter == 'xls':
             xls = report_obj.get_xls(cr, uid, docids, reportname, data=options_data, context=context)
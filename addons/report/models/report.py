@@ -29,6 +29,7 @@ from openerp.tools.translate import _
 from openerp.addons.web.http import request
 from openerp.tools.safe_eval import safe_eval as eval
 
+import collections
 import re
 import time
 import base64
@@ -114,11 +115,12 @@ class Report(osv.Model):
             qcontext['o'] = self.pool[model].browse(cr, uid, doc_id, context=ctx)
         return self.pool['ir.ui.view'].render(cr, uid, template, qcontext, context=ctx)
 
-    def render(self, cr, uid, ids, template, values=None, context=None):
+    def render(self, cr, uid, ids, template, values=None, context=None, stream=False):
         """Allow to render a QWeb template python-side. This function returns the 'ir.ui.view'
         render but embellish it with some variables/methods used in reports.
 
         :param values: additionnal methods/variables used in the rendering
+        :param stream: return an iterator of html chunks instead of a string
         :returns: html representation of the template
         """
         if values is None:
@@ -148,7 +150,7 @@ class Report(osv.Model):
             res_company=user.company_id,
             website=website,
         )
-        return view_obj.render(cr, uid, template, values, context=context)
+        return view_obj.render(cr, uid, template, values, context=context, stream=stream)
 
     #--------------------------------------------------------------------------
     # Main report methods
@@ -180,8 +182,11 @@ class Report(osv.Model):
                                     data=data, context=self._context)
 
     @api.v7
-    def get_html(self, cr, uid, ids, report_name, data=None, context=None):
+    def get_html(self, cr, uid, ids, report_name, data=None, context=None, stream=False):
         """This method generates and returns html version of a report.
+
+        :param stream: if set, the generic rendering returns an iterator of
+                       html chunks; reports with a custom model return a string
         """
         # If the report is using a custom model to render its html, we must use it.
         # Otherwise, fallback on the generic html rendering.
@@ -198,7 +203,7 @@ class Report(osv.Model):
                 'doc_model': report.model,
                 'docs': docs,
             }
-            return self.render(cr, uid, [], report.report_name, docargs, context=context)
+            return self.render(cr, uid, [], report.report_name, docargs, context=context, stream=stream)
 
     @api.v8
     def get_html(self, records, report_name, data=None):
@@ -212,15 +217,26 @@ class Report(osv.Model):
         if context is None:
             context = {}
 
+        # Get the ir.actions.report.xml record we are working on.
+        report = self._get_report_from_name(cr, uid, report_name)
+        # Check if we have to save the report or if we have to get one from the db.
+        save_in_attachment = self._check_attachment_use(cr, uid, ids, report)
+
+        # The documents loaded from the db are not rendered again
+        loaded_ids = []
         if html is None:
+            loaded_ids = [i for i in ids or [] if i in save_in_attachment['loaded_documents']]
+            if loaded_ids:
+                record_ids, ids = ids, [i for i in ids if i not in save_in_attachment['loaded_documents']]
+                if not ids:
+                    return self._run_wkhtmltopdf(
+                        cr, uid, [], [], [(i, None) for i in loaded_ids], context.get('landscape'),
+                        None, None, save_in_attachment
+                    )
             html = self.get_html(cr, uid, ids, report_name, data=data, context=context)
 
         html = html.decode('utf-8')  # Ensure the current document is utf-8 encoded.
 
-        # Get the ir.actions.report.xml record we are working on.
-        report = self._get_report_from_name(cr, uid, report_name)
-        # Check if we have to save the report or if we have to get one from the db.
-        save_in_attachment = self._check_attachment_use(cr, uid, ids, report)
         # Get the paperformat associated to the report, otherwise fallback on the company one.
         if not report.paperformat_id:
             user = self.pool['res.users'].browse(cr, uid, uid)
@@ -242,6 +258,7 @@ class Report(osv.Model):
 
         # The received html report must be simplified. We convert it in a xml tree
         # in order to extract headers, bodies and footers.
+        root = None
         try:
             root = lxml.html.fromstring(html)
             match_klass = "//div[contains(concat(' ', normalize-space(@class), ' '), ' {} ')]"
@@ -283,13 +300,28 @@ class Report(osv.Model):
 
         except lxml.etree.XMLSyntaxError:
             contenthtml = []
-            contenthtml.append(html)
-            save_in_attachment = {}  # Don't save this potentially malformed document
+            contenthtml.append((False, html))
+            # Don't save this potentially malformed document, but keep the loaded ones
+            save_in_attachment = {'loaded_documents': save_in_attachment['loaded_documents']}
+
+        if loaded_ids:
+            # Put the loaded documents at the position of their record
+            position = dict((i, index) for index, i in enumerate(record_ids))
+            pages = []
+            last = -1
+            for index, reporthtml in enumerate(contenthtml):
+                last = position.get(reporthtml[0], last)
+                pages.append((last, index, headerhtml and headerhtml[index], footerhtml and footerhtml[index], reporthtml))
+            pages.extend((position[i], -1, '', '', (i, None)) for i in loaded_ids)
+            pages.sort(key=lambda page: page[:2])
+            headerhtml = [page[2] for page in pages] if headerhtml else []
+            footerhtml = [page[3] for page in pages] if footerhtml else []
+            contenthtml = [page[4] for page in pages]
 
         # Get paperformat arguments set in the root html tag. They are prioritized over
         # paperformat-record arguments.
         specific_paperformat_args = {}
-        for attribute in root.items():
+        for attribute in (root.items() if root is not None else []):
             if attribute[0].startswith('data-report-'):
                 specific_paperformat_args[attribute[0]] = attribute[1]
 
@@ -430,78 +462,66 @@ class Report(osv.Model):
         elif landscape and not '--orientation' in command_args:
             command_args.extend(['--orientation', 'landscape'])
 
-        # Execute WKhtmltopdf
+        # Execute WKhtmltopdf: the bodies are converted by concurrent processes,
+        # at most report_pdf_workers at a time, and merged in their order
+        workers = max(int(config.get('report_pdf_workers', 1)), 1)
         pdfdocuments = []
         temporary_files = []
+        running = collections.deque()  # (process, reporthtml, pdfreport_path)
 
-        for index, reporthtml in enumerate(bodies):
-            local_command_args = []
-            pdfreport_fd, pdfreport_path = tempfile.mkstemp(suffix='.pdf', prefix='report.tmp.')
-            temporary_files.append(pdfreport_path)
-
-            # Directly load the document if we already have it
-            if save_in_attachment and save_in_attachment['loaded_documents'].get(reporthtml[0]):
-                with closing(os.fdopen(pdfreport_fd, 'w')) as pdfreport:
-                    pdfreport.write(save_in_attachment['loaded_documents'][reporthtml[0]])
+        try:
+            for index, reporthtml in enumerate(bodies):
+                local_command_args = []
+                pdfreport_fd, pdfreport_path = tempfile.mkstemp(suffix='.pdf', prefix='report.tmp.')
+                temporary_files.append(pdfreport_path)
                 pdfdocuments.append(pdfreport_path)
-                continue
-            else:
-                os.close(pdfreport_fd)
-
-            # Wkhtmltopdf handles header/footer as separate pages. Create them if necessary.
-            if headers:
-                head_file_fd, head_file_path = tempfile.mkstemp(suffix='.html', prefix='report.header.tmp.')
-                temporary_files.append(head_file_path)
-                with closing(os.fdopen(head_file_fd, 'w')) as head_file:
-                    head_file.write(headers[index])
-                local_command_args.extend(['--header-html', head_file_path])
-            if footers:
-                foot_file_fd, foot_file_path = tempfile.mkstemp(suffix='.html', prefix='report.footer.tmp.')
-                temporary_files.append(foot_file_path)
-                with closing(os.fdopen(foot_file_fd, 'w')) as foot_file:
-                    foot_file.write(footers[index])
-                local_command_args.extend(['--footer-html', foot_file_path])
-
-            # Body stuff
-            content_file_fd, content_file_path = tempfile.mkstemp(suffix='.html', prefix='report.body.tmp.')
-            temporary_files.append(content_file_path)
-            with closing(os.fdopen(content_file_fd, 'w')) as content_file:
-                content_file.write(reporthtml[1])
 
-            try:
+                # Directly load the document if we already have it
+                if save_in_attachment and save_in_attachment['loaded_documents'].get(reporthtml[0]):
+                    with closing(os.fdopen(pdfreport_fd, 'w')) as pdfreport:
+                        pdfreport.write(save_in_attachment['loaded_documents'][reporthtml[0]])
+                    continue
+                else:
+                    os.close(pdfreport_fd)
+
+                # Wkhtmltopdf handles header/footer as separate pages. Create them if necessary.
+                if headers:
+                    head_file_fd, head_file_path = tempfile.mkstemp(suffix='.html', prefix='report.header.tmp.')
+                    temporary_files.append(head_file_path)
+                    with closing(os.fdopen(head_file_fd, 'w')) as head_file:
+                        head_file.write(headers[index])
+                    local_command_args.extend(['--header-html', head_file_path])
+                if footers:
+                    foot_file_fd, foot_file_path = tempfile.mkstemp(suffix='.html', prefix='report.footer.tmp.')
+                    temporary_files.append(foot_file_path)
+                    with closing(os.fdopen(foot_file_fd, 'w')) as foot_file:
+                        foot_file.write(footers[index])
+                    local_command_args.extend(['--footer-html', foot_file_path])
+
+                # Body stuff
+                content_file_fd, content_file_path = tempfile.mkstemp(suffix='.html', prefix='report.body.tmp.')
+                temporary_files.append(content_file_path)
+                with closing(os.fdopen(content_file_fd, 'w')) as content_file:
+                    content_file.write(reporthtml[1])
+
+                while len(running) >= workers:
+                    self._wait_wkhtmltopdf(cr, uid, running.popleft(), save_in_attachment)
+
                 wkhtmltopdf = [_get_wkhtmltopdf_bin()] + command_args + local_command_args
                 wkhtmltopdf += [content_file_path] + [pdfreport_path]
-
                 process = subprocess.Popen(wkhtmltopdf, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                out, err = process.communicate()
-
-                if process.returncode not in [0, 1]:
-                    raise osv.except_osv(_('Report (PDF)'),
-                                         _('Wkhtmltopdf failed (error code: %s). '
-                                           'Message: %s') % (str(process.returncode), err))
-
-                # Save the pdf in attachment if marked
-                if reporthtml[0] is not False and save_in_attachment.get(reporthtml[0]):
-                    with open(pdfreport_path, 'rb') as pdfreport:
-                        attachment = {
-                            'name': save_in_attachment.get(reporthtml[0]),
-                            'datas': base64.encodestring(pdfreport.read()),
-                            'datas_fname': save_in_attachment.get(reporthtml[0]),
-                            'res_model': save_in_attachment.get('model'),
-                            'res_id': reporthtml[0],
-                        }
-                        try:
-                            self.pool['ir.attachment'].create(cr, uid, attachment)
-                        except AccessError:
-                            _logger.warning("Cannot save PDF report %r as attachment",
-                                            attachment['name'])
-                        else:
-                            _logger.info('The PDF document %s is now saved in the database',
-                                         attachment['name'])
-
-                pdfdocuments.append(pdfreport_path)
-            except:
-                raise
+                running.append((process, reporthtml, pdfreport_path))
+
+            while running:
+                self._wait_wkhtmltopdf(cr, uid, running.popleft(), save_in_attachment)
+        except:
+            for process, _reporthtml, _path in running:
+                try:
+                    process.kill()
+                    process.wait()
+                except OSError:
+                    pass
+            raise
 
         # Return the entire document
         if len(pdfdocuments) == 1:
@@ -522,6 +542,39 @@ class Report(osv.Model):
 
         return content
 
+    def _wait_wkhtmltopdf(self, cr, uid, conversion, save_in_attachment):
+        """Wait for the end of a wkhtmltopdf process started by ``_run_wkhtmltopdf``, and
+        save its pdf in attachment if marked.
+
+        :param conversion: tuple (process, reporthtml, path of the pdf)
+        """
+        process, reporthtml, pdfreport_path = conversion
+        out, err = process.communicate()
+
+        if process.returncode not in [0, 1]:
+            raise osv.except_osv(_('Report (PDF)'),
+                                 _('Wkhtmltopdf failed (error code: %s). '
+                                   'Message: %s') % (str(process.returncode), err))
+
+        # Save the pdf in attachment if marked
+        if reporthtml[0] is not False and save_in_attachment.get(reporthtml[0]):
+            with open(pdfreport_path, 'rb') as pdfreport:
+                attachment = {
+                    'name': save_in_attachment.get(reporthtml[0]),
+                    'datas': base64.encodestring(pdfreport.read()),
+                    'datas_fname': save_in_attachment.get(reporthtml[0]),
+                    'res_model': save_in_attachment.get('model'),
+                    'res_id': reporthtml[0],
+                }
+                try:
+                    self.pool['ir.attachment'].create(cr, uid, attachment)
+                except AccessError:
+                    _logger.warning("Cannot save PDF report %r as attachment",
+                                    attachment['name'])
+                else:
+                    _logger.info('The PDF document %s is now saved in the database',
+                                 attachment['name'])
+
     def _get_report_from_name(self, cr, uid, report_name):
         """Get the first record of ir.actions.report.xml having the ``report_name`` as value for
         the field report_name.
@@ -60,6 +60,7 @@ class stock_location(osv.osv):
     _description = "Inventory Locations"
     _parent_name = "location_id"
     _parent_store = True
+    _parent_path = True
     _parent_order = 'name'
     _order = 'parent_left'
     _rec_name = 'complete_name'
@@ -8,6 +8,7 @@ import glob
 import itertools
 import jinja2
 import logging
+import mimetypes
 import operator
 import datetime
 import hashlib
@@ -15,6 +16,7 @@ import os
 import re
 import simplejson
 import sys
+import tempfile
 import time
 import urllib2
 import zlib
@@ -28,6 +30,10 @@ try:
     import xlwt
 except ImportError:
     xlwt = None
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
 
 import openerp
 import openerp.modules.registry
@@ -925,7 +931,10 @@ class DataSet(http.Controller):
         if method.startswith('_'):
             raise Exception("Access Denied: Underscore prefixed methods cannot be remotely called")
 
-        return getattr(request.registry.get(model), method)(request.cr, request.uid, *args, **kwargs)
+        method = getattr(request.registry.get(model), method)
+        if getattr(method, '_readonly', False):
+            request.readonly = True
+        return method(request.cr, request.uid, *args, **kwargs)
 
     @http.route('/web/dataset/call', type='json', auth="user")
     def call(self, model, method, args, domain_id=None, context_id=None):
@@ -1033,6 +1042,7 @@ class Binary(http.Controller):
                 retag = hashlib.md5(res.get(last_update)).hexdigest()
                 image_base64 = res.get(field)
 
+            image_data = None
             if kw.get('resize'):
                 resize = kw.get('resize').split(',')
                 if len(resize) == 2 and int(resize[0]) and int(resize[1]):
@@ -1041,9 +1051,12 @@ class Binary(http.Controller):
                     # resize maximum 500*500
                     if width > 500: width = 500
                     if height > 500: height = 500
-                    image_base64 = openerp.tools.image_resize_image(base64_source=image_base64, size=(width, height), encoding='base64', filetype='PNG')
+                    # resized images are cached by content, size and format
+                    image_cache = openerp.tools.image_cache(request.db)
+                    image_data = image_cache.resize(image_base64, (width, height), 'PNG')
 
-            image_data = base64.b64decode(image_base64)
+            if image_data is None:
+                image_data = base64.b64decode(image_base64)
 
         except Exception:
             image_data = self.placeholder()
@@ -1053,7 +1066,9 @@ class Binary(http.Controller):
             ncache = int(kw.get('cache'))
             headers.append(('Cache-Control', 'no-cache' if ncache == 0 else 'max-age=%s' % (ncache)))
         except:
-            pass
+            if kw.get('unique'):
+                # the url changes with the image, which can be kept for long
+                headers.append(('Cache-Control', 'max-age=%s' % http.STATIC_CACHE))
         return request.make_response(image_data, headers)
 
     def placeholder(self, image='placeholder.png'):
@@ -1077,6 +1092,12 @@ class Binary(http.Controller):
         """
         Model = request.registry[model]
         cr, uid, context = request.cr, request.uid, request.context
+        if model == 'ir.attachment' and field == 'datas' and id:
+            # stream the file instead of decoding it in memory
+            filename = None
+            if filename_field:
+                filename = Model.read(cr, uid, [int(id)], [filename_field], context)[0][filename_field]
+            return self._attachment_response(int(id), filename)
         fields = [field]
         if filename_field:
             fields.append(filename_field)
@@ -1095,6 +1116,56 @@ class Binary(http.Controller):
                 [('Content-Type', 'application/octet-stream'),
                  ('Content-Disposition', content_disposition(filename))])
 
+    @http.route('/web/binary/attachment/<int:id>', type='http', auth="public")
+    @serialize_exception
+    def attachment(self, id, download='1', **kw):
+        """ Download link for attachments, which sends their content without
+        loading it in memory, and supports conditional and range requests.
+
+        :param int id: id of the attachment
+        :param str download: ``'0'`` to display the file in the browser
+                             instead of sending it as an attachment; active
+                             content like HTML is never displayed
+        :returns: :class:`werkzeug.wrappers.Response`
+        """
+        return self._attachment_response(id, as_attachment=download != '0')
+
+    def _attachment_response(self, id, filename=None, as_attachment=True):
+        """ Return the response sending the content of attachment ``id``. The
+        files of the local filestore are sent by path, so that the front-end web
+        server may send them itself, with the sha1 of their content as etag.
+        The files that browsers may run as active content (HTML, SVG, XML) are
+        sent as plain binary data.
+        """
+        Attachment = request.registry['ir.attachment']
+        cr, uid, context = request.cr, request.uid, request.context
+        attach = Attachment.read(cr, uid, [id], ['name', 'datas_fname', 'store_fname', 'write_date'], context)[0]
+        filename = filename or attach['datas_fname'] or attach['name']
+        source = etag = None
+        if attach['store_fname']:
+            path = Attachment._full_path(cr, uid, attach['store_fname'])
+            if os.path.isfile(path):
+                source = path
+                etag = os.path.basename(attach['store_fname'])
+        if source is None:
+            # stored in the database, or by an override of the file storage
+            try:
+                source = Attachment._data_open(cr, uid, id, context=context)
+            except IOError:
+                return request.not_found()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        if 'html' in mimetype or 'xml' in mimetype or 'script' in mimetype:
+            mimetype = 'application/octet-stream'
+        response = http.send_file(source, mimetype=mimetype, filename=filename,
+                                  mtime=attach['write_date'], cache_timeout=0, etag=etag)
+        # attachments are subject to access rights
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        if as_attachment:
+            response.headers['Content-Disposition'] = content_disposition(filename)
+        return response
+
     @http.route('/web/binary/saveas_ajax', type='http', auth="public")
     @serialize_exception
     def saveas_ajax(self, data, token):
@@ -1261,8 +1332,24 @@ class Export(http.Controller):
         return [
             {'tag': 'csv', 'label': 'CSV'},
             {'tag': 'xls', 'label': 'Excel', 'error': None if xlwt else "XLWT required"},
+            {'tag': 'xlsx', 'label': 'Excel 2007', 'error': None if xlsxwriter else "XlsxWriter required"},
         ]
 
+    @http.route('/web/export/enqueue', type='json', auth="user")
+    def enqueue(self, format, data):
+        """ Runs an export as a background job, which stores the exported
+        file in an attachment.
+
+        :param str format: the tag of the export format
+        :param dict data: the export parameters, as sent to the export
+                          routes
+        :returns: the id of the job (``ir.job``), whose result is the id of
+                  the attachment
+        """
+        job = request.env['ir.exports'].with_delay(
+            description=_("Export of %s") % data['model'])._export_attachment(format, data)
+        return job.id
+
     def fields_get(self, model):
         Model = request.session.model(model)
         fields = Model.fields_get(False, request.context)
@@ -1414,29 +1501,47 @@ class ExportFormat(object):
         """
         raise NotImplementedError()
 
-    def base(self, data, token):
-        params = simplejson.loads(data)
+    def stream_data(self, fields, rows):
+        """ Same as :meth:`from_data`, but generates the output by chunks,
+        while iterating over ``rows``. Formats that cannot be written
+        incrementally simply generate the result of :meth:`from_data`.
+
+        :params list fields: a list of fields to export
+        :params rows: an iterable over the records to export
+        :returns: an iterator over chunks of bytes
+        """
+        yield self.from_data(fields, list(rows))
+
+    def export_rows(self, env, params):
+        """ Return the headers and an iterator over the rows of the export
+        described by ``params``, with the fields, records and options chosen
+        by the user. The records are exported by batches.
+        """
         model, fields, ids, domain, import_compat = \
             operator.itemgetter('model', 'fields', 'ids', 'domain',
                                 'import_compat')(
                 params)
 
-        Model = request.session.model(model)
-        context = dict(request.context or {}, **params.get('context', {}))
-        ids = ids or Model.search(domain, 0, False, False, context)
+        records = env[model].with_context(**params.get('context', {}))
+        records = records.browse(ids) if ids else records.search(domain)
 
         field_names = map(operator.itemgetter('name'), fields)
-        import_data = Model.export_data(ids, field_names, self.raw_data, context=context).get('datas',[])
+        rows = records._export_data_iter(field_names, self.raw_data)
 
         if import_compat:
             columns_headers = field_names
         else:
             columns_headers = [val['label'].strip() for val in fields]
+        return columns_headers, rows
 
+    def base(self, data, token):
+        params = simplejson.loads(data)
+        columns_headers, rows = self.export_rows(request.env, params)
 
-        return request.make_response(self.from_data(columns_headers, import_data),
+        # the rows are read while the response is sent
+        return request.make_response(request.stream(self.stream_data(columns_headers, rows)),
             headers=[('Content-Disposition',
-                            content_disposition(self.filename(model))),
+                            content_disposition(self.filename(params['model']))),
                      ('Content-Type', self.content_type)],
             cookies={'fileToken': token})
 
@@ -1455,6 +1560,9 @@ class CSVExport(ExportFormat, http.Controller):
         return base + '.csv'
 
     def from_data(self, fields, rows):
+        return ''.join(self.stream_data(fields, rows))
+
+    def stream_data(self, fields, rows):
         fp = StringIO()
         writer = csv.writer(fp, quoting=csv.QUOTE_ALL)
 
@@ -1472,11 +1580,13 @@ class CSVExport(ExportFormat, http.Controller):
                 if d is False: d = None
                 row.append(d)
             writer.writerow(row)
+            if fp.tell() >= http.STREAM_CHUNK_SIZE:
+                yield fp.getvalue()
+                fp.seek(0)
+                fp.truncate()
 
-        fp.seek(0)
-        data = fp.read()
+        yield fp.getvalue()
         fp.close()
-        return data
 
 class ExcelExport(ExportFormat, http.Controller):
     # Excel needs raw data to correctly handle numbers and date values
@@ -1524,6 +1634,66 @@ class ExcelExport(ExportFormat, http.Controller):
         fp.close()
         return data
 
+class XLSXExport(ExportFormat, http.Controller):
+    # Excel needs raw data to correctly handle numbers and date values
+    raw_data = True
+
+    @http.route('/web/export/xlsx', type='http', auth="user")
+    @serialize_exception
+    def index(self, data, token):
+        return self.base(data, token)
+
+    @property
+    def content_type(self):
+        return 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    def filename(self, base):
+        return base + '.xlsx'
+
+    def from_data(self, fields, rows):
+        return ''.join(self.stream_data(fields, rows))
+
+    def stream_data(self, fields, rows):
+        # the rows are flushed to temporary files as they are written, and
+        # the workbook is assembled in a temporary file, sent by chunks
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+            worksheet = workbook.add_worksheet('Sheet 1')
+
+            base_style = workbook.add_format({'text_wrap': True})
+            date_style = workbook.add_format({'text_wrap': True, 'num_format': 'yyyy-mm-dd'})
+            datetime_style = workbook.add_format({'text_wrap': True, 'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+            worksheet.set_column(0, max(len(fields) - 1, 0), 40) # around 220 pixels
+            for i, fieldname in enumerate(fields):
+                worksheet.write_string(0, i, fieldname)
+
+            for row_index, row in enumerate(rows):
+                for cell_index, cell_value in enumerate(row):
+                    if isinstance(cell_value, basestring):
+                        cell_value = re.sub("\r", " ", cell_value)
+                        worksheet.write_string(row_index + 1, cell_index, cell_value, base_style)
+                    elif isinstance(cell_value, (datetime.datetime, datetime.date)):
+                        style = datetime_style if isinstance(cell_value, datetime.datetime) else date_style
+                        worksheet.write_datetime(row_index + 1, cell_index, cell_value, style)
+                    else:
+                        worksheet.write(row_index + 1, cell_index, cell_value, base_style)
+            workbook.close()
+
+            with open(path, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(http.STREAM_CHUNK_SIZE), ''):
+                    yield chunk
+        finally:
+            os.unlink(path)
+
+EXPORT_FORMATS = {
+    'csv': CSVExport,
+    'xls': ExcelExport,
+    'xlsx': XLSXExport,
+}
+
 class Reports(http.Controller):
     POLLING_DELAY = 0.25
     TYPES_MAPPING = {
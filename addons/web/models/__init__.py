@@ -0,0 +1 @@
+import ir_exports
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import base64
+import tempfile
+
+from openerp import api, models
+from openerp.addons.web.controllers.main import EXPORT_FORMATS
+
+
+class ir_exports(models.Model):
+    _inherit = 'ir.exports'
+
+    @api.model
+    def _export_attachment(self, format, data):
+        """ Export the records described by ``data`` (the parameters of the
+        export routes) in ``format``, and return the id of the attachment
+        holding the exported file. Run by the jobs of ``/web/export/enqueue``.
+        """
+        exporter = EXPORT_FORMATS[format]()
+        columns_headers, rows = exporter.export_rows(self.env, data)
+        with tempfile.TemporaryFile() as fp:
+            for chunk in exporter.stream_data(columns_headers, rows):
+                fp.write(chunk)
+            fp.seek(0)
+            datas = base64.b64encode(fp.read())
+        filename = exporter.filename(data['model'])
+        attachment = self.env['ir.attachment'].create({
+            'name': filename,
+            'datas_fname': filename,
+            'datas': datas,
+        })
+        return attachment.id
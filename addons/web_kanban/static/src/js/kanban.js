@@ -1126,10 +1126,18 @@ instance.web_kanban.KanbanRecord = instance.web.Widget.extend({
         } else if (this.record[field] && ! this.record[field].value) {
             url = "/web/static/src/img/placeholder.png";
         } else {
+            // only the images of this record change with its last update
+            // (views may give its id as raw or formatted value)
+            var own_image = model === this.view.dataset.model &&
+                (id === this.id || (this.record.id && id === this.record.id.value));
             id = JSON.stringify(id);
             if (options.preview_image)
                 field = options.preview_image;
             url = this.session.url('/web/binary/image', {model: model, field: field, id: id});
+            if (own_image && this.record.__last_update && this.record.__last_update.raw_value) {
+                // the url changes with the record, so the image can be cached
+                url += '&unique=' + encodeURIComponent(this.record.__last_update.raw_value);
+            }
             if (cache !== undefined) {
                 // Set the cache duration in seconds.
                 url += '&cache=' + parseInt(cache, 10);
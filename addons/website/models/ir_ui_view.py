@@ -129,7 +129,7 @@ class view(osv.osv):
         return arch
 
     @api.cr_uid_ids_context
-    def render(self, cr, uid, id_or_xml_id, values=None, engine='ir.qweb', context=None):
+    def render(self, cr, uid, id_or_xml_id, values=None, engine='ir.qweb', context=None, stream=False):
         if request and getattr(request, 'website_enabled', False):
             engine='website.qweb'
 
@@ -169,7 +169,7 @@ class view(osv.osv):
 
             values = qcontext
 
-        return super(view, self).render(cr, uid, id_or_xml_id, values=values, engine=engine, context=context)
+        return super(view, self).render(cr, uid, id_or_xml_id, values=values, engine=engine, context=context, stream=stream)
 
     def _pretty_arch(self, arch):
         # remove_blank_string does not seem to work on HTMLParser, and
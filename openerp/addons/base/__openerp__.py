@@ -44,6 +44,7 @@ The kernel of OpenERP, needed for all installation.
         'ir/ir_actions.xml',
         'ir/ir_config_parameter_view.xml',
         'ir/ir_cron_view.xml',
+        'ir/ir_job_view.xml',
         'ir/ir_filters.xml',
         'ir/ir_mail_server_view.xml',
         'ir/ir_model_view.xml',
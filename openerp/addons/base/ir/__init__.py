@@ -28,6 +28,7 @@ import ir_default
 import ir_actions
 import ir_attachment
 import ir_cron
+import ir_job
 import ir_filters
 import ir_values
 import ir_translation
@@ -19,11 +19,13 @@
 #
 ##############################################################################
 
+import errno
 import hashlib
 import itertools
 import logging
 import os
 import re
+from cStringIO import StringIO
 
 from openerp import tools
 from openerp.tools.translate import _
@@ -45,6 +47,9 @@ class ir_attachment(osv.osv):
     _file_read, _file_write and _file_delete which can be overridden to
     implement other storage engines, shuch methods should check for other
     location pseudo uri (example: hdfs://hadoppserver)
+
+    The raw content of attachments is available without base64 encoding
+    through _data_open, implemented using _file_open.
     
     The default implementation is the file:dirname location that stores files
     on the local filesystem using name based on their sha1 hash
@@ -122,11 +127,18 @@ class ir_attachment(osv.osv):
             if bin_size:
                 r = os.path.getsize(full_path)
             else:
-                r = open(full_path,'rb').read().encode('base64')
+                with self._file_open(cr, uid, fname) as fp:
+                    r = fp.read().encode('base64')
         except IOError:
             _logger.exception("_read_file reading %s", full_path)
         return r
 
+    def _file_open(self, cr, uid, fname):
+        """ Return a file object reading the raw content of stored file
+        ``fname``, which the caller must close.
+        """
+        return open(self._full_path(cr, uid, fname), 'rb')
+
     def _file_write(self, cr, uid, value):
         bin_value = value.decode('base64')
         fname, full_path = self._get_path(cr, uid, bin_value)
@@ -134,23 +146,75 @@ class ir_attachment(osv.osv):
             try:
                 with open(full_path, 'wb') as fp:
                     fp.write(bin_value)
+                # the file is orphan if the transaction is rolled back
+                self._mark_for_gc(cr, uid, fname)
             except IOError:
                 _logger.exception("_file_write writing %s", full_path)
         return fname
 
     def _file_delete(self, cr, uid, fname):
-        # using SQL to include files hidden through unlink or due to record rules
-        cr.execute("SELECT COUNT(*) FROM ir_attachment WHERE store_fname = %s", (fname,))
-        count = cr.fetchone()[0]
-        full_path = self._full_path(cr, uid, fname)
-        if not count and os.path.exists(full_path):
-            try:
-                os.unlink(full_path)
-            except OSError:
-                _logger.exception("_file_delete could not unlink %s", full_path)
-            except IOError:
-                # Harmless and needed for race conditions
-                _logger.exception("_file_delete could not unlink %s", full_path)
+        # the file may still be used by other attachments, or by this one if
+        # the transaction is rolled back: let the garbage collector decide
+        self._mark_for_gc(cr, uid, fname)
+
+    def _mark_for_gc(self, cr, uid, fname):
+        """ Add ``fname`` to the checklist of the files that the garbage
+        collector deletes if no attachment refers to them anymore.
+        """
+        full_path = self._full_path(cr, uid, 'checklist/' + fname)
+        if not os.path.exists(full_path):
+            dirname = os.path.dirname(full_path)
+            if not os.path.isdir(dirname):
+                with tools.ignore(OSError):
+                    os.makedirs(dirname)
+            open(full_path, 'ab').close()
+
+    def _file_gc(self, cr, uid, context=None):
+        """ Delete the files of the checklist that are no longer referred to
+        by any attachment, and return the number of files and bytes reclaimed.
+        The current transaction is committed.
+        """
+        # commit to start a new transaction, whose snapshot is taken once the
+        # concurrent transactions that modify attachments are committed
+        cr.commit()
+        cr.execute("LOCK ir_attachment IN SHARE MODE")
+
+        checklist = {}              # {fname: path of its checklist entry}
+        for dirpath, dirnames, filenames in os.walk(self._full_path(cr, uid, 'checklist')):
+            dirname = os.path.basename(dirpath)
+            for filename in filenames:
+                checklist['%s/%s' % (dirname, filename)] = os.path.join(dirpath, filename)
+        if not checklist:
+            cr.commit()
+            return 0, 0
+
+        cr.execute("""
+            SELECT fname FROM unnest(%s) AS fname
+            WHERE NOT EXISTS (SELECT 1 FROM ir_attachment WHERE store_fname = fname)
+        """, (list(checklist),))
+        orphans = set(fname for (fname,) in cr.fetchall())
+        removed = reclaimed = 0
+        for fname, checklist_path in checklist.iteritems():
+            if fname in orphans:
+                full_path = self._full_path(cr, uid, fname)
+                try:
+                    size = os.path.getsize(full_path)
+                    os.unlink(full_path)
+                    removed += 1
+                    reclaimed += size
+                except OSError, e:
+                    if e.errno != errno.ENOENT:
+                        # keep it on the checklist for the next run
+                        _logger.warning("_file_gc could not unlink %s", full_path, exc_info=True)
+                        continue
+            with tools.ignore(OSError):
+                os.unlink(checklist_path)
+
+        # release the lock
+        cr.commit()
+        _logger.info("filestore gc: %d files checked, %d removed, %d bytes reclaimed",
+                     len(checklist), removed, reclaimed)
+        return removed, reclaimed
 
     def _data_get(self, cr, uid, ids, name, arg, context=None):
         if context is None:
@@ -164,6 +228,25 @@ class ir_attachment(osv.osv):
                 result[attach.id] = attach.db_datas
         return result
 
+    def _data_open(self, cr, uid, id, context=None):
+        """ Return a file object reading the raw content of attachment ``id``,
+        which the caller must close. The content of the attachments stored
+        in the filestore is not loaded in memory.
+        """
+        attach = self.read(cr, uid, [id], ['store_fname'], context=context)[0]
+        if attach['store_fname']:
+            try:
+                return self._file_open(cr, uid, attach['store_fname'])
+            except IOError:
+                # the storage may only override _file_read()
+                content = self._file_read(cr, uid, attach['store_fname'])
+                if not content:
+                    raise
+                return StringIO(content.decode('base64'))
+        context = dict(context or {}, bin_size=False)
+        attach = self.read(cr, uid, [id], ['db_datas'], context=context)[0]
+        return StringIO((attach['db_datas'] or '').decode('base64'))
+
     def _data_set(self, cr, uid, id, name, value, arg, context=None):
         # We dont handle setting data to null
         if not value:
@@ -203,7 +286,7 @@ class ir_attachment(osv.osv):
         'url': fields.char('Url', size=1024),
         # al: We keep shitty field names for backward compatibility with document
         'datas': fields.function(_data_get, fnct_inv=_data_set, string='File Content', type="binary", nodrop=True),
-        'store_fname': fields.char('Stored Filename'),
+        'store_fname': fields.char('Stored Filename', select=True),
         'db_datas': fields.binary('Database Data'),
         'file_size': fields.integer('File Size'),
     }
@@ -342,7 +425,7 @@ class ir_attachment(osv.osv):
                         for a in self.browse(cr, uid, ids, context=context)
                             if a.store_fname]
         res = super(ir_attachment, self).unlink(cr, uid, ids, context)
-        for file_path in to_delete:
+        for file_path in set(to_delete):
             self._file_delete(cr, uid, file_path)
 
         return res
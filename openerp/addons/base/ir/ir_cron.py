@@ -38,6 +38,9 @@ _logger = logging.getLogger(__name__)
 
 BASE_VERSION = load_information_from_description_file('base')['version']
 
+# channel notified when the jobs of a database change, see openerp.service.cron
+CRON_CHANNEL = 'ir_cron'
+
 def str2tuple(s):
     return eval('tuple(%s)' % (s or ''))
 
@@ -195,10 +198,23 @@ class ir_cron(osv.osv):
 
         If a job was processed, returns True, otherwise returns False.
         """
+        jobs, _delay = cls._poll_jobs(db_name)
+        acquired = False
+        for job in jobs:
+            acquired = cls._run_job(db_name, job) or acquired
+        return acquired
+
+    @classmethod
+    def _poll_jobs(cls, db_name):
+        """ Returns the jobs of the database ``db_name`` that should be
+        processed now, and the delay in seconds before the next planned job,
+        or ``None`` if there is none.
+        """
         db = openerp.sql_db.db_connect(db_name)
         threading.current_thread().dbname = db_name
         cr = db.cursor()
         jobs = []
+        delay = None
         try:
             # Make sure the database we poll has the same version as the code of base
             cr.execute("SELECT 1 FROM ir_module_module WHERE name=%s AND latest_version=%s", ('base', BASE_VERSION))
@@ -209,6 +225,11 @@ class ir_cron(osv.osv):
                                   AND active AND nextcall <= (now() at time zone 'UTC')
                               ORDER BY priority""")
                 jobs = cr.dictfetchall()
+                cr.execute("""SELECT extract(epoch from min(nextcall) - (now() at time zone 'UTC'))
+                              FROM ir_cron
+                              WHERE numbercall != 0
+                                  AND active AND nextcall > (now() at time zone 'UTC')""")
+                delay = cr.fetchone()[0]
             else:
                 _logger.warning('Skipping database %s as its base version is not %s.', db_name, BASE_VERSION)
         except psycopg2.ProgrammingError, e:
@@ -222,51 +243,68 @@ class ir_cron(osv.osv):
             _logger.warning('Exception in cron:', exc_info=True)
         finally:
             cr.close()
+            if hasattr(threading.current_thread(), 'dbname'):
+                del threading.current_thread().dbname
+        return jobs, delay
 
-        for job in jobs:
-            lock_cr = db.cursor()
+    @classmethod
+    def _run_job(cls, db_name, job):
+        """ Process the job ``job`` returned by :meth:`_poll_jobs`, unless it
+        has been processed or is being processed by another process/thread.
+
+        Returns whether the job was processed.
+        """
+        db = openerp.sql_db.db_connect(db_name)
+        threading.current_thread().dbname = db_name
+        lock_cr = db.cursor()
+        try:
+            # Try to grab an exclusive lock on the job row from within the task transaction
+            # Restrict to the same conditions as for the search since the job may have already
+            # been run by an other thread when cron is running in multi thread
+            lock_cr.execute("""SELECT *
+                               FROM ir_cron
+                               WHERE numbercall != 0
+                                  AND active
+                                  AND nextcall <= (now() at time zone 'UTC')
+                                  AND id=%s
+                               FOR UPDATE NOWAIT""",
+                           (job['id'],), log_exceptions=False)
+
+            locked_job = lock_cr.fetchone()
+            if not locked_job:
+                _logger.debug("Job `%s` already executed by another process/thread. skipping it", job['name'])
+                return False
+            # Got the lock on the job row, run its code
+            _logger.debug('Starting job `%s`.', job['name'])
+            job_cr = db.cursor()
             try:
-                # Try to grab an exclusive lock on the job row from within the task transaction
-                # Restrict to the same conditions as for the search since the job may have already
-                # been run by an other thread when cron is running in multi thread
-                lock_cr.execute("""SELECT *
-                                   FROM ir_cron
-                                   WHERE numbercall != 0
-                                      AND active
-                                      AND nextcall <= (now() at time zone 'UTC')
-                                      AND id=%s
-                                   FOR UPDATE NOWAIT""",
-                               (job['id'],), log_exceptions=False)
-
-                locked_job = lock_cr.fetchone()
-                if not locked_job:
-                    _logger.debug("Job `%s` already executed by another process/thread. skipping it", job['name'])
-                    continue
-                # Got the lock on the job row, run its code
-                _logger.debug('Starting job `%s`.', job['name'])
-                job_cr = db.cursor()
-                try:
-                    registry = openerp.registry(db_name)
-                    registry[cls._name]._process_job(job_cr, job, lock_cr)
-                except Exception:
-                    _logger.exception('Unexpected exception while processing cron job %r', job)
-                finally:
-                    job_cr.close()
-
-            except psycopg2.OperationalError, e:
-                if e.pgcode == '55P03':
-                    # Class 55: Object not in prerequisite state; 55P03: lock_not_available
-                    _logger.debug('Another process/thread is already busy executing job `%s`, skipping it.', job['name'])
-                    continue
-                else:
-                    # Unexpected OperationalError
-                    raise
+                registry = openerp.registry(db_name)
+                registry[cls._name]._process_job(job_cr, job, lock_cr)
+            except Exception:
+                _logger.exception('Unexpected exception while processing cron job %r', job)
             finally:
-                # we're exiting due to an exception while acquiring the lock
-                lock_cr.close()
-
-        if hasattr(threading.current_thread(), 'dbname'): # cron job could have removed it as side-effect
-            del threading.current_thread().dbname
+                job_cr.close()
+            return True
+
+        except psycopg2.OperationalError, e:
+            if e.pgcode == '55P03':
+                # Class 55: Object not in prerequisite state; 55P03: lock_not_available
+                _logger.debug('Another process/thread is already busy executing job `%s`, skipping it.', job['name'])
+                return False
+            else:
+                # Unexpected OperationalError
+                raise
+        finally:
+            # we're exiting due to an exception while acquiring the lock
+            lock_cr.close()
+            if hasattr(threading.current_thread(), 'dbname'): # cron job could have removed it as side-effect
+                del threading.current_thread().dbname
+
+    def _notify(self, cr):
+        """ Wake up the cron schedulers of the database when the transaction is
+        committed, as the planning of the jobs may have changed.
+        """
+        cr.execute("NOTIFY %s" % CRON_CHANNEL)
 
     def _try_lock(self, cr, uid, ids, context=None):
         """Try to grab a dummy exclusive write-lock to the rows with the given ids,
@@ -283,16 +321,19 @@ class ir_cron(osv.osv):
 
     def create(self, cr, uid, vals, context=None):
         res = super(ir_cron, self).create(cr, uid, vals, context=context)
+        self._notify(cr)
         return res
 
     def write(self, cr, uid, ids, vals, context=None):
         self._try_lock(cr, uid, ids, context)
         res = super(ir_cron, self).write(cr, uid, ids, vals, context=context)
+        self._notify(cr)
         return res
 
     def unlink(self, cr, uid, ids, context=None):
         self._try_lock(cr, uid, ids, context)
         res = super(ir_cron, self).unlink(cr, uid, ids, context=context)
+        self._notify(cr)
         return res
 
     def try_write(self, cr, uid, ids, values, context=None):
@@ -303,7 +344,9 @@ class ir_cron(osv.osv):
         except psycopg2.OperationalError:
             pass
         else:
-            return super(ir_cron, self).write(cr, uid, ids, values, context=context)
+            res = super(ir_cron, self).write(cr, uid, ids, values, context=context)
+            self._notify(cr)
+            return res
         return False
 
     def toggle(self, cr, uid, ids, model, domain, context=None):
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2004-TODAY OpenERP S.A. <http://www.openerp.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+import json
+import logging
+import threading
+import time
+import traceback
+import zlib
+from datetime import datetime, timedelta
+
+import psycopg2
+
+import openerp
+from openerp import api
+from openerp.exceptions import except_orm
+from openerp.osv import fields, osv
+from openerp.tools import DEFAULT_SERVER_DATETIME_FORMAT, ustr
+
+_logger = logging.getLogger(__name__)
+
+# channel notified when jobs are enqueued, see openerp.service.job
+JOB_CHANNEL = 'ir_job'
+
+# number of pending jobs examined at once by a job worker
+JOB_BATCH_SIZE = 100
+
+# delay in seconds before the first retry of a failed job, doubled at each retry
+RETRY_DELAY = 10
+
+
+def _json_default(value):
+    """ Encode the recordsets passed as job arguments. """
+    if isinstance(value, openerp.models.BaseModel):
+        return {'__model__': value._name, '__ids__': value.ids}
+    raise TypeError("%r cannot be passed to a job" % (value,))
+
+
+def _json_decoder(env):
+    """ Return the hook decoding the recordsets of job arguments in ``env``. """
+    def object_hook(value):
+        if '__model__' in value:
+            return env[value['__model__']].browse(value['__ids__'])
+        return value
+    return object_hook
+
+
+class DelayedRecords(object):
+    """ Proxy on a recordset, returned by
+    :meth:`~openerp.models.BaseModel.with_delay`: calling a method on it
+    enqueues a job that calls the method on the records, and returns the job.
+    """
+    def __init__(self, records, options):
+        self._records = records
+        self._options = options
+
+    def __getattr__(self, name):
+        if not callable(getattr(self._records, name, None)):
+            raise AttributeError("%s has no method %r" % (self._records._name, name))
+        def delay(*args, **kwargs):
+            return self._records.env['ir.job']._enqueue(self._records, name, args, kwargs, **self._options)
+        return delay
+
+    def __repr__(self):
+        return "DelayedRecords(%r)" % (self._records,)
+
+
+class ir_job(osv.osv):
+    """ Queue of jobs, i.e., method calls on records deferred out of the
+    request that enqueued them, and processed by the job workers, see
+    :mod:`openerp.service.job`.
+    """
+    _name = 'ir.job'
+    _order = 'id desc'
+    _columns = {
+        'name': fields.char('Description', required=True, readonly=True),
+        'model': fields.char('Object', required=True, readonly=True, select=True),
+        'method': fields.char('Method', required=True, readonly=True),
+        'record_ids': fields.text('Records', readonly=True, help="Ids of the records, as JSON."),
+        'args': fields.text('Arguments', readonly=True, help="Positional and keyword arguments of the method, as JSON."),
+        'context': fields.text('Context', readonly=True, help="Context of the call, as JSON."),
+        'user_id': fields.many2one('res.users', 'User', required=True, readonly=True),
+        'state': fields.selection([('pending', 'Pending'), ('done', 'Done'),
+                                   ('failed', 'Failed'), ('cancel', 'Cancelled')],
+                                  'Status', required=True, readonly=True, select=True),
+        'priority': fields.integer('Priority', help="Jobs of lower priority are processed first."),
+        'channel': fields.char('Channel', required=True,
+                               help="The number of jobs of a channel processed at the same time "
+                                    "is limited by the 'job_channels' server option."),
+        'eta': fields.datetime('Execute After', help="The job is not processed before this date."),
+        'attempts': fields.integer('Attempts', readonly=True),
+        'max_retries': fields.integer('Maximum Retries',
+                                      help="Number of times the job is retried after a failure."),
+        'date_done': fields.datetime('Date Done', readonly=True),
+        'result': fields.text('Result', readonly=True),
+        'exc_info': fields.text('Exception', readonly=True),
+    }
+
+    _defaults = {
+        'state': 'pending',
+        'priority': 10,
+        'channel': 'root',
+        'attempts': 0,
+        'max_retries': 5,
+        'user_id': lambda obj, cr, uid, context: uid,
+    }
+
+    def _auto_init(self, cr, context=None):
+        res = super(ir_job, self)._auto_init(cr, context)
+        cr.execute("SELECT indexname FROM pg_indexes WHERE indexname = 'ir_job_pending_index'")
+        if not cr.fetchone():
+            cr.execute("CREATE INDEX ir_job_pending_index ON ir_job (priority, id) WHERE state = 'pending'")
+        return res
+
+    def _notify(self, cr):
+        """ Wake up the job workers of the database when the transaction is
+        committed.
+        """
+        cr.execute("NOTIFY %s" % JOB_CHANNEL)
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(ir_job, self).create(cr, uid, vals, context=context)
+        self._notify(cr)
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        res = super(ir_job, self).write(cr, uid, ids, vals, context=context)
+        if vals.get('state') == 'pending':
+            self._notify(cr)
+        return res
+
+    def button_requeue(self, cr, uid, ids, context=None):
+        return self.write(cr, uid, ids, {'state': 'pending', 'attempts': 0, 'eta': False}, context=context)
+
+    def button_cancel(self, cr, uid, ids, context=None):
+        return self.write(cr, uid, ids, {'state': 'cancel'}, context=context)
+
+    @api.model
+    def _delayed(self, records, options):
+        return DelayedRecords(records, options)
+
+    @api.model
+    def _enqueue(self, records, method, args, kwargs, priority=None, eta=None,
+                 channel=None, max_retries=None, description=None):
+        """ Create a job calling ``method`` on ``records`` with the given
+        arguments, with the user and context of ``records``.
+        """
+        if isinstance(eta, (int, long, float)):
+            eta = datetime.utcnow() + timedelta(seconds=eta)
+        if isinstance(eta, datetime):
+            eta = eta.strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+        vals = {
+            'name': description or "%s.%s" % (records._name, method),
+            'model': records._name,
+            'method': method,
+            'record_ids': json.dumps(records.ids),
+            'args': json.dumps([args, kwargs], default=_json_default),
+            'context': json.dumps(records.env.context, default=_json_default),
+            'user_id': records.env.uid,
+            'eta': eta or False,
+        }
+        if priority is not None:
+            vals['priority'] = priority
+        if channel:
+            vals['channel'] = channel
+        if max_retries is not None:
+            vals['max_retries'] = max_retries
+        return self.sudo().create(vals)
+
+    def _perform(self, cr, job):
+        """ Call the method of ``job`` (a row of the table, as a dictionary),
+        and return its result.
+        """
+        env = api.Environment(cr, job['user_id'], {})
+        context = json.loads(job['context'] or '{}', object_hook=_json_decoder(env))
+        env = env(context=context)
+        args, kwargs = json.loads(job['args'] or '[[], {}]', object_hook=_json_decoder(env))
+        records = env[job['model']].browse(json.loads(job['record_ids'] or '[]'))
+        return getattr(records, job['method'])(*args, **kwargs)
+
+    def _process_job(self, job_cr, job, lock_cr):
+        """ Run ``job`` and save its outcome.
+
+        :param job_cr: cursor to use to execute the job, safe to commit/rollback
+        :param job: job to be run (as a dictionary)
+        :param lock_cr: cursor holding the lock on the job row, to use to
+            update the job, committed at the end
+        """
+        start = time.time()
+        try:
+            with api.Environment.manage():
+                result = self._perform(job_cr, job)
+            job_cr.commit()
+            openerp.modules.registry.RegistryManager.signal_caches_change(job_cr.dbname)
+        except Exception, e:
+            job_cr.rollback()
+            attempts = job['attempts'] + 1
+            # errors of the application do not vanish by retrying the job
+            if isinstance(e, except_orm) or attempts > job['max_retries']:
+                _logger.exception("Job %s (%s) failed", job['id'], job['name'])
+                state, eta = 'failed', job['eta']
+            else:
+                delay = RETRY_DELAY * 2 ** (attempts - 1)
+                _logger.warning("Job %s (%s) failed, retried in %ss", job['id'], job['name'], delay, exc_info=True)
+                state = 'pending'
+                eta = (datetime.utcnow() + timedelta(seconds=delay)).strftime(DEFAULT_SERVER_DATETIME_FORMAT)
+            lock_cr.execute("UPDATE ir_job SET state=%s, attempts=%s, eta=%s, exc_info=%s WHERE id=%s",
+                            (state, attempts, eta, traceback.format_exc(), job['id']))
+        else:
+            _logger.debug("Job %s (%s) done in %.3fs", job['id'], job['name'], time.time() - start)
+            lock_cr.execute("""UPDATE ir_job
+                               SET state='done', attempts=attempts+1, exc_info=NULL, result=%s,
+                                   date_done=(now() at time zone 'UTC')
+                               WHERE id=%s""",
+                            (None if result is None else ustr(result), job['id']))
+        lock_cr.commit()
+
+    @classmethod
+    def _lock_slot(cls, cr, channel, capacity):
+        """ Take a free slot of ``channel`` with a session-level advisory
+        lock, and return the key of the lock, or ``None`` if ``capacity``
+        jobs of the channel are being processed. The lock is released when
+        the connection is closed, should the process die.
+        """
+        key = zlib.crc32(channel.encode('utf-8'))
+        for slot in xrange(capacity):
+            cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (key, slot))
+            if cr.fetchone()[0]:
+                return (key, slot)
+        return None
+
+    @classmethod
+    def _lock_job(cls, cr, job_id):
+        """ Lock the row of a pending job, and return it as a dictionary, or
+        ``None`` if the job is processed by another worker.
+        """
+        query = """SELECT * FROM ir_job
+                   WHERE id=%%s AND state='pending'
+                     AND (eta IS NULL OR eta <= (now() at time zone 'UTC'))
+                   FOR UPDATE %s"""
+        if cr._cnx.server_version >= 90500:
+            cr.execute(query % 'SKIP LOCKED', (job_id,))
+            return cr.dictfetchone()
+        try:
+            with cr.savepoint():
+                cr.execute(query % 'NOWAIT', (job_id,), log_exceptions=False)
+                return cr.dictfetchone()
+        except psycopg2.OperationalError, e:
+            if e.pgcode != '55P03':
+                # Class 55: Object not in prerequisite state; 55P03: lock_not_available
+                raise
+            return None
+
+    @classmethod
+    def _run_next(cls, db_name, channels):
+        """ Process the next pending job of the database ``db_name`` whose
+        channel has a free slot. ``channels`` maps channel names to the
+        number of their jobs that may be processed at the same time; the
+        jobs of the other channels count as jobs of channel ``'root'``.
+
+        Returns whether a job was processed.
+        """
+        db = openerp.sql_db.db_connect(db_name)
+        threading.current_thread().dbname = db_name
+        lock_cr = db.cursor()
+        slots = []
+        try:
+            try:
+                lock_cr.execute("""SELECT id, channel FROM ir_job
+                                   WHERE state='pending'
+                                     AND (eta IS NULL OR eta <= (now() at time zone 'UTC'))
+                                   ORDER BY priority, id
+                                   LIMIT %s""", (JOB_BATCH_SIZE,), log_exceptions=False)
+            except psycopg2.ProgrammingError, e:
+                if e.pgcode == '42P01':
+                    # Class 42 — Syntax Error or Access Rule Violation; 42P01: undefined_table
+                    # The table ir_job does not exist; the database has not been updated.
+                    _logger.debug('Tried to poll an undefined table on database %s.', db_name)
+                    return False
+                raise
+            full = set()
+            for job_id, channel in lock_cr.fetchall():
+                if channel not in channels:
+                    channel = 'root'
+                if channel in full:
+                    continue
+                slot = cls._lock_slot(lock_cr, channel, channels.get(channel, 1))
+                if slot is None:
+                    full.add(channel)
+                    continue
+                slots.append(slot)
+                job = cls._lock_job(lock_cr, job_id)
+                if not job:
+                    continue
+                _logger.debug('Starting job %s (%s).', job['id'], job['name'])
+                job_cr = db.cursor()
+                try:
+                    openerp.modules.registry.RegistryManager.check_registry_signaling(db_name)
+                    registry = openerp.registry(db_name)
+                    registry[cls._name]._process_job(job_cr, job, lock_cr)
+                except Exception:
+                    _logger.exception('Unexpected exception while processing job %s', job['id'])
+                finally:
+                    job_cr.close()
+                return True
+            return False
+        finally:
+            try:
+                lock_cr.rollback()
+                for key, slot in slots:
+                    lock_cr.execute("SELECT pg_advisory_unlock(%s, %s)", (key, slot))
+            except psycopg2.Error:
+                _logger.warning("Cannot release the job slots of database %s", db_name, exc_info=True)
+            lock_cr.close()
+            if hasattr(threading.current_thread(), 'dbname'):
+                del threading.current_thread().dbname
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -69,12 +69,57 @@ def _build_attribute(name, value):
     if isinstance(value, unicode): value = value.encode('utf-8')
     return ' %s="%s"' % (name, value)
 
+def _encode(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+def _sets_variables(element):
+    """ Returns whether rendering the children of ``element`` may set variables
+    in its rendering context, i.e. they contain a ``t-set`` outside of a
+    ``t-call``.
+    """
+    for child in element.iterchildren(tag=etree.Element):
+        if child.get('t-set') is not None:
+            return True
+        if child.get('t-call') is None and _sets_variables(child):
+            return True
+    return False
+
+class _StreamedBody(object):
+    """ Body of a ``t-call`` rendered by :meth:`QWeb.render_iter`: the body is
+    rendered each time it is iterated, or once if it is converted to a string.
+    """
+    def __init__(self, qweb, element, generated_attributes, qwebcontext):
+        self.qweb = qweb
+        self.element = element
+        self.generated_attributes = generated_attributes
+        self.qwebcontext = qwebcontext
+        self.value = None
+
+    def __iter__(self):
+        if self.value is not None:
+            return iter([self.value])
+        return self.qweb.render_iter_element(self.element, self.generated_attributes, self.qwebcontext)
+
+    def __str__(self):
+        if self.value is None:
+            self.value = "".join(self)
+        return self.value
+
+    @staticmethod
+    def materialize(qwebcontext):
+        """ Replaces the streamed body in ``qwebcontext`` by its string, for
+        rendering nodes with :meth:`QWeb.render_node`.
+        """
+        if isinstance(qwebcontext.get(0), _StreamedBody):
+            qwebcontext[0] = str(qwebcontext[0])
+
 class QWebContext(dict):
-    def __init__(self, cr, uid, data, loader=None, templates=None, context=None):
+    def __init__(self, cr, uid, data, loader=None, templates=None, context=None, compiled=None):
         self.cr = cr
         self.uid = uid
         self.loader = loader
         self.templates = templates or {}
+        self.compiled = {} if compiled is None else compiled
         self.context = context
         dic = dict(data)
         super(QWebContext, self).__init__(dic)
@@ -94,7 +139,8 @@ class QWebContext(dict):
         return QWebContext(self.cr, self.uid, dict.copy(self),
                            loader=self.loader,
                            templates=self.templates,
-                           context=self.context)
+                           context=self.context,
+                           compiled=self.compiled)
 
     def __copy__(self):
         return self.copy()
@@ -126,11 +172,17 @@ class QWeb(orm.AbstractModel):
             '\{\{(.+?)\}\}'
         ')')
 
+    # render templates with the functions built by compile_node()
+    _compile = True
+    # number of compiled templates kept across renderings
+    _compiled_cache_size = 512
+
     def __init__(self, pool, cr):
         super(QWeb, self).__init__(pool, cr)
 
         self._render_tag = self.prefixed_methods('render_tag_')
         self._render_att = self.prefixed_methods('render_att_')
+        self._compiled = openerp.tools.lru.LRU(self._compiled_cache_size)
 
     def prefixed_methods(self, prefix):
         """ Extracts all methods prefixed by ``prefix``, and returns a mapping
@@ -245,6 +297,15 @@ class QWeb(orm.AbstractModel):
         :param loader: if ``qwebcontext`` is a dict, loader set into the
                        context instantiated for rendering
         """
+        qwebcontext = self._prepare_context(cr, uid, id_or_xml_id, qwebcontext, loader, context)
+        if self._compile and self._compilable():
+            return self.get_compiled_template(id_or_xml_id, qwebcontext)(qwebcontext)
+        return self.render_node(self.get_template(id_or_xml_id, qwebcontext), qwebcontext)
+
+    def _prepare_context(self, cr, uid, id_or_xml_id, qwebcontext, loader, context):
+        """ Returns the :class:`QWebContext` for rendering the template
+        ``id_or_xml_id`` with the values ``qwebcontext``.
+        """
         if qwebcontext is None:
             qwebcontext = {}
 
@@ -258,7 +319,198 @@ class QWeb(orm.AbstractModel):
         stack.append(id_or_xml_id)
         qwebcontext['__stack__'] = stack
         qwebcontext['xmlid'] = str(stack[0]) # Temporary fix
-        return self.render_node(self.get_template(id_or_xml_id, qwebcontext), qwebcontext)
+        return qwebcontext
+
+    def render_iter(self, cr, uid, id_or_xml_id, qwebcontext=None, loader=None, context=None):
+        """ render_iter(cr, uid, id_or_xml_id, qwebcontext=None, loader=None, context=None)
+
+        Renders the template like :meth:`render`, as an iterator of chunks
+        whose concatenation is the rendered template. Elements, ``t-if``,
+        ``t-foreach``, ``t-call`` and ``t-raw="0"`` are rendered
+        incrementally; the other nodes are rendered as a single chunk each.
+        """
+        qwebcontext = self._prepare_context(cr, uid, id_or_xml_id, qwebcontext, loader, context)
+        template = self.get_template(id_or_xml_id, qwebcontext)
+        if self._compilable():
+            for chunk in self.render_iter_node(template, qwebcontext):
+                yield chunk
+        else:
+            yield self.render_node(template, qwebcontext)
+
+    def _streamed_tag(self, t_render, template_attributes):
+        """ Return whether the tag ``t_render`` of a node can be rendered
+        incrementally by :meth:`render_iter_node`.
+        """
+        if t_render is None:
+            return True
+        if t_render not in ('if', 'foreach', 'call', 'raw'):
+            return False
+        if t_render == 'foreach' and 'as' not in template_attributes:
+            return False
+        if t_render == 'raw' and template_attributes['raw'] != '0':
+            return False
+        method = self._render_tag[t_render]
+        return getattr(method, 'im_func', None) is getattr(QWeb, 'render_tag_' + t_render).im_func
+
+    def render_iter_node(self, element, qwebcontext):
+        """ Renders ``element`` like :meth:`render_node`, as an iterator of chunks. """
+        t_render = None
+        template_attributes = {}
+        for (attribute_name, attribute_value) in element.attrib.iteritems():
+            attribute_name = str(attribute_name)
+            if attribute_name.startswith("t-") and not any(
+                    attribute_name[2:].startswith(attribute) for attribute in self._render_att):
+                if attribute_name[2:] in self._render_tag:
+                    t_render = attribute_name[2:]
+                template_attributes[attribute_name[2:]] = attribute_value.encode("utf8")
+
+        if 'debug' in template_attributes or 'trim' in template_attributes \
+                or str(element.tag) in self._void_elements \
+                or not self._streamed_tag(t_render, template_attributes):
+            _StreamedBody.materialize(qwebcontext)
+            yield self.render_node(element, qwebcontext)
+            return
+
+        generated_attributes = ""
+        for (attribute_name, attribute_value) in element.attrib.iteritems():
+            attribute_name = str(attribute_name)
+            if attribute_name == "groups":
+                cr = qwebcontext.get('request') and qwebcontext['request'].cr or None
+                uid = qwebcontext.get('request') and qwebcontext['request'].uid or None
+                can_see = self.user_has_groups(cr, uid, groups=attribute_value) if cr and uid else False
+                if not can_see:
+                    return
+
+            attribute_value = attribute_value.encode("utf8")
+
+            if attribute_name.startswith("t-"):
+                for attribute in self._render_att:
+                    if attribute_name[2:].startswith(attribute):
+                        attrs = self._render_att[attribute](
+                            self, element, attribute_name, attribute_value, qwebcontext)
+                        for att, val in attrs:
+                            if not val: continue
+                            generated_attributes += self.render_attribute(element, att, val, qwebcontext)
+                        break
+            else:
+                generated_attributes += self.render_attribute(element, attribute_name, attribute_value, qwebcontext)
+
+        if t_render is None:
+            chunks = self.render_iter_element(element, generated_attributes, qwebcontext)
+        elif t_render == 'if':
+            if self.eval_bool(template_attributes["if"], qwebcontext):
+                chunks = self.render_iter_element(element, generated_attributes, qwebcontext)
+            else:
+                chunks = ()
+        elif t_render == 'foreach':
+            chunks = self.render_iter_foreach(element, template_attributes, generated_attributes, qwebcontext)
+        elif t_render == 'call':
+            chunks = self.render_iter_call(element, template_attributes, generated_attributes, qwebcontext)
+        else:
+            chunks = self.render_iter_element(element, generated_attributes, qwebcontext,
+                                              inner=qwebcontext.get(0, ''))
+        for chunk in chunks:
+            yield _encode(chunk)
+
+        if element.tail:
+            yield element.tail.encode('utf-8')
+
+    def render_iter_element(self, element, generated_attributes, qwebcontext, inner=None):
+        """ Renders ``element`` like :meth:`render_element`, as an iterator of
+        chunks. ``inner`` may be a string, or a :class:`_StreamedBody`.
+        """
+        name = str(element.tag)
+        if name != "t":
+            yield "<%s%s>" % (name, _encode(generated_attributes))
+
+        empty = True
+        if isinstance(inner, _StreamedBody):
+            for chunk in inner:
+                empty = empty and not chunk
+                yield chunk
+        elif inner:
+            empty = False
+            yield _encode(inner)
+
+        if empty:
+            if element.text is not None:
+                yield element.text.encode('utf-8')
+            for current_node in element.iterchildren(tag=etree.Element):
+                try:
+                    for chunk in self.render_iter_node(current_node, qwebcontext):
+                        yield chunk
+                except QWebException:
+                    raise
+                except Exception:
+                    template = qwebcontext.get('__template__')
+                    raise_qweb_exception(message="Could not render element %r" % element.tag, node=element, template=template)
+
+        if name != "t":
+            yield "</%s>" % name
+
+    def render_iter_foreach(self, element, template_attributes, generated_attributes, qwebcontext):
+        """ Renders the ``t-foreach`` of ``element`` like
+        :meth:`render_tag_foreach`, as an iterator of chunks.
+        """
+        expr = template_attributes["foreach"]
+        enum = self.eval_object(expr, qwebcontext)
+        if enum is None:
+            template = qwebcontext.get('__template__')
+            raise QWebException("foreach enumerator %r is not defined while rendering template %r" % (expr, template), template=template)
+        if isinstance(enum, int):
+            enum = range(enum)
+
+        varname = template_attributes['as'].replace('.', '_')
+        copy_qwebcontext = qwebcontext.copy()
+
+        size = None
+        if isinstance(enum, collections.Sized):
+            size = len(enum)
+            copy_qwebcontext["%s_size" % varname] = size
+
+        copy_qwebcontext["%s_all" % varname] = enum
+        for index, (item, value) in enumerate(self._iterate(enum)):
+            copy_qwebcontext.update({
+                varname: item,
+                '%s_value' % varname: value,
+                '%s_index' % varname: index,
+                '%s_first' % varname: index == 0,
+            })
+            if size is not None:
+                copy_qwebcontext['%s_last' % varname] = index + 1 == size
+            odd = bool(index % 2)
+            copy_qwebcontext.update({
+                '%s_parity' % varname: 'odd' if odd else 'even',
+                '%s_even' % varname: not odd,
+                '%s_odd' % varname: odd,
+            })
+            for chunk in self.render_iter_element(element, generated_attributes, copy_qwebcontext):
+                yield chunk
+
+        for k in qwebcontext.keys():
+            qwebcontext[k] = copy_qwebcontext[k]
+
+    def render_iter_call(self, element, template_attributes, generated_attributes, qwebcontext):
+        """ Renders the ``t-call`` of ``element`` like :meth:`render_tag_call`,
+        as an iterator of chunks. The body of the element is rendered where
+        the called template uses it, unless it may set variables for the
+        called template.
+        """
+        d = qwebcontext.copy()
+        if _sets_variables(element):
+            _StreamedBody.materialize(d)
+            d[0] = self.render_element(element, template_attributes, generated_attributes, d)
+        else:
+            d[0] = _StreamedBody(self, element, generated_attributes, qwebcontext.copy())
+        cr = d.get('request') and d['request'].cr or None
+        uid = d.get('request') and d['request'].uid or None
+
+        template = self.eval_format(template_attributes["call"], d)
+        try:
+            template = int(template)
+        except ValueError:
+            pass
+        return self.render_iter(cr, uid, template, d)
 
     def render_node(self, element, qwebcontext):
         generated_attributes = ""
@@ -348,6 +600,295 @@ class QWeb(orm.AbstractModel):
     def render_attribute(self, element, name, value, qwebcontext):
         return _build_attribute(name, value)
 
+    #------------------------------------------------------
+    # Compilation of templates
+    #------------------------------------------------------
+    # The compiled form of a node is a function ``render(qwebcontext)`` that
+    # returns the same result as ``render_node(node, qwebcontext)``: the
+    # attributes of the nodes are analyzed once, and the elements and the
+    # standard tags are rendered by closures. The tags whose render method has
+    # been overridden or registered are rendered by calling their method.
+
+    def _compilable(self):
+        """ Return whether nodes and elements are rendered by the methods of
+        this class, which the compiled templates reproduce.
+        """
+        cls = type(self)
+        return cls.render_node.im_func is QWeb.render_node.im_func and \
+            cls.render_element.im_func is QWeb.render_element.im_func
+
+    def get_compiled_template(self, name, qwebcontext):
+        """ Returns the template ``name`` compiled by :meth:`compile_node`.
+        The templates loaded with the context's loader are kept in cache, as
+        long as the loader returns the same document for them.
+
+        :raises QWebTemplateNotFound: if the template can not be found or loaded
+        """
+        node = qwebcontext.templates.get(name)
+        compiled = qwebcontext.compiled.get(name)
+        if compiled is not None and compiled[0] is node:
+            return compiled[1]
+
+        key = None
+        if qwebcontext.loader and node is None and \
+                type(self).add_template.im_func is QWeb.add_template.im_func:
+            origin_template = qwebcontext.get('__caller__') or qwebcontext['__stack__'][0]
+            try:
+                xml_doc = qwebcontext.loader(name)
+            except ValueError:
+                raise_qweb_exception(QWebTemplateNotFound, message="Loader could not find template %r" % name, template=origin_template)
+            if isinstance(xml_doc, basestring):
+                key = (name, xml_doc)
+                try:
+                    function = self._compiled[key]
+                    qwebcontext.compiled[name] = (node, function)
+                    return function
+                except KeyError:
+                    pass
+            self.load_document(xml_doc, isinstance(name, (int, long)) and name or None, qwebcontext=qwebcontext)
+
+        function = self.compile_node(self.get_template(name, qwebcontext))
+        if key is not None:
+            self._compiled[key] = function
+        qwebcontext.compiled[name] = (qwebcontext.templates.get(name), function)
+        return function
+
+    def compile_node(self, element):
+        """ Compiles ``element`` to a function ``render(qwebcontext)``
+        returning the same result as ``render_node(element, qwebcontext)``.
+        """
+        static_attributes = type(self).render_attribute.im_func is QWeb.render_attribute.im_func
+        groups = None
+        attributes = []             # rendered attributes or (method, name, value)
+        template_attributes = {}
+        t_render = None
+        for (attribute_name, attribute_value) in element.attrib.iteritems():
+            attribute_name = str(attribute_name)
+            if attribute_name == "groups":
+                groups = attribute_value
+
+            attribute_value = attribute_value.encode("utf8")
+
+            if attribute_name.startswith("t-"):
+                for attribute in self._render_att:
+                    if attribute_name[2:].startswith(attribute):
+                        attributes.append((self._render_att[attribute], attribute_name, attribute_value))
+                        break
+                else:
+                    if attribute_name[2:] in self._render_tag:
+                        t_render = attribute_name[2:]
+                    template_attributes[attribute_name[2:]] = attribute_value
+            elif static_attributes:
+                attributes.append(_build_attribute(attribute_name, attribute_value))
+            else:
+                attributes.append((None, attribute_name, attribute_value))
+
+        if all(isinstance(attribute, str) for attribute in attributes):
+            static = "".join(attributes)
+            generate_attributes = lambda qwebcontext: static
+        else:
+            def generate_attributes(qwebcontext):
+                generated_attributes = ""
+                for attribute in attributes:
+                    if isinstance(attribute, str):
+                        generated_attributes += attribute
+                        continue
+                    method, attribute_name, attribute_value = attribute
+                    if method is None:
+                        generated_attributes += self.render_attribute(element, attribute_name, attribute_value, qwebcontext)
+                        continue
+                    for att, val in method(self, element, attribute_name, attribute_value, qwebcontext):
+                        if not val: continue
+                        generated_attributes += self.render_attribute(element, att, val, qwebcontext)
+                return generated_attributes
+
+        render_element = self.compile_element(element, template_attributes)
+        render = None
+        if t_render:
+            method = self._render_tag[t_render]
+            method_name = t_render.replace('-', '_')
+            original = getattr(QWeb, 'render_tag_' + method_name, None)
+            compile_tag = getattr(self, 'compile_tag_' + method_name, None)
+            if compile_tag and original and getattr(method, 'im_func', None) is original.im_func:
+                render = compile_tag(element, template_attributes, render_element)
+            if render is None:
+                def render(qwebcontext, generated_attributes):
+                    return method(self, element, dict(template_attributes), generated_attributes, qwebcontext)
+        else:
+            render = render_element
+
+        debugger = template_attributes.get('debug', 'pdb') if 'debug' in template_attributes else None
+        tail = element.tail.encode('utf-8') if element.tail else None
+
+        def render_node(qwebcontext):
+            if groups is not None:
+                cr = qwebcontext.get('request') and qwebcontext['request'].cr or None
+                uid = qwebcontext.get('request') and qwebcontext['request'].uid or None
+                can_see = self.user_has_groups(cr, uid, groups=groups) if cr and uid else False
+                if not can_see:
+                    return ''
+            generated_attributes = generate_attributes(qwebcontext)
+            if debugger:
+                __import__(debugger).set_trace()  # pdb, ipdb, pudb, ...
+            result = render(qwebcontext, generated_attributes)
+            if tail:
+                result += tail
+            return _encode(result)
+
+        return render_node
+
+    def compile_element(self, element, template_attributes):
+        """ Compiles ``element`` to a function
+        ``render(qwebcontext, generated_attributes, inner=None)`` returning the
+        same result as :meth:`render_element`.
+        """
+        text = None if element.text is None else element.text.encode('utf-8')
+        children = [self.compile_node(child) for child in element.iterchildren(tag=etree.Element)]
+        name = str(element.tag)
+        trim = template_attributes.get("trim", 0)
+        void = name in self._void_elements
+
+        def render_element(qwebcontext, generated_attributes, inner=None):
+            if inner:
+                g_inner = _encode(inner)
+            else:
+                g_inner = [] if text is None else [text]
+                for child in children:
+                    try:
+                        g_inner.append(child(qwebcontext))
+                    except QWebException:
+                        raise
+                    except Exception:
+                        template = qwebcontext.get('__template__')
+                        raise_qweb_exception(message="Could not render element %r" % element.tag, node=element, template=template)
+            inner = "".join(g_inner)
+            if trim == 0:
+                pass
+            elif trim == 'left':
+                inner = inner.lstrip()
+            elif trim == 'right':
+                inner = inner.rstrip()
+            elif trim == 'both':
+                inner = inner.strip()
+            if name == "t":
+                return inner
+            elif len(inner) or not void:
+                return "<%s%s>%s</%s>" % (name, _encode(generated_attributes), _encode(inner), name)
+            else:
+                return "<%s%s/>" % (name, generated_attributes)
+
+        return render_element
+
+    # Tags: each method returns a function ``render(qwebcontext,
+    # generated_attributes)`` equivalent to the corresponding render_tag_*
+    # method, or None if the tag cannot be compiled.
+    def compile_tag_raw(self, element, template_attributes, render_element):
+        expr = template_attributes["raw"]
+        def render(qwebcontext, generated_attributes):
+            inner = self.eval_str(expr, qwebcontext)
+            return render_element(qwebcontext, generated_attributes, inner)
+        return render
+
+    def compile_tag_esc(self, element, template_attributes, render_element):
+        expr = template_attributes['esc']
+        try:
+            options = json.loads(template_attributes.get('esc-options') or '{}')
+        except ValueError:
+            return None
+        def render(qwebcontext, generated_attributes):
+            widget = self.get_widget_for(options.get('widget'))
+            inner = widget.format(expr, dict(options), qwebcontext)
+            return render_element(qwebcontext, generated_attributes, inner)
+        return render
+
+    def compile_tag_foreach(self, element, template_attributes, render_element):
+        if 'as' not in template_attributes:
+            return None
+        expr = template_attributes["foreach"]
+        varname = template_attributes['as'].replace('.', '_')
+        size_key, all_key, value_key, index_key, first_key, last_key, parity_key, even_key, odd_key = [
+            varname + suffix
+            for suffix in ('_size', '_all', '_value', '_index', '_first', '_last', '_parity', '_even', '_odd')
+        ]
+
+        def render(qwebcontext, generated_attributes):
+            enum = self.eval_object(expr, qwebcontext)
+            if enum is None:
+                template = qwebcontext.get('__template__')
+                raise QWebException("foreach enumerator %r is not defined while rendering template %r" % (expr, template), template=template)
+            if isinstance(enum, int):
+                enum = range(enum)
+
+            copy_qwebcontext = qwebcontext.copy()
+
+            size = None
+            if isinstance(enum, collections.Sized):
+                size = len(enum)
+                copy_qwebcontext[size_key] = size
+
+            copy_qwebcontext[all_key] = enum
+            ru = []
+            for index, (item, value) in enumerate(self._iterate(enum)):
+                copy_qwebcontext[varname] = item
+                copy_qwebcontext[value_key] = value
+                copy_qwebcontext[index_key] = index
+                copy_qwebcontext[first_key] = index == 0
+                if size is not None:
+                    copy_qwebcontext[last_key] = index + 1 == size
+                odd = bool(index % 2)
+                copy_qwebcontext[parity_key] = 'odd' if odd else 'even'
+                copy_qwebcontext[even_key] = not odd
+                copy_qwebcontext[odd_key] = odd
+                ru.append(render_element(copy_qwebcontext, generated_attributes))
+
+            for k in qwebcontext.keys():
+                qwebcontext[k] = copy_qwebcontext[k]
+
+            return "".join(ru)
+        return render
+
+    def compile_tag_if(self, element, template_attributes, render_element):
+        expr = template_attributes["if"]
+        def render(qwebcontext, generated_attributes):
+            if self.eval_bool(expr, qwebcontext):
+                return render_element(qwebcontext, generated_attributes)
+            return ""
+        return render
+
+    def compile_tag_call(self, element, template_attributes, render_element):
+        expr = template_attributes["call"]
+        def render(qwebcontext, generated_attributes):
+            d = qwebcontext.copy()
+            d[0] = render_element(d, generated_attributes)
+            cr = d.get('request') and d['request'].cr or None
+            uid = d.get('request') and d['request'].uid or None
+
+            template = self.eval_format(expr, d)
+            try:
+                template = int(template)
+            except ValueError:
+                pass
+            return self.render(cr, uid, template, d)
+        return render
+
+    def compile_tag_set(self, element, template_attributes, render_element):
+        name = template_attributes["set"]
+        if "value" in template_attributes:
+            expr = template_attributes["value"]
+            def render(qwebcontext, generated_attributes):
+                qwebcontext[name] = self.eval_object(expr, qwebcontext)
+                return ""
+        elif "valuef" in template_attributes:
+            expr = template_attributes["valuef"]
+            def render(qwebcontext, generated_attributes):
+                qwebcontext[name] = self.eval_format(expr, qwebcontext)
+                return ""
+        else:
+            def render(qwebcontext, generated_attributes):
+                qwebcontext[name] = render_element(qwebcontext, generated_attributes)
+                return ""
+        return render
+
     # Attributes
     def render_att_att(self, element, attribute_name, attribute_value, qwebcontext):
         if attribute_name.startswith("t-attf-"):
@@ -19,13 +19,200 @@
 #
 ##############################################################################
 import time
+import types
+from collections import OrderedDict
 
 from openerp import SUPERUSER_ID
 from openerp import tools
+from openerp.models import BaseModel
 from openerp.osv import fields, osv, expression
+from openerp.tools.lru import LRU
 from openerp.tools.safe_eval import safe_eval as eval
 from openerp.tools.misc import unquote as unquote
 
+# maximal number of compiled rules kept for a model, mode and set of groups
+COMPILED_RULES_SIZE = 1024
+
+
+def _freeze(value):
+    """ Return a hashable representation of ``value``, or raise TypeError. """
+    if isinstance(value, BaseModel):
+        return (value._name, tuple(value._ids))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+class _ValueLog(OrderedDict):
+    """ The values read from the evaluation context of rules, as a mapping
+    from paths to frozen values. ``cacheable`` is false if the rules read
+    something that cannot be logged.
+    """
+    cacheable = True
+
+    def add(self, path, value):
+        try:
+            self[path] = _freeze(value)
+        except TypeError:
+            self.cacheable = False
+
+
+class _LoggingProxy(object):
+    """ Proxy of a record of the evaluation context of rules, which logs the
+    values read from it.
+    """
+    __slots__ = ['_value', '_path', '_log']
+
+    def __init__(self, value, path, log):
+        self._value = value
+        self._path = path
+        self._log = log
+
+    def _wrap(self, value, path):
+        if isinstance(value, BaseModel):
+            self._log.add(path, value)
+            return _LoggingProxy(value, path, self._log)
+        if callable(value):
+            # the result of a method call cannot be checked in the cache
+            self._log.cacheable = False
+            return value
+        self._log.add(path, value)
+        return value
+
+    def __getattr__(self, name):
+        return self._wrap(getattr(self._value, name), self._path + (name,))
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self.__getattr__(key)
+        return self._wrap(self._value[key], self._path + (key,))
+
+    def __iter__(self):
+        for index, value in enumerate(self._value):
+            yield self._wrap(value, self._path + (index,))
+
+    def __len__(self):
+        return len(self._value)
+
+    def __contains__(self, item):
+        if isinstance(item, _LoggingProxy):
+            item = item._value
+        return item in self._value
+
+    def __eq__(self, other):
+        if isinstance(other, _LoggingProxy):
+            other = other._value
+        return self._value == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __nonzero__(self):
+        return bool(self._value)
+
+
+class _UncacheableProxy(object):
+    """ Proxy of a module or function of the evaluation context of rules,
+    whose results cannot be logged: using it makes the rules uncacheable.
+    """
+    __slots__ = ['_value', '_log']
+
+    def __init__(self, value, log):
+        self._value = value
+        self._log = log
+
+    def __getattr__(self, name):
+        self._log.cacheable = False
+        return getattr(self._value, name)
+
+    def __call__(self, *args, **kwargs):
+        self._log.cacheable = False
+        return self._value(*args, **kwargs)
+
+
+def _logging_context(eval_context, log):
+    """ Return a copy of ``eval_context`` that logs the values read from its
+    records into ``log``.
+    """
+    result = {}
+    for key, value in eval_context.iteritems():
+        if isinstance(value, BaseModel):
+            result[key] = _LoggingProxy(value, (key,), log)
+        elif isinstance(value, types.ModuleType) or callable(value):
+            result[key] = _UncacheableProxy(value, log)
+        else:
+            log.add((key,), value)
+            result[key] = value
+    return result
+
+
+def _is_static_domain(model, domain):
+    """ Return whether the WHERE clause of ``domain`` on ``model`` only depends
+    on the domain, and not on the database content, like the bounds of the
+    records of ``child_of`` or the ids matching a dotted path.
+    """
+    for leaf in domain:
+        if not expression.is_leaf(leaf) or tuple(leaf) in (expression.TRUE_LEAF, expression.FALSE_LEAF):
+            continue
+        left, operator, right = leaf
+        if operator in ('child_of', 'parent_of') or '.' in left:
+            return False
+        if left == 'id':
+            continue
+        column = model._columns.get(left)
+        if column is None or not column._classic_write or column._type in ('one2many', 'many2many'):
+            return False
+        values = right if isinstance(right, (list, tuple)) else [right]
+        if column._type == 'many2one' and any(isinstance(value, basestring) for value in values):
+            # the ids are given by name_search()
+            return False
+    return True
+
+
+def _resolve(eval_context, path):
+    """ Return the frozen value of ``path`` in ``eval_context``. """
+    value = eval_context[path[0]]
+    for name in path[1:]:
+        value = value[name] if isinstance(name, (int, long)) else getattr(value, name)
+    return _freeze(value)
+
+
+class _RuleSet(object):
+    """ The rules of a model that apply for a mode and a set of groups, and
+    the cache of their compiled WHERE clauses. The compiled rules are
+    organized as ``{paths: {values: rule}}``, where ``paths`` are the paths of
+    the evaluation context read by the rules, ``values`` the corresponding
+    values, and ``rule`` is either a tuple ``(where_clause, params, tables)``
+    or a domain, when the WHERE clause depends on the database content (like
+    with ``child_of``).
+    """
+    __slots__ = ['model_name', 'rules', 'compiled']
+
+    def __init__(self, model_name, rules):
+        self.model_name = model_name
+        self.rules = rules              # list of (domain_force, group_ids)
+        self.compiled = {}
+
+    def lookup(self, eval_context):
+        for paths, compiled in self.compiled.items():
+            try:
+                return compiled[tuple(_resolve(eval_context, path) for path in paths)]
+            except Exception:
+                # a missing value or a failing path are cache misses
+                pass
+        return None
+
+    def add(self, log, rule):
+        compiled = self.compiled.get(tuple(log))
+        if compiled is None:
+            compiled = self.compiled.setdefault(tuple(log), LRU(COMPILED_RULES_SIZE))
+        compiled[tuple(log.values())] = rule
+
+    def __len__(self):
+        return sum(len(compiled) for compiled in self.compiled.values())
+
+
 class ir_rule(osv.osv):
     _name = 'ir.rule'
     _order = 'name'
@@ -103,13 +290,12 @@ class ir_rule(osv.osv):
         (_check_model_name, 'Rules can not be applied on the Record Rules model.', ['model_id']),
     ]
 
-    @tools.ormcache()
-    def _compute_domain(self, cr, uid, model_name, mode="read"):
-        if mode not in self._MODES:
-            raise ValueError('Invalid mode: %r' % (mode,))
-
-        if uid == SUPERUSER_ID:
-            return None
+    @tools.ormcache(skiparg=3)
+    def _compute_rules(self, cr, uid, model_name, mode, group_ids):
+        """ Return the :class:`_RuleSet` of the rules of ``model_name`` that
+        apply to the users of the groups ``group_ids`` for ``mode``. The cache
+        is shared by all the users with the same groups.
+        """
         cr.execute("""SELECT r.id
                 FROM ir_rule r
                 JOIN ir_model m ON (r.model_id = m.id)
@@ -117,45 +303,95 @@ class ir_rule(osv.osv):
                 AND r.active is True
                 AND r.perm_""" + mode + """
                 AND (r.id IN (SELECT rule_group_id FROM rule_group_rel g_rel
-                            JOIN res_groups_users_rel u_rel ON (g_rel.group_id = u_rel.gid)
-                            WHERE u_rel.uid = %s) OR r.global)""", (model_name, uid))
+                            WHERE g_rel.group_id = ANY(%s)) OR r.global)""", (model_name, list(group_ids)))
         rule_ids = [x[0] for x in cr.fetchall()]
-        if rule_ids:
-            # browse user as super-admin root to avoid access errors!
-            user = self.pool.get('res.users').browse(cr, SUPERUSER_ID, uid)
-            global_domains = []                 # list of domains
-            group_domains = {}                  # map: group -> list of domains
-            for rule in self.browse(cr, SUPERUSER_ID, rule_ids):
-                # read 'domain' as UID to have the correct eval context for the rule.
-                rule_domain = self.read(cr, uid, [rule.id], ['domain'])[0]['domain']
-                dom = expression.normalize_domain(rule_domain)
-                for group in rule.groups:
-                    if group in user.groups_id:
-                        group_domains.setdefault(group, []).append(dom)
-                if not rule.groups:
-                    global_domains.append(dom)
-            # combine global domains and group domains
-            if group_domains:
-                group_domain = expression.OR(map(expression.OR, group_domains.values()))
-            else:
-                group_domain = []
-            domain = expression.AND(global_domains + [group_domain])
-            return domain
+        rules = [
+            (rule.domain_force, [group.id for group in rule.groups if group.id in group_ids])
+            for rule in self.browse(cr, SUPERUSER_ID, rule_ids)
+        ]
+        return _RuleSet(model_name, rules)
+
+    def _get_rule_set(self, cr, uid, model_name, mode):
+        if mode not in self._MODES:
+            raise ValueError('Invalid mode: %r' % (mode,))
+        # browse user as super-admin root to avoid access errors!
+        user = self.pool['res.users'].browse(cr, SUPERUSER_ID, uid)
+        return self._compute_rules(cr, uid, model_name, mode, tuple(sorted(user.groups_id.ids)))
+
+    def _combine_domains(self, rule_set, eval_context):
+        """ Return the domain of the rules of ``rule_set`` evaluated in ``eval_context``. """
+        global_domains = []                 # list of domains
+        group_domains = {}                  # map: group -> list of domains
+        for domain_force, group_ids in rule_set.rules:
+            dom = expression.normalize_domain(eval(domain_force, eval_context) if domain_force else [])
+            for group_id in group_ids:
+                group_domains.setdefault(group_id, []).append(dom)
+            if not group_ids:
+                global_domains.append(dom)
+        # combine global domains and group domains
+        if group_domains:
+            group_domain = expression.OR(map(expression.OR, group_domains.values()))
+        else:
+            group_domain = []
+        return expression.AND(global_domains + [group_domain])
+
+    def _compute_domain(self, cr, uid, model_name, mode="read"):
+        if uid == SUPERUSER_ID:
+            return None
+        rule_set = self._get_rule_set(cr, uid, model_name, mode)
+        if rule_set.rules:
+            return self._combine_domains(rule_set, self._eval_context(cr, uid))
         return []
 
+    def _compiled_rules_stats(self):
+        """ Return ``{model_name: (group sets, compiled rules)}`` for the rules
+        in cache.
+        """
+        stats = {}
+        for value in self.pool.cache.itervalues():
+            if isinstance(value, _RuleSet):
+                sets, count = stats.get(value.model_name, (0, 0))
+                stats[value.model_name] = (sets + 1, count + len(value))
+        return stats
+
     def clear_cache(self, cr, uid):
-        self._compute_domain.clear_cache(self)
+        self._compute_rules.clear_cache(self)
+
+    def _rule_where_calc(self, cr, model_name, dom):
+        # _where_calc is called as superuser. This means that rules can
+        # involve objects on which the real uid has no acces rights.
+        # This means also there is no implicit restriction (e.g. an object
+        # references another object the user can't see).
+        query = self.pool[model_name]._where_calc(cr, SUPERUSER_ID, dom, active_test=False)
+        return query.where_clause, query.where_clause_params, query.tables
 
     def domain_get(self, cr, uid, model_name, mode='read', context=None):
-        dom = self._compute_domain(cr, uid, model_name, mode)
-        if dom:
-            # _where_calc is called as superuser. This means that rules can
-            # involve objects on which the real uid has no acces rights.
-            # This means also there is no implicit restriction (e.g. an object
-            # references another object the user can't see).
-            query = self.pool[model_name]._where_calc(cr, SUPERUSER_ID, dom, active_test=False)
-            return query.where_clause, query.where_clause_params, query.tables
-        return [], [], ['"' + self.pool[model_name]._table + '"']
+        if uid == SUPERUSER_ID:
+            return [], [], ['"' + self.pool[model_name]._table + '"']
+        rule_set = self._get_rule_set(cr, uid, model_name, mode)
+        if not rule_set.rules:
+            return [], [], ['"' + self.pool[model_name]._table + '"']
+
+        eval_context = self._eval_context(cr, uid)
+        rule = rule_set.lookup(eval_context)
+        if rule is None:
+            # evaluate the rules, and log the values they read from the context
+            log = _ValueLog()
+            dom = self._combine_domains(rule_set, _logging_context(eval_context, log))
+            if not dom:
+                rule = ([], [], ['"' + self.pool[model_name]._table + '"'])
+            elif _is_static_domain(self.pool[model_name], dom):
+                rule = self._rule_where_calc(cr, model_name, dom)
+            else:
+                # the WHERE clause depends on the database content
+                rule = dom
+            if log.cacheable:
+                rule_set.add(log, rule)
+
+        if isinstance(rule, tuple):
+            where_clause, where_params, tables = rule
+            return list(where_clause), list(where_params), list(tables)
+        return self._rule_where_calc(cr, model_name, rule)
 
     def unlink(self, cr, uid, ids, context=None):
         res = super(ir_rule, self).unlink(cr, uid, ids, context=context)
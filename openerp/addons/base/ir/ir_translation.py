@@ -286,6 +286,7 @@ class ir_translation(osv.osv):
     def _set_ids(self, cr, uid, name, tt, lang, ids, value, src=None):
         self._get_ids.clear_cache(self)
         self.__get_source.clear_cache(self)
+        self._invalidate_shared_cache(cr)
 
         cr.execute('delete from ir_translation '
                 'where lang=%s '
@@ -368,12 +369,22 @@ class ir_translation(osv.osv):
                 res_id = tuple(res_id)
         return self.__get_source(cr, uid, name, types, lang, source, res_id)
 
+    def _invalidate_shared_cache(self, cr):
+        """ Invalidate the translated values kept in the shared record cache,
+        in this process and in the other ones.
+        """
+        for model in self.pool.itervalues():
+            if model._cache_shared:
+                self.pool.shared_cache.invalidate(cr, model._name)
+                self.pool.cache_cleared(model._name)
+
     def create(self, cr, uid, vals, context=None):
         if context is None:
             context = {}
         ids = super(ir_translation, self).create(cr, uid, vals, context=context)
         self.__get_source.clear_cache(self)
         self._get_ids.clear_cache(self)
+        self._invalidate_shared_cache(cr)
         self.pool['ir.ui.view'].clear_cache()
         return ids
 
@@ -389,6 +400,7 @@ class ir_translation(osv.osv):
         result = super(ir_translation, self).write(cursor, user, ids, vals, context=context)
         self.__get_source.clear_cache(self)
         self._get_ids.clear_cache(self)
+        self._invalidate_shared_cache(cursor)
         self.pool['ir.ui.view'].clear_cache()
         return result
 
@@ -400,6 +412,7 @@ class ir_translation(osv.osv):
 
         self.__get_source.clear_cache(self)
         self._get_ids.clear_cache(self)
+        self._invalidate_shared_cache(cursor)
         result = super(ir_translation, self).unlink(cursor, user, ids, context=context)
         return result
 
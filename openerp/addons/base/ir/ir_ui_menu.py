@@ -51,7 +51,7 @@ class ir_ui_menu(osv.osv):
             if self._menu_cache:
                 # Normally this is done by openerp.tools.ormcache
                 # but since we do not use it, set it by ourself.
-                self.pool._any_cache_cleared = True
+                self.pool.cache_cleared(self._name)
             self._menu_cache.clear()
         self.load_menus_root._orig.clear_cache(self)
         self.load_menus._orig.clear_cache(self)
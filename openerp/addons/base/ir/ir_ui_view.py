@@ -991,7 +991,11 @@ class view(osv.osv):
         return '%s.%s' % (xmlid['module'], xmlid['name'])
 
     @api.cr_uid_ids_context
-    def render(self, cr, uid, id_or_xml_id, values=None, engine='ir.qweb', context=None):
+    def render(self, cr, uid, id_or_xml_id, values=None, engine='ir.qweb', context=None, stream=False):
+        """ Renders the view ``id_or_xml_id`` with ``engine``; if ``stream`` is
+        set, returns an iterator of chunks instead of a string (see
+        :meth:`~openerp.addons.base.ir.ir_qweb.QWeb.render_iter`).
+        """
         if isinstance(id_or_xml_id, list):
             id_or_xml_id = id_or_xml_id[0]
 
@@ -1026,6 +1030,8 @@ class view(osv.osv):
         def loader(name):
             return self.read_template(cr, uid, name, context=context)
 
+        if stream:
+            return self.pool[engine].render_iter(cr, uid, id_or_xml_id, qcontext, loader=loader, context=context)
         return self.pool[engine].render(cr, uid, id_or_xml_id, qcontext, loader=loader, context=context)
 
     #------------------------------------------------------
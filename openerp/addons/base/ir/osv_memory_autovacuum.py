@@ -29,6 +29,7 @@ class osv_memory_autovacuum(openerp.osv.osv.osv_memory):
         for model in self.pool.models.values():
             if model.is_transient():
                 model._transient_vacuum(cr, uid, force=True)
+        self.pool['ir.attachment']._file_gc(cr, uid, context=context)
         return True
 
 
@@ -42,6 +42,7 @@ def location_name_search(self, cr, user, name='', args=None, operator='ilike',
 class Country(osv.osv):
     _name = 'res.country'
     _description = 'Country'
+    _cache_shared = True
     _columns = {
         'name': fields.char('Country Name',
             help='The full name of the country.', required=True, translate=True),
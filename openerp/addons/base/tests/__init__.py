@@ -8,6 +8,7 @@ import test_func
 import test_ir_actions
 import test_ir_attachment
 import test_ir_filters
+import test_ir_job
 import test_ir_sequence
 import test_ir_values
 import test_mail
@@ -15,6 +16,7 @@ import test_menu
 import test_orm
 import test_osv
 import test_qweb
+import test_registry_signaling
 import test_res_config
 import test_res_lang
 import test_search
@@ -440,3 +440,10 @@ class TestAPI(common.TransactionCase):
             ps.mapped('parent_id.name'),
             [p.name for p in parents]
         )
+
+    def test_90_readonly(self):
+        """ Check methods decorated with readonly. """
+        partners = self.env['res.partner']
+        self.assertTrue(partners.search_read._readonly)
+        self.assertTrue(self.registry('res.partner').read_group._readonly)
+        self.assertFalse(getattr(partners.write, '_readonly', False))
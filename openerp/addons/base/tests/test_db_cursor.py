@@ -3,6 +3,7 @@
 import unittest2
 
 import openerp
+from openerp.sql_db import ConnectionPool, PoolError, PreparedStatements, dsn
 from openerp.tools.misc import mute_logger
 from openerp.tests import common
 
@@ -29,4 +30,65 @@ class test_cr_execute(unittest2.TestCase):
             with self.assertRaises(ValueError):
                 cr.execute("SELECT id FROM res_users WHERE id=%s", '1')
 
+
+class test_prepared_statements(unittest2.TestCase):
+    """ Check the server-side prepared statements of connections """
+
+    def test_lookup(self):
+        with registry().cursor() as cr:
+            prepared = PreparedStatements(size=1, threshold=2)
+            query = first_query = "SELECT login FROM res_users WHERE id=%s AND login LIKE '%%'"
+
+            # the query is prepared on its second execution
+            self.assertEqual(prepared.lookup(cr, query, [ADMIN_USER_ID]), query)
+            query_exec = prepared.lookup(cr, query, [ADMIN_USER_ID])
+            self.assertTrue(query_exec.startswith('EXECUTE '))
+            cr.execute(query_exec, [ADMIN_USER_ID])
+            self.assertEqual(cr.fetchone()[0], 'admin')
+
+            # tuple parameters are not prepared
+            query = "SELECT login FROM res_users WHERE id IN %s"
+            for _ in range(3):
+                self.assertEqual(prepared.lookup(cr, query, [(ADMIN_USER_ID,)]), query)
+
+            # the least recently used statement is deallocated
+            query = "SELECT id FROM res_users WHERE login=%s"
+            for _ in range(2):
+                query_exec = prepared.lookup(cr, query, ['admin'])
+            cr.execute(query_exec, ['admin'])
+            self.assertEqual(cr.fetchone()[0], ADMIN_USER_ID)
+            self.assertEqual(len(prepared.names), 1)
+            cr.execute("SELECT count(1) FROM pg_prepared_statements")
+            self.assertEqual(cr.fetchone()[0], 1)
+
+            # a deallocated statement is prepared again
+            self.assertEqual(prepared.lookup(cr, first_query, [ADMIN_USER_ID]), first_query)
+            query_exec = prepared.lookup(cr, first_query, [ADMIN_USER_ID])
+            self.assertTrue(query_exec.startswith('EXECUTE '))
+            cr.execute(query_exec, [ADMIN_USER_ID])
+            self.assertEqual(cr.fetchone()[0], 'admin')
+            cr.execute("DEALLOCATE ALL")
+
+
+class test_connection_pool(unittest2.TestCase):
+    """ Check the borrowing of connections from a pool """
+
+    def test_borrow(self):
+        pool = ConnectionPool(maxconn=1, timeout=0.1)
+        uri = dsn(DB)[1]
+        cnx = pool.borrow(uri)
+
+        # the pool is full: borrowing waits, then fails
+        with self.assertRaises(PoolError):
+            pool.borrow(uri)
+        stats = pool.stats()
+        self.assertEqual((stats['borrowed'], stats['waits'], stats['timeouts']), (1, 1, 1))
+
+        # the idle connection is reused
+        pool.give_back(cnx)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertIs(pool.borrow(uri), cnx)
+        pool.give_back(cnx, keep_in_pool=False)
+        self.assertEqual(pool.stats()['count'], 0)
+
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -480,5 +480,84 @@ class test_expression(common.TransactionCase):
             ids = Country.search(self.cr, self.uid, domain)
             self.assertListEqual([be], ids)
 
+
+class test_expression_subqueries(common.TransactionCase):
+    """ The searches made while parsing a domain may be replaced by subqueries,
+    which must not change the results.
+    """
+
+    def setUp(self):
+        super(test_expression_subqueries, self).setUp()
+        cr, uid = self.cr, self.uid
+        self.categories = self.registry('res.partner.category')
+        parent = self.categories.create(cr, uid, {'name': 'test_subquery_parent'})
+        for name in ('test_subquery_child_a', 'test_subquery_child_b'):
+            self.categories.create(cr, uid, {'name': name, 'parent_id': parent})
+        self.categories.create(cr, uid, {'name': 'test_subquery_alone'})
+        self.partners = self.registry('res.partner')
+        self.partner_be = self.partners.create(cr, uid, {'name': 'test_subquery_be', 'country_id': self.ref('base.be')})
+        self.partners.create(cr, uid, {'name': 'test_subquery_us', 'state_id': self.ref('base.state_us_5'),
+                                       'country_id': self.ref('base.us')})
+
+    def assertSameSearch(self, model, domain, context=None):
+        cr, uid = self.cr, self.uid
+        context = dict(context or {}, search_subqueries=False)
+        expected = model.search(cr, uid, domain, context=context)
+        context['search_subqueries'] = True
+        result = model.search(cr, uid, domain, context=context)
+        self.assertItemsEqual(result, expected, "%s: different results for %r" % (model._name, domain))
+
+    def test_many2one_path(self):
+        for domain in [
+            [('country_id.code', '=', 'BE')],
+            [('country_id.name', 'ilike', 'an')],
+            [('country_id.code', '!=', 'BE')],
+            [('state_id.country_id.code', '=', 'US')],
+            ['|', ('country_id.code', '=', 'BE'), ('state_id.code', '=', 'CA')],
+        ]:
+            self.assertSameSearch(self.partners, domain)
+        for domain in [
+            [('parent_id.name', '=', 'test_subquery_parent')],
+            [('parent_id.name', 'like', 'test_subquery')],
+            ['!', ('parent_id.name', 'like', 'test_subquery')],
+        ]:
+            self.assertSameSearch(self.categories, domain)
+            self.assertSameSearch(self.categories, domain, context={'active_test': False})
+
+    def test_x2many_path(self):
+        countries = self.registry('res.country')
+        for domain in [
+            [('child_ids.name', '=', 'test_subquery_child_a')],
+            [('child_ids.name', 'like', 'test_subquery')],
+            [('child_ids.name', '=', 'does not exist')],
+            [('child_ids.parent_id.name', '=', 'test_subquery_parent')],
+        ]:
+            self.assertSameSearch(self.categories, domain)
+        self.assertSameSearch(countries, [('country_group_ids.name', 'ilike', 'e')])
+
+    def test_x2many_null(self):
+        for domain in [
+            [('child_ids', '=', False)],
+            [('child_ids', '!=', False)],
+            [('partner_ids', '=', False)],
+            [('partner_ids', '!=', False)],
+        ]:
+            self.assertSameSearch(self.categories, domain)
+
+    def test_access_rules(self):
+        """ The subqueries apply the record rules of the intermediate models. """
+        cr, uid = self.cr, self.uid
+        self.registry('ir.rule').create(cr, uid, {
+            'name': 'test_subquery_rule',
+            'model_id': self.ref('base.model_res_country'),
+            'domain_force': "[('code', '!=', 'BE')]",
+        })
+        demo = self.ref('base.user_demo')
+        domain = [('country_id.code', 'in', ['BE', 'US'])]
+        expected = self.partners.search(cr, demo, domain, context={'search_subqueries': False})
+        result = self.partners.search(cr, demo, domain, context={'search_subqueries': True})
+        self.assertItemsEqual(result, expected)
+        self.assertNotIn(self.partner_be, result)
+
 if __name__ == '__main__':
     unittest2.main()
@@ -1,5 +1,7 @@
 import hashlib
 import os
+import shutil
+import tempfile
 
 import openerp
 import openerp.tests.common
@@ -69,9 +71,10 @@ class test_ir_attachment(openerp.tests.common.TransactionCase):
         self.ira.unlink(cr, uid, [a3])
         self.assertTrue(os.path.isfile(a2_fn))
 
-        # delete a2 it is unlinked
+        # delete a2, its file is kept until the garbage collection
         self.ira.unlink(cr, uid, [a2])
-        self.assertFalse(os.path.isfile(a2_fn))
+        self.assertTrue(os.path.isfile(a2_fn))
+        self.assertTrue(os.path.isfile(os.path.join(self.filestore, 'checklist', a2_store_fname)))
 
     def test_05_change_data_change_file(self):
         registry, cr, uid = self.registry, self.cr, self.uid
@@ -83,10 +86,50 @@ class test_ir_attachment(openerp.tests.common.TransactionCase):
         self.assertTrue(os.path.isfile(a2_fn))
 
         self.ira.write(cr, uid, [a2], {'datas': self.blob2_b64})
-        self.assertFalse(os.path.isfile(a2_fn))
+        self.assertTrue(os.path.isfile(os.path.join(self.filestore, 'checklist', a2_store_fname)))
 
         new_a2_store_fname = self.ira.browse(cr, uid, a2).store_fname
         self.assertNotEqual(a2_store_fname, new_a2_store_fname)
 
         new_a2_fn = os.path.join(self.filestore, new_a2_store_fname)
         self.assertTrue(os.path.isfile(new_a2_fn))
+
+    def test_06_open_raw_data(self):
+        registry, cr, uid = self.registry, self.cr, self.uid
+
+        a2 = self.ira.create(cr, uid, {'name': 'a2', 'datas': self.blob1_b64})
+        fp = self.ira._data_open(cr, uid, a2)
+        self.assertEqual(fp.read(), self.blob1)
+        fp.close()
+
+        registry('ir.config_parameter').set_param(cr, uid, 'ir_attachment.location', 'db')
+        a1 = self.ira.create(cr, uid, {'name': 'a1', 'datas': self.blob1_b64})
+        fp = self.ira._data_open(cr, uid, a1, context={'bin_size': True})
+        self.assertEqual(fp.read(), self.blob1)
+        fp.close()
+
+    def test_07_file_gc(self):
+        registry, cr, uid = self.registry, self.cr, self.uid
+
+        # collect the garbage of an empty filestore, without committing
+        filestore = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, filestore)
+        self.ira._filestore = lambda cr, uid, context=None: filestore
+        self.addCleanup(delattr, self.ira, '_filestore')
+        cr.commit = lambda: None
+        self.addCleanup(delattr, cr, 'commit')
+
+        shared = 'shared garbage collected blob'
+        unique = 'unique garbage collected blob'
+        a1 = self.ira.create(cr, uid, {'name': 'a1', 'datas': shared.encode('base64')})
+        a2 = self.ira.create(cr, uid, {'name': 'a2', 'datas': shared.encode('base64')})
+        a3 = self.ira.create(cr, uid, {'name': 'a3', 'datas': unique.encode('base64')})
+        shared_fname = self.ira.browse(cr, uid, a2).store_fname
+        unique_fname = self.ira.browse(cr, uid, a3).store_fname
+        self.ira.unlink(cr, uid, [a1, a3])
+
+        self.assertEqual(self.ira._file_gc(cr, uid), (1, len(unique)))
+        self.assertTrue(os.path.isfile(os.path.join(filestore, shared_fname)))
+        self.assertFalse(os.path.exists(os.path.join(filestore, unique_fname)))
+        self.assertFalse(os.path.exists(os.path.join(filestore, 'checklist', shared_fname)))
+        self.assertFalse(os.path.exists(os.path.join(filestore, 'checklist', unique_fname)))
@@ -0,0 +1,58 @@
+import json
+
+import openerp.tests.common as common
+from openerp.addons.base.ir.ir_job import _json_decoder, _json_default
+from openerp.service.job import parse_channels
+
+
+class test_ir_job(common.TransactionCase):
+
+    def setUp(self):
+        super(test_ir_job, self).setUp()
+        self.partner = self.env['res.partner'].create({'name': 'Job Partner'})
+
+    def fetch_job(self, job):
+        self.cr.execute("SELECT * FROM ir_job WHERE id=%s", (job.id,))
+        return self.cr.dictfetchone()
+
+    def test_00_enqueue(self):
+        """ calling a method through with_delay() enqueues a job """
+        partner = self.partner.with_context(lang='en_US')
+        job = partner.with_delay(priority=5, channel='test').write({'city': 'Jobtown'})
+        self.assertEqual(job._name, 'ir.job')
+        self.assertEqual(job.state, 'pending')
+        self.assertEqual(job.name, 'res.partner.write')
+        self.assertEqual((job.priority, job.channel), (5, 'test'))
+        self.assertEqual(job.user_id.id, self.env.uid)
+        self.assertEqual(json.loads(job.record_ids), [self.partner.id])
+        self.assertEqual(json.loads(job.context).get('lang'), 'en_US')
+        # the method has not been called
+        self.assertFalse(self.partner.city)
+
+        with self.assertRaises(AttributeError):
+            self.partner.with_delay().no_such_method()
+
+    def test_10_perform(self):
+        """ performing a job calls its method on its records """
+        job = self.partner.with_delay().write({'city': 'Jobtown'})
+        job2 = self.env['res.partner'].with_delay().name_search(name='Job Part')
+        Job = self.registry('ir.job')
+
+        self.assertTrue(Job._perform(self.cr, self.fetch_job(job)))
+        self.partner.invalidate_cache()
+        self.assertEqual(self.partner.city, 'Jobtown')
+
+        result = Job._perform(self.cr, self.fetch_job(job2))
+        self.assertIn(self.partner.id, [id for id, name in result])
+
+    def test_20_recordset_arguments(self):
+        """ recordsets may be passed as job arguments """
+        data = json.dumps([[self.partner], {'partners': self.partner}], default=_json_default)
+        args, kwargs = json.loads(data, object_hook=_json_decoder(self.env))
+        self.assertEqual(args, [self.partner])
+        self.assertEqual(kwargs, {'partners': self.partner})
+
+    def test_30_channels(self):
+        self.assertEqual(parse_channels(''), {'root': 1})
+        self.assertEqual(parse_channels('root:4, mail:2,stock'),
+                         {'root': 4, 'mail': 2, 'stock': 1})
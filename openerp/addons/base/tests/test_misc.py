@@ -1,6 +1,11 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest2
 
-from openerp.tools import misc
+from openerp import http
+from openerp.tools import image, misc
 
 
 class test_countingstream(unittest2.TestCase):
@@ -33,5 +38,108 @@ class test_countingstream(unittest2.TestCase):
         self.assertIsNone(next(s, None))
         self.assertEqual(s.index, 0)
 
+
+class test_session_store(unittest2.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = http.FilesystemSessionStore(self.path, session_class=http.OpenERPSession)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_save(self):
+        session = self.store.new()
+        session['db'] = 'foo'
+        self.store.save(session)
+        filename = self.store.get_session_filename(session.sid)
+        self.assertTrue(os.path.isfile(filename))
+        self.assertEqual(os.path.dirname(filename), os.path.join(self.path, session.sid[:2]))
+
+        session = self.store.get(session.sid)
+        self.assertEqual(session['db'], 'foo')
+
+    def test_unmodified(self):
+        """ Unmodified sessions are not written again """
+        session = self.store.new()
+        session['db'] = 'foo'
+        self.store.save(session)
+        filename = self.store.get_session_filename(session.sid)
+        mtime = int(time.time()) - 10
+        os.utime(filename, (mtime, mtime))
+
+        session = self.store.get(session.sid)
+        self.store.save(session)
+        self.assertEqual(os.path.getmtime(filename), mtime, "session is written")
+
+        # the use of the session is recorded once in a while
+        session._timestamp = 1
+        self.store.touch(session)
+        self.assertGreater(os.path.getmtime(filename), mtime, "session is not touched")
+
+        session['db'] = 'bar'
+        self.store.save(session)
+        self.assertEqual(self.store.get(session.sid)['db'], 'bar')
+
+    def test_gc(self):
+        old, new = self.store.new(), self.store.new()
+        self.store.save(old)
+        self.store.save(new)
+        os.utime(self.store.get_session_filename(old.sid), (1, 1))
+
+        self.store.gc(http.SESSION_LIFETIME)
+        self.assertFalse(os.path.exists(self.store.get_session_filename(old.sid)))
+        self.assertTrue(os.path.exists(self.store.get_session_filename(new.sid)))
+
+    def test_migrate(self):
+        """ Sessions stored in the main directory are still found """
+        session = self.store.new()
+        session['db'] = 'foo'
+        self.store.save(session)
+        filename = self.store.get_session_filename(session.sid)
+        os.rename(filename, os.path.join(self.path, os.path.basename(filename)))
+
+        self.assertEqual(self.store.get(session.sid)['db'], 'foo')
+        self.assertTrue(os.path.isfile(filename))
+
+
+class test_image_cache(unittest2.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = image.ImageCache(self.path, 1024 * 1024)
+        fp = image.StringIO.StringIO()
+        image.Image.new('RGB', (64, 32), (255, 0, 0)).save(fp, 'PNG')
+        self.source = fp.getvalue().encode('base64')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def files(self):
+        return sorted(path for mtime, size, path in self.cache._files())
+
+    def test_resize(self):
+        data = self.cache.resize(self.source, (16, 16))
+        self.assertEqual(image.Image.open(image.StringIO.StringIO(data)).size, (16, 16))
+        self.assertEqual(len(self.files()), 1)
+
+        # the cached image is returned again
+        self.assertEqual(self.cache.resize(self.source, (16, 16)), data)
+        self.assertEqual(len(self.files()), 1)
+
+        self.cache.resize(self.source, (8, 8))
+        self.assertEqual(len(self.files()), 2)
+
+    def test_evict(self):
+        """ The least recently used images are evicted """
+        self.cache.resize(self.source, (16, 16))
+        [old] = self.files()
+        os.utime(old, (1, 1))
+        self.cache.resize(self.source, (8, 8))
+        [new] = [path for path in self.files() if path != old]
+
+        self.cache.max_bytes = int(os.path.getsize(new) / 0.8) + 1
+        self.cache._evict()
+        self.assertEqual(self.files(), [new])
+        self.assertEqual(self.cache.total_bytes, os.path.getsize(new))
+
 if __name__ == '__main__':
     unittest2.main()
@@ -1,5 +1,6 @@
 from collections import defaultdict
 from openerp.tools import mute_logger
+from openerp.tools.cache import PREFETCH_STAT
 from openerp.tests import common
 
 UID = common.ADMIN_USER_ID
@@ -167,6 +168,90 @@ class TestORM(common.TransactionCase):
                         ['date'], ['date:month', 'date:day'], lazy=False)
         self.assertEqual(len(rg), len(all_partners))
 
+    def test_create_multi(self):
+        category = self.registry('res.partner.category')
+        cr, uid, p1, p2 = self.cr, self.uid, self.p1, self.p2
+        parent_id = category.create(cr, uid, {'name': 'Parent'})
+
+        ids = category.create_multi(cr, uid, [
+            {'name': 'A', 'parent_id': parent_id, 'partner_ids': [(6, 0, [p1, p2])]},
+            {'name': 'B', 'parent_id': parent_id, 'partner_ids': [(4, p2)]},
+            {'name': 'C'},
+        ])
+        self.assertEqual(len(ids), 3)
+        a, b, c = category.browse(cr, uid, ids)
+        self.assertEqual([a.name, b.name, c.name], ['A', 'B', 'C'])
+        self.assertEqual(a.partner_ids.ids, sorted([p1, p2]))
+        self.assertEqual(b.partner_ids.ids, [p2])
+        self.assertFalse(c.partner_ids)
+
+        # the hierarchy is maintained for every new record
+        children = category.search(cr, uid, [('id', 'child_of', parent_id)])
+        self.assertItemsEqual(children, [parent_id, a.id, b.id])
+
+        self.assertEqual(category.create_multi(cr, uid, []), [])
+
+    def test_write_multi(self):
+        category = self.registry('res.partner.category')
+        cr, uid, p1 = self.cr, self.uid, self.p1
+        ids = category.create_multi(cr, uid, [{'name': name} for name in 'ABCD'])
+        a, b, c, d = ids
+
+        category.write_multi(cr, uid, {
+            a: {'name': 'A2'},
+            b: {'name': 'B2', 'active': False},
+            c: {'active': False},
+            # values that cannot be updated directly
+            d: {'name': 'D2', 'partner_ids': [(4, p1)]},
+        })
+        records = category.browse(cr, uid, ids, context={'active_test': False})
+        self.assertEqual([r.name for r in records], ['A2', 'B2', 'C', 'D2'])
+        self.assertEqual([r.active for r in records], [True, False, False, True])
+        self.assertEqual(records[3].partner_ids.ids, [p1])
+
+    def test_shared_cache(self):
+        country = self.registry('res.country')
+        cr, uid = self.cr, self.uid
+        country_id = country.create(cr, uid, {'name': 'Utopia', 'code': 'UU'})
+        self.assertEqual(country.read(cr, uid, [country_id], ['code'])[0]['code'], 'UU')
+
+        # the cursor has modified the model, its values must not be shared
+        self.assertNotIn(('res.country', country_id), self.registry.shared_cache._data)
+
+        country.write(cr, uid, [country_id], {'code': 'UT'})
+        self.assertEqual(country.read(cr, uid, [country_id], ['code'])[0]['code'], 'UT')
+
+    def test_prefetch_heavy(self):
+        env = self.env
+        env.invalidate_all()
+        partners = env['res.partner'].search([], limit=3)
+
+        # text columns are not prefetched with the others
+        partners[0].name
+        self.assertFalse(partners[1]._cache.contains('comment'))
+
+        # until they have been read in the environment
+        partners[0].comment
+        env.invalidate_all()
+        partners = env['res.partner'].search([], limit=3)
+        partners[1].name
+        self.assertTrue(partners[2]._cache.contains('comment'))
+
+    def test_prefetch_stats(self):
+        env = self.env
+        env.invalidate_all()
+        partners = env['res.partner'].search([], limit=3)
+        self.assertEqual(len(partners), 3)
+        stat = PREFETCH_STAT[(self.cr.dbname, 'res.partner', 'name')]
+        hit, miss, wasted = stat.hit, stat.miss, stat.wasted
+
+        # the records fetched for another one are wasted until accessed
+        partners[0].name
+        self.assertEqual((stat.hit, stat.miss, stat.wasted), (hit, miss + 1, wasted + 2))
+        partners[1].name
+        partners[1].name
+        self.assertEqual((stat.hit, stat.miss, stat.wasted), (hit + 1, miss + 1, wasted + 1))
+
 
 class TestInherits(common.TransactionCase):
     """ test the behavior of the orm for models that use _inherits;
@@ -126,12 +126,27 @@ class TestQWeb(common.TransactionCase):
             ctx = context.copy()
             ctx.update(params)
             result = doc.find('result[@id="{}"]'.format(template)).text
+            rendered = qweb.render(template, qwebcontext=ctx)
             self.assertEqual(
-                qweb.render(template, qwebcontext=ctx).strip(),
+                rendered.strip(),
                 (result or u'').strip().encode('utf-8'),
                 template
             )
 
+            # the interpreter renders the same as the compiled templates
+            ctx = context.copy()
+            ctx.update(params)
+            qweb._model._compile = False
+            try:
+                self.assertEqual(qweb.render(template, qwebcontext=ctx), rendered, template)
+            finally:
+                del qweb._model._compile
+
+            # the streamed rendering produces the same result
+            ctx = context.copy()
+            ctx.update(params)
+            self.assertEqual("".join(qweb.render_iter(template, qwebcontext=ctx)), rendered, template)
+
 def load_tests(loader, suite, _):
     # can't override TestQWeb.__dir__ because dir() called on *class* not
     # instance
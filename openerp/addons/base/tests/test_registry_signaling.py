@@ -0,0 +1,110 @@
+import select
+import time
+
+import openerp
+import openerp.tests.common as common
+from openerp.modules.registry import RegistryManager, SIGNALING_CHANNEL
+
+
+class test_registry_signaling(common.TransactionCase):
+
+    def setUp(self):
+        super(test_registry_signaling, self).setUp()
+        multi_process = openerp.multi_process
+        openerp.multi_process = True
+
+        def restore():
+            openerp.multi_process = multi_process
+            self.registry.__dict__.pop('receive_signals', None)
+        self.addCleanup(restore)
+
+    def patch_signals(self, signals, watermarks=(0, 0)):
+        """ make the registry receive ``signals`` on its next check """
+        registry = self.registry
+        registry.receive_signals = lambda: signals
+        watermarks_orig = registry._signal_watermarks
+        registry._signal_watermarks = watermarks
+
+        def restore():
+            registry._signal_watermarks = watermarks_orig
+        self.addCleanup(restore)
+
+    def test_00_receive_signals(self):
+        """ the signals notified by other processes are received """
+        registry = self.registry
+        state = (registry._signal_conn, registry._signal_pid, registry._signal_time)
+        registry._signal_conn = registry._signal_pid = None
+        registry._signal_time = 0
+
+        def restore():
+            registry.close_signal_listener()
+            registry._signal_conn, registry._signal_pid, registry._signal_time = state
+        self.addCleanup(restore)
+
+        # opening the listener may miss signals
+        self.assertIsNone(registry.receive_signals())
+        self.assertIsNotNone(registry._signal_conn)
+        self.assertEqual(registry.receive_signals(), [])
+
+        with openerp.sql_db.db_connect(self.cr.dbname).cursor() as cr:
+            cr.execute("SELECT pg_notify(%s, %s)",
+                       (SIGNALING_CHANNEL, 'cache other:1 42 res.partner,res.users'))
+
+        signals = []
+        deadline = time.time() + 5
+        while not signals and time.time() < deadline:
+            select.select([registry._signal_conn], [], [], 0.1)
+            signals = registry.receive_signals()
+        self.assertEqual(signals, [('cache', 42, set(['res.partner', 'res.users']))])
+
+    def test_10_scoped_clearing(self):
+        """ only the caches of the signaled models are cleared """
+        cache = self.registry.cache
+        cache[('res.partner', 'test')] = 1
+        cache[('res.users', 'test')] = 1
+        # signals are received in commit order: a lower sequence may come last
+        self.patch_signals([('cache', 12, set(['res.lang'])),
+                            ('cache', 11, set(['res.partner']))],
+                           watermarks=(self.registry.base_registry_signaling_sequence, 10))
+        self.assertTrue(RegistryManager.check_registry_signaling(self.cr.dbname))
+        self.assertNotIn(('res.partner', 'test'), cache)
+        self.assertIn(('res.users', 'test'), cache)
+        cache.clear_prefix(('res.users',))
+
+    def test_20_skip_watermark(self):
+        """ the signals up to the watermark are ignored """
+        cache = self.registry.cache
+        cache[('res.partner', 'test')] = 1
+        self.patch_signals([('cache', 10, set(['res.partner']))],
+                           watermarks=(self.registry.base_registry_signaling_sequence, 10))
+        self.assertFalse(RegistryManager.check_registry_signaling(self.cr.dbname))
+        self.assertIn(('res.partner', 'test'), cache)
+        cache.clear_prefix(('res.partner',))
+
+    def test_30_fallback(self):
+        """ the sequences are checked when signals may have been missed """
+        registry = self.registry
+        registry.enter_test_mode()
+        self.addCleanup(registry.leave_test_mode)
+        state = (registry.base_registry_signaling_sequence,
+                 registry.base_cache_signaling_sequence,
+                 registry._signal_watermarks)
+
+        def restore():
+            (registry.base_registry_signaling_sequence,
+             registry.base_cache_signaling_sequence,
+             registry._signal_watermarks) = state
+        self.addCleanup(restore)
+
+        with registry.cursor() as cr:
+            r, c = registry.setup_multi_process_signaling(cr)
+            cr.execute("SELECT nextval('base_cache_signaling')")
+        registry.base_registry_signaling_sequence = r
+        registry.base_cache_signaling_sequence = c
+
+        registry.cache[('res.partner', 'test')] = 1
+        self.patch_signals(None)
+        self.assertTrue(RegistryManager.check_registry_signaling(self.cr.dbname))
+        self.assertNotIn(('res.partner', 'test'), registry.cache)
+        self.assertEqual(registry._signal_watermarks, (r, c + 1))
+        self.assertEqual(registry.base_cache_signaling_sequence, c + 1)
@@ -31,3 +31,71 @@ class TestRules(TransactionCase):
         # but this should
         with self.assertRaises(openerp.exceptions.AccessError):
             self.assertEqual(browse2.val, -1)
+
+    def test_compiled_rules(self):
+        Users = self.env['res.users'].with_context(no_reset_password=True)
+        group_ids = [(6, 0, [self.ref('base.group_user')])]
+        uids = [
+            Users.create({'name': name, 'login': name, 'groups_id': group_ids}).id
+            for name in ('rule_user1', 'rule_user2')
+        ]
+        Rule = self.registry('ir.rule')
+        model_name = 'test_access_right.some_obj'
+
+        # users with the same groups share the same compiled rules
+        for uid in uids:
+            records = self.env(user=uid)[model_name].search([])
+            self.assertIn(self.id1, records.ids)
+            self.assertNotIn(self.id2, records.ids)
+        self.assertEqual(Rule._compiled_rules_stats()[model_name], (1, 1))
+
+        # unless the rules depend on their values
+        self.env['ir.rule'].create({
+            'name': 'Depends on user',
+            'model_id': self.browse_ref('test_access_rights.model_test_access_right_some_obj').id,
+            'domain_force': "[('val', '<', user.id)]",
+        })
+        params = [sorted(Rule.domain_get(self.cr, uid, model_name)[1]) for uid in uids]
+        self.assertEqual(Rule._compiled_rules_stats()[model_name], (1, 2))
+        self.assertEqual(params, [[0, uids[0]], [0, uids[1]]])
+
+    def test_time_rules(self):
+        Users = self.env['res.users'].with_context(no_reset_password=True)
+        uid = Users.create({
+            'name': 'rule_user', 'login': 'rule_user',
+            'groups_id': [(6, 0, [self.ref('base.group_user')])],
+        }).id
+        Rule = self.registry('ir.rule')
+        model_name = 'test_access_right.some_obj'
+
+        # rules depending on the time are evaluated each time
+        self.env['ir.rule'].create({
+            'name': 'Depends on time',
+            'model_id': self.browse_ref('test_access_rights.model_test_access_right_some_obj').id,
+            'domain_force': "[('val', '<', time.time())]",
+        })
+        params1 = Rule.domain_get(self.cr, uid, model_name)[1]
+        params2 = Rule.domain_get(self.cr, uid, model_name)[1]
+        self.assertEqual(Rule._compiled_rules_stats()[model_name], (1, 0))
+        self.assertNotEqual(sorted(params1), sorted(params2))
+
+    def test_child_of_rules(self):
+        Partner = self.env['res.partner']
+        partner = Partner.create({'name': 'Rule Parent'})
+        user = self.env['res.users'].with_context(no_reset_password=True).create({
+            'name': 'rule_user', 'login': 'rule_user', 'partner_id': partner.id,
+            'groups_id': [(6, 0, [self.ref('base.group_user')])],
+        })
+        self.env['ir.rule'].create({
+            'name': 'Own partners',
+            'model_id': self.ref('base.model_res_partner'),
+            'domain_force': "[('id', 'child_of', user.partner_id.id)]",
+        })
+
+        # the bounds of the partner are in cache, no query reads them
+        partner.parent_left
+        self.assertEqual(Partner.sudo(user).search([]), partner)
+
+        # the rule follows the changes of the hierarchy
+        child = Partner.create({'name': 'Rule Child', 'parent_id': partner.id})
+        self.assertEqual(Partner.sudo(user).search([]), partner + child)
@@ -363,6 +363,17 @@ class test_o2m(CreatorCase):
                 [u'', u'13'],
             ])
 
+    def test_batches(self):
+        """ exporting by batches gives the same rows as export_data() """
+        env = self.env(user=openerp.SUPERUSER_ID)
+        records = env[self.model_name].browse()
+        for commands in [self.commands, self.commands[:2], [], self.commands[3:]]:
+            records += env[self.model_name].create({'value': commands})
+        fields = ['const', 'value/value']
+        self.assertEqual(
+            list(records._export_data_iter(fields, batch_size=2)),
+            records.export_data(fields)['datas'])
+
     def test_multiple_records_name(self):
         self.assertEqual(
             self.export(self.commands, fields=['const', 'value']),
@@ -6,6 +6,7 @@ from collections import defaultdict
 
 from openerp.tests import common
 from openerp.exceptions import except_orm
+from openerp.tools.cache import RECOMPUTE_STAT
 
 
 class TestNewFields(common.TransactionCase):
@@ -101,6 +102,26 @@ class TestNewFields(common.TransactionCase):
         for message in discussion2.messages:
             self.assertEqual(message.name, "[%s] %s" % (name2, message.author.name))
 
+    def test_11_stored_batch(self):
+        """ test the batched recomputation of stored fields """
+        discussion = self.env.ref('test_new_api.discussion_0')
+        messages = discussion.messages
+        self.assertTrue(len(messages) > 1)
+        stat = RECOMPUTE_STAT[(self.cr.dbname, 'test_new_api.message', 'name')]
+        calls, records = stat.calls, stat.records
+
+        # modify the discussion twice; the messages are recomputed once
+        with self.env.norecompute():
+            discussion.name = 'Talking about stuff...'
+            discussion.name = name = 'Talking about other stuff...'
+        discussion.recompute()
+        self.assertEqual(stat.calls, calls + 1)
+        self.assertEqual(stat.records, records + len(messages))
+
+        messages.invalidate_cache()
+        for message in messages:
+            self.assertEqual(message.name, "[%s] %s" % (name, message.author.name))
+
     def test_12_recursive(self):
         """ test recursively dependent fields """
         Category = self.env['test_new_api.category']
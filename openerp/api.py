@@ -55,7 +55,7 @@ __all__ = [
     'model', 'multi', 'one',
     'cr', 'cr_context', 'cr_uid', 'cr_uid_context',
     'cr_uid_id', 'cr_uid_id_context', 'cr_uid_ids', 'cr_uid_ids_context',
-    'constrains', 'depends', 'onchange', 'returns',
+    'constrains', 'depends', 'onchange', 'returns', 'readonly',
 ]
 
 import logging
@@ -77,6 +77,7 @@ _logger = logging.getLogger(__name__)
 #  - method._depends: set by @depends, specifies compute dependencies
 #  - method._returns: set by @returns, specifies return model
 #  - method._onchange: set by @onchange, specifies onchange fields
+#  - method._readonly: set by @readonly, the method does not write
 #  - method.clear_cache: set by @ormcache, used to clear the cache
 #
 # On wrapping method only:
@@ -85,9 +86,9 @@ _logger = logging.getLogger(__name__)
 #
 
 WRAPPED_ATTRS = ('__module__', '__name__', '__doc__', '_constrains',
-                 '_depends', '_onchange', '_returns', 'clear_cache')
+                 '_depends', '_onchange', '_returns', '_readonly', 'clear_cache')
 
-INHERITED_ATTRS = ('_returns',)
+INHERITED_ATTRS = ('_returns', '_readonly')
 
 
 class Meta(type):
@@ -231,6 +232,20 @@ def returns(model, downgrade=None):
     return lambda method: decorate(method, '_returns', (model, downgrade))
 
 
+def readonly(method):
+    """ Decorate a method that does not write to the database. When called
+        remotely, such a method may be executed on a replica of the database::
+
+            @api.readonly
+            def search_read(self, cr, uid, domain=None, fields=None, ...):
+                ...
+
+        Like :func:`returns`, this decorator is *inherited*: the methods that
+        override a decorated method must not write to the database either.
+    """
+    return decorate(method, '_readonly', True)
+
+
 def make_wrapper(decorator, method, old_api, new_api):
     """ Return a wrapper method for `method`. """
     def wrapper(self, *args, **kwargs):
@@ -712,6 +727,9 @@ class Environment(object):
         self.prefetch = defaultdict(set)    # {model_name: set(id), ...}
         self.computed = defaultdict(set)    # {field: set(id), ...}
         self.dirty = defaultdict(set)       # {record: set(field_name), ...}
+        self.prefetch_pending = {}          # {field: set(id), ...}
+        self.prefetched = {}                # {field: set(id), ...}
+        self.prefetch_heavy = set()         # {field, ...}
         self.all = envs
         envs.add(self)
         return self
@@ -808,6 +826,8 @@ class Environment(object):
             env.prefetch.clear()
             env.computed.clear()
             env.dirty.clear()
+            env.prefetch_pending.clear()
+            env.prefetched.clear()
 
     def clear(self):
         """ Clear all record caches, and discard all fields to recompute.
@@ -859,10 +879,36 @@ class Environment(object):
         return bool(self.all.todo)
 
     def get_todo(self):
-        """ Return a pair `(field, records)` to recompute. """
-        for field, recs_list in self.all.todo.iteritems():
+        """ Return a pair `(field, records)` to recompute. A field is not
+            returned while a field it depends on remains to recompute, unless
+            they depend on each other.
+        """
+        todo = self.all.todo
+        blocked = set()
+        for field in todo:
+            blocked.update(dep for dep in self._get_dependents(field) if dep is not field)
+        for field, recs_list in todo.iteritems():
+            if field not in blocked:
+                return field, recs_list[0]
+        for field, recs_list in todo.iteritems():
             return field, recs_list[0]
 
+    def _get_dependents(self, field):
+        """ Return the set of fields that depend on `field`, directly or
+            transitively.
+        """
+        dependents = self.all.dependents.get(field)
+        if dependents is None:
+            dependents = set()
+            stack = [field]
+            while stack:
+                for dep in stack.pop().dependents:
+                    if dep not in dependents:
+                        dependents.add(dep)
+                        stack.append(dep)
+            self.all.dependents[field] = dependents
+        return dependents
+
     def check_cache(self):
         """ Check the cache consistency. """
         # make a full copy of the cache, and invalidate it
@@ -909,6 +955,8 @@ class Environments(object):
     def __init__(self):
         self.envs = WeakSet()           # weak set of environments
         self.todo = {}                  # recomputations {field: [records]}
+        self.dependents = {}            # transitive dependents {field: set(fields)}
+        self.store_todo = {}            # old-style recomputations {cr: {(priority, model, field): ids}}
         self.mode = False               # flag for draft/onchange
         self.recompute = True
 
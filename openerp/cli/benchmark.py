@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import sys
+import time
+
+import openerp
+from . import Command
+
+DEFAULT_REPORTS = ['sale.report_saleorder', 'account.report_invoice']
+
+
+class Benchmark(Command):
+    """Compare the rendering time of QWeb reports, interpreted and compiled"""
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog="%s benchmark" % sys.argv[0].split(os.path.sep)[-1],
+            description=self.__doc__
+        )
+        parser.add_argument("-d", "--database", dest="db_name", required=True,
+                            help="Database on which the reports are rendered")
+        parser.add_argument("--report", dest="reports", action="append",
+                            help="Name of a QWeb report to render, may be repeated "
+                                 "(default: %s)" % ", ".join(DEFAULT_REPORTS))
+        parser.add_argument("--limit", type=int, default=20,
+                            help="Number of records rendered by each report (default: 20)")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Number of renderings for each mode (default: 5)")
+
+        args, unknown = parser.parse_known_args(args=cmdargs)
+        openerp.tools.config.parse_config(unknown)
+
+        registry = openerp.modules.registry.RegistryManager.get(args.db_name)
+        with openerp.api.Environment.manage():
+            cr = registry.cursor()
+            try:
+                for report_name in args.reports or DEFAULT_REPORTS:
+                    self.benchmark(cr, registry, report_name, args.limit, args.repeat)
+            finally:
+                cr.rollback()
+                cr.close()
+
+    def benchmark(self, cr, registry, report_name, limit, repeat):
+        uid = openerp.SUPERUSER_ID
+        Report = registry['report']
+        ReportXml = registry['ir.actions.report.xml']
+        if not ReportXml.search(cr, uid, [('report_name', '=', report_name)]):
+            print "%s: report not found, skipped" % report_name
+            return
+        report = Report._get_report_from_name(cr, uid, report_name)
+        ids = registry[report.model].search(cr, uid, [], limit=limit)
+        if not ids:
+            print "%s: no %s record, skipped" % (report_name, report.model)
+            return
+
+        qweb = registry['ir.qweb']
+        timings = {}
+        outputs = {}
+        try:
+            for compiled in (False, True):
+                qweb._compile = compiled
+                # the first rendering loads the templates and warms the caches
+                outputs[compiled] = Report.get_html(cr, uid, ids, report_name)
+                start = time.time()
+                for _ in xrange(repeat):
+                    Report.get_html(cr, uid, ids, report_name)
+                timings[compiled] = (time.time() - start) / repeat
+        finally:
+            del qweb._compile
+
+        print "%s (%d records, %d renderings)" % (report_name, len(ids), repeat)
+        print "    interpreted: %8.3f s" % timings[False]
+        print "    compiled:    %8.3f s (x%.2f)" % (timings[True], timings[False] / (timings[True] or 1e-9))
+        if outputs[False] != outputs[True]:
+            print "    WARNING: the outputs differ"
@@ -807,9 +807,13 @@ class Field(object):
         record.ensure_one()
 
         try:
-            return record._cache[self]
+            value = record._cache[self]
         except KeyError:
             pass
+        else:
+            if record.env.prefetched:
+                record._prefetch_hit(self)
+            return value
 
         # cache miss, retrieve value
         if record.id:
@@ -3,13 +3,16 @@
 # OpenERP HTTP layer
 #----------------------------------------------------------
 import ast
+import cPickle
 import collections
 import contextlib
 import datetime
 import errno
 import functools
 import getpass
+import hashlib
 import inspect
+import itertools
 import logging
 import mimetypes
 import os
@@ -49,6 +52,9 @@ from openerp.tools.func import lazy_property
 from openerp.tools import ustr
 
 _logger = logging.getLogger(__name__)
+
+# minimal size of the chunks sent by streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
 rpc_request = logging.getLogger(__name__ + '.rpc.request')
 rpc_response = logging.getLogger(__name__ + '.rpc.response')
 
@@ -176,6 +182,13 @@ class WebRequest(object):
         :class:`~collections.Mapping` of request parameters, not generally
         useful as they're provided directly to the handler method as keyword
         arguments
+
+    .. attribute:: readonly
+
+        whether the request does not write to the database, in which case
+        :attr:`cr` may be opened on a replica of the database; this is set
+        from the ``readonly`` option of the route, and may be changed by the
+        handler before it first accesses :attr:`cr`
     """
     def __init__(self, httprequest):
         self.httprequest = httprequest
@@ -185,7 +198,10 @@ class WebRequest(object):
         self.uid = None
         self.endpoint = None
         self.auth_method = None
+        self.readonly = False
         self._cr = None
+        # body of a streamed response, see stream()
+        self._stream = None
 
         # prevents transaction commit, use when you catch an exception during handling
         self._failed = None
@@ -237,7 +253,7 @@ class WebRequest(object):
         # can not be a lazy_property because manual rollback in _call_function
         # if already set (?)
         if not self._cr:
-            self._cr = self.registry.cursor()
+            self._cr = self.registry.cursor(readonly=self.readonly)
         return self._cr
 
     def __enter__(self):
@@ -245,16 +261,63 @@ class WebRequest(object):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self._stream is not None:
+            # the request is closed once the streamed response is sent
+            return
+        self._close(exc_type is None)
+
+    def _close(self, success):
         _request_stack.pop()
 
         if self._cr:
-            if exc_type is None and not self._failed:
+            if success and not self._failed:
                 self._cr.commit()
             self._cr.close()
         # just to be sure no one tries to re-use the request
         self.disable_db = True
         self.uid = None
 
+    def stream(self, chunks):
+        """ Returns a response body sending the strings generated by
+        ``chunks`` with a bounded memory footprint. The request, its cursor
+        and environments stay open until the body is entirely sent or
+        closed, so that ``chunks`` may be generated from the database while
+        the response is sent.
+
+        The first chunk is generated immediately, so that errors at the start
+        of the generation are handled like errors in the handler.
+        """
+        chunks = iter(chunks)
+        try:
+            first = next(chunks)
+        except StopIteration:
+            return []
+        self._stream = werkzeug.wsgi.ClosingIterator(
+            self._stream_chunks(itertools.chain([first], chunks)), self._close_stream)
+        return self._stream
+
+    def _stream_chunks(self, chunks):
+        with openerp.api.Environment.manage():
+            try:
+                buf, size = [], 0
+                for chunk in chunks:
+                    buf.append(chunk)
+                    size += len(chunk)
+                    if size >= STREAM_CHUNK_SIZE:
+                        yield "".join(buf)
+                        buf, size = [], 0
+                if buf:
+                    yield "".join(buf)
+            except Exception, e:
+                self._failed = e
+                _logger.exception("Error while streaming the response to %s", self.httprequest.url)
+                raise
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream = None
+            self._close(True)
+
     def set_handler(self, endpoint, arguments, auth):
         # is this needed ?
         arguments = dict((k, v) for k, v in arguments.iteritems()
@@ -263,6 +326,7 @@ class WebRequest(object):
         endpoint.arguments = arguments
         self.endpoint = endpoint
         self.auth_method = auth
+        self.readonly = endpoint.routing.get('readonly', False)
 
 
     def _handle_exception(self, exception):
@@ -381,6 +445,8 @@ def route(route=None, **kw):
     :param methods: A sequence of http methods this route applies to. If not
                     specified, all methods are allowed.
     :param cors: The Access-Control-Allow-Origin cors directive value.
+    :param readonly: Whether the method does not write to the database; its
+                     cursor may then be opened on a replica of the database.
     """
     routing = kw.copy()
     assert not 'type' in routing or routing['type'] in ("http", "json")
@@ -909,6 +975,10 @@ class Model(object):
         return proxy
 
 class OpenERPSession(werkzeug.contrib.sessions.Session):
+    # digest and time of the last write of the stored session, see SessionStore
+    _digest = None
+    _timestamp = None
+
     def __init__(self, *args, **kwargs):
         self.inited = False
         self.modified = False
@@ -1151,17 +1221,259 @@ class OpenERPSession(werkzeug.contrib.sessions.Session):
         saved_actions = self.get('saved_actions', {})
         return saved_actions.get("actions", {}).get(key)
 
-def session_gc(session_store):
-    if random.random() < 0.001:
-        # we keep session one week
-        last_week = time.time() - 60*60*24*7
-        for fname in os.listdir(session_store.path):
-            path = os.path.join(session_store.path, fname)
+#----------------------------------------------------------
+# Session stores
+#----------------------------------------------------------
+# sessions unused for a week are removed
+SESSION_LIFETIME = 60 * 60 * 24 * 7
+# delay between two removals of the expired sessions, in seconds
+SESSION_GC_INTERVAL = 60 * 60
+# the use of an unmodified session is recorded at most once in this delay
+SESSION_TOUCH_INTERVAL = 60 * 60
+
+class SessionStore(werkzeug.contrib.sessions.SessionStore):
+    """ Base class of the stores of http sessions, which are registered by
+    name in :data:`session_stores` and selected with the ``session_store``
+    option. Sessions are pickled, and only written when their content
+    changes. A store implements:
+
+    * ``_read(sid)``, returning the pickled session ``sid`` and the time it
+      was last written or touched, or ``None``;
+    * ``_write(sid, data)``, storing the pickled session ``sid``;
+    * ``_touch(sid)``, recording that the session ``sid`` is still in use;
+    * ``delete(session)``;
+    * ``gc(max_lifetime)``, removing the sessions that were not written nor
+      touched for ``max_lifetime`` seconds.
+    """
+    @classmethod
+    def create(cls, session_class):
+        """ Returns the store configured by the server options. """
+        raise NotImplementedError()
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+        stored = self._read(sid)
+        data = {}
+        if stored is not None:
+            try:
+                data = cPickle.loads(stored[0])
+            except Exception:
+                stored = None
+        session = self.session_class(data, sid, False)
+        if stored is not None:
+            session._digest = hashlib.sha1(stored[0]).digest()
+            session._timestamp = stored[1]
+        return session
+
+    def save(self, session):
+        data = cPickle.dumps(dict(session), cPickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).digest()
+        if digest == session._digest:
+            self.touch(session)
+            return
+        self._write(session.sid, data)
+        session._digest = digest
+        session._timestamp = time.time()
+
+    def touch(self, session):
+        """ Records that the unmodified ``session`` is in use. """
+        if session._timestamp and session._timestamp < time.time() - SESSION_TOUCH_INTERVAL:
+            self._touch(session.sid)
+            session._timestamp = time.time()
+
+    def gc(self, max_lifetime):
+        raise NotImplementedError()
+
+class FilesystemSessionStore(SessionStore):
+    """ Stores each session in a file of the directory ``path``. The files are
+    spread in subdirectories named after the first characters of the
+    session ids, and their modification time is the last use of the session.
+    """
+    filename_template = 'werkzeug_%s.sess'
+
+    def __init__(self, path, session_class=None):
+        super(FilesystemSessionStore, self).__init__(session_class)
+        self.path = path
+
+    @classmethod
+    def create(cls, session_class):
+        path = openerp.tools.config.session_dir
+        _logger.debug('HTTP sessions stored in: %s', path)
+        return cls(path, session_class=session_class)
+
+    def get_session_filename(self, sid):
+        return os.path.join(self.path, sid[:2], self.filename_template % sid)
+
+    def _read(self, sid):
+        try:
+            f = open(self.get_session_filename(sid), 'rb')
+        except IOError:
+            return self._migrate(sid)
+        with f:
+            return f.read(), os.fstat(f.fileno()).st_mtime
+
+    def _migrate(self, sid):
+        """ Moves the session ``sid`` stored in the main directory by previous
+        versions to its subdirectory.
+        """
+        path = os.path.join(self.path, self.filename_template % sid)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+        self._write(sid, data)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return data, time.time()
+
+    def _write(self, sid, data):
+        filename = self.get_session_filename(sid)
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
             try:
-                if os.path.getmtime(path) < last_week:
-                    os.unlink(path)
+                os.makedirs(dirname, 0700)
             except OSError:
-                pass
+                pass                    # created concurrently
+        fd, tmp = tempfile.mkstemp(suffix='.__wz_sess', dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(tmp, filename)
+        except OSError:
+            pass
+
+    def _touch(self, sid):
+        try:
+            os.utime(self.get_session_filename(sid), None)
+        except OSError:
+            pass
+
+    def delete(self, session):
+        try:
+            os.unlink(self.get_session_filename(session.sid))
+        except OSError:
+            pass
+
+    def gc(self, max_lifetime):
+        # directories may not be removed: their modification time is only
+        # changed when files are added, and unlink() fails on them anyway
+        deadline = time.time() - max_lifetime
+        dirnames = [self.path] + [
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if len(name) == 2
+        ]
+        for dirname in dirnames:
+            for fname in os.listdir(dirname):
+                path = os.path.join(dirname, fname)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.unlink(path)
+                except OSError:
+                    pass
+
+class PostgresSessionStore(SessionStore):
+    """ Stores the sessions in the table ``http_session`` of the database
+    ``dbname``, with an index on their last use.
+    """
+    def __init__(self, dbname, session_class=None):
+        super(PostgresSessionStore, self).__init__(session_class)
+        self.dbname = dbname
+        with self._cursor() as cr:
+            cr.execute("SELECT 1 FROM pg_class WHERE relname = 'http_session' AND relkind = 'r'")
+            if not cr.fetchone():
+                try:
+                    cr.execute("""CREATE TABLE http_session (
+                                      sid varchar PRIMARY KEY,
+                                      data bytea NOT NULL,
+                                      write_date timestamp NOT NULL DEFAULT (now() at time zone 'UTC'))""",
+                               log_exceptions=False)
+                    cr.execute("CREATE INDEX http_session_write_date_index ON http_session (write_date)")
+                except psycopg2.ProgrammingError:
+                    pass                # created concurrently
+
+    @classmethod
+    def create(cls, session_class):
+        dbname = openerp.tools.config.get('session_store_db') or openerp.tools.config['db_name']
+        if not dbname:
+            raise ValueError("The postgresql session store requires the option session_store_db")
+        _logger.debug('HTTP sessions stored in database: %s', dbname)
+        return cls(dbname, session_class=session_class)
+
+    def _cursor(self):
+        cr = openerp.sql_db.db_connect(self.dbname).cursor()
+        cr.autocommit(True)
+        return cr
+
+    def _read(self, sid):
+        with self._cursor() as cr:
+            cr.execute("SELECT data, extract(epoch from write_date) FROM http_session WHERE sid = %s", (sid,))
+            row = cr.fetchone()
+        return row and (str(row[0]), row[1])
+
+    def _write(self, sid, data):
+        with self._cursor() as cr:
+            update = """UPDATE http_session SET data = %s, write_date = now() at time zone 'UTC'
+                        WHERE sid = %s"""
+            cr.execute(update, (psycopg2.Binary(data), sid))
+            if not cr.rowcount:
+                try:
+                    cr.execute("INSERT INTO http_session (sid, data) VALUES (%s, %s)",
+                               (sid, psycopg2.Binary(data)), log_exceptions=False)
+                except psycopg2.IntegrityError:
+                    # inserted concurrently
+                    cr.execute(update, (psycopg2.Binary(data), sid))
+
+    def _touch(self, sid):
+        with self._cursor() as cr:
+            cr.execute("UPDATE http_session SET write_date = now() at time zone 'UTC' WHERE sid = %s", (sid,))
+
+    def delete(self, session):
+        with self._cursor() as cr:
+            cr.execute("DELETE FROM http_session WHERE sid = %s", (session.sid,))
+
+    def gc(self, max_lifetime):
+        with self._cursor() as cr:
+            cr.execute("""DELETE FROM http_session
+                          WHERE write_date < (now() at time zone 'UTC') - %s * interval '1 second'""",
+                       (max_lifetime,))
+
+# session stores by name, see the option session_store
+session_stores = {
+    'filesystem': FilesystemSessionStore,
+    'postgresql': PostgresSessionStore,
+}
+
+_session_gc_lock = threading.Lock()
+_session_gc_pid = None
+
+def session_gc(session_store):
+    """ Starts the thread removing the expired sessions of ``session_store``
+    in the current process, if it is not running yet.
+    """
+    global _session_gc_pid
+    with _session_gc_lock:
+        if _session_gc_pid == os.getpid():
+            return
+        _session_gc_pid = os.getpid()
+
+    def run():
+        # spread the collections of the processes sharing the store
+        time.sleep(random.uniform(0, SESSION_GC_INTERVAL))
+        while True:
+            try:
+                session_store.gc(SESSION_LIFETIME)
+            except Exception:
+                _logger.exception("Failed to remove the expired HTTP sessions")
+            time.sleep(SESSION_GC_INTERVAL)
+
+    thread = threading.Thread(target=run, name="openerp.http.session_gc")
+    thread.setDaemon(True)
+    thread.start()
 
 #----------------------------------------------------------
 # WSGI Layer
@@ -1182,6 +1494,9 @@ class Response(werkzeug.wrappers.Response):
     :param dict qcontext: Rendering context to use
     :param int uid: User id to use for the ir.ui.view render call,
                     ``None`` to use the request's user (the default)
+    :param bool streamed: whether the template is sent while it is rendered
+                        (see :meth:`WebRequest.stream`) instead of being
+                        rendered entirely before being sent
 
     these attributes are available as parameters on the Response object and
     can be altered at any time before rendering
@@ -1194,13 +1509,15 @@ class Response(werkzeug.wrappers.Response):
         template = kw.pop('template', None)
         qcontext = kw.pop('qcontext', None)
         uid = kw.pop('uid', None)
+        streamed = kw.pop('streamed', False)
         super(Response, self).__init__(*args, **kw)
-        self.set_default(template, qcontext, uid)
+        self.set_default(template, qcontext, uid, streamed)
 
-    def set_default(self, template=None, qcontext=None, uid=None):
+    def set_default(self, template=None, qcontext=None, uid=None, streamed=False):
         self.template = template
         self.qcontext = qcontext or dict()
         self.uid = uid
+        self.streamed = streamed
         # Support for Cross-Origin Resource Sharing
         if request.endpoint and 'cors' in request.endpoint.routing:
             self.headers.set('Access-Control-Allow-Origin', request.endpoint.routing['cors'])
@@ -1215,20 +1532,24 @@ class Response(werkzeug.wrappers.Response):
     def is_qweb(self):
         return self.template is not None
 
-    def render(self):
-        """ Renders the Response's template, returns the result
+    def render(self, stream=False):
+        """ Renders the Response's template, returns the result, or an
+        iterator of chunks if ``stream`` is set
         """
         view_obj = request.registry["ir.ui.view"]
         uid = self.uid or request.uid or openerp.SUPERUSER_ID
         return view_obj.render(
             request.cr, uid, self.template, self.qcontext,
-            context=request.context)
+            context=request.context, stream=stream)
 
     def flatten(self):
         """ Forces the rendering of the response's template, sets the result
         as response body and unsets :attr:`.template`
         """
-        self.response.append(self.render())
+        if self.streamed:
+            self.response = request.stream(self.render(stream=True))
+        else:
+            self.response.append(self.render())
         self.template = None
 
 class DisableCacheMiddleware(object):
@@ -1262,9 +1583,8 @@ class Root(object):
     @lazy_property
     def session_store(self):
         # Setup http sessions
-        path = openerp.tools.config.session_dir
-        _logger.debug('HTTP sessions stored in: %s', path)
-        return werkzeug.contrib.sessions.FilesystemSessionStore(path, session_class=OpenERPSession)
+        store = session_stores[openerp.tools.config.get('session_store') or 'filesystem']
+        return store.create(OpenERPSession)
 
     @lazy_property
     def nodb_routing_map(self):
@@ -1369,6 +1689,8 @@ class Root(object):
 
         if httprequest.session.should_save:
             self.session_store.save(httprequest.session)
+        else:
+            self.session_store.touch(httprequest.session)
         # We must not set the cookie if the session id was specified using a http header or a GET parameter.
         # There are two reasons to this:
         # - When using one of those two means we consider that we are overriding the cookie, which means creating a new
@@ -1424,6 +1746,9 @@ class Root(object):
                     result = _dispatch_nodb()
 
                 response = self.get_response(httprequest, result, explicit_session)
+                if request._stream is not None and getattr(response, 'response', None) is not request._stream:
+                    # the streamed body is not sent, close the request now
+                    request._stream = None
             return response(environ, start_response)
 
         except werkzeug.exceptions.HTTPException, e:
@@ -1474,12 +1799,15 @@ def db_monodb(httprequest=None):
     return None
 
 def send_file(filepath_or_fp, mimetype=None, as_attachment=False, filename=None, mtime=None,
-              add_etags=True, cache_timeout=STATIC_CACHE, conditional=True):
+              add_etags=True, cache_timeout=STATIC_CACHE, conditional=True, etag=None):
     """This is a modified version of Flask's send_file()
 
     Sends the contents of a file to the client. This will use the
     most efficient method available and configured.  By default it will
-    try to use the WSGI server's file_wrapper support.
+    try to use the WSGI server's file_wrapper support.  When the option
+    ``x_sendfile`` of the configuration file is set to ``X-Sendfile`` or
+    ``X-Accel-Redirect``, files given by path are sent by the front-end web
+    server instead.
 
     By default it will try to guess the mimetype for you, but you can
     also explicitly provide one.  For extra security you probably want
@@ -1487,6 +1815,9 @@ def send_file(filepath_or_fp, mimetype=None, as_attachment=False, filename=None,
     guessing requires a `filename` or an `attachment_filename` to be
     provided.
 
+    Conditional responses also honor single byte ranges (``Range`` and
+    ``If-Range`` headers), for resuming downloads and seeking in media.
+
     Please never pass filenames to this function from user sources without
     checking them first.
 
@@ -1505,23 +1836,27 @@ def send_file(filepath_or_fp, mimetype=None, as_attachment=False, filename=None,
     :param mtime: last modification time to use for contitional response.
     :param add_etags: set to `False` to disable attaching of etags.
     :param conditional: set to `False` to disable conditional responses.
+    :param etag: the etag of the file, if it is known (e.g. a hash of its
+                 content), instead of one made from its mtime, size and name.
 
     :param cache_timeout: the timeout in seconds for the headers.
     """
+    filepath = None
     if isinstance(filepath_or_fp, (str, unicode)):
+        filepath = filepath_or_fp
         if not filename:
-            filename = os.path.basename(filepath_or_fp)
-        file = open(filepath_or_fp, 'rb')
+            filename = os.path.basename(filepath)
+        file = None
+        size = os.path.getsize(filepath)
         if not mtime:
-            mtime = os.path.getmtime(filepath_or_fp)
+            mtime = os.path.getmtime(filepath)
     else:
         file = filepath_or_fp
         if not filename:
             filename = getattr(file, 'name', None)
-
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
+        file.seek(0, 2)
+        size = file.tell()
+        file.seek(0)
 
     if mimetype is None and filename:
         mimetype = mimetypes.guess_type(filename)[0]
@@ -1533,11 +1868,9 @@ def send_file(filepath_or_fp, mimetype=None, as_attachment=False, filename=None,
         if filename is None:
             raise TypeError('filename unavailable, required for sending as attachment')
         headers.add('Content-Disposition', 'attachment', filename=filename)
-        headers['Content-Length'] = size
+    headers['Accept-Ranges'] = 'bytes'
 
-    data = wrap_file(request.httprequest.environ, file)
-    rv = Response(data, mimetype=mimetype, headers=headers,
-                                    direct_passthrough=True)
+    rv = Response(mimetype=mimetype, headers=headers, direct_passthrough=True)
 
     if isinstance(mtime, str):
         try:
@@ -1553,7 +1886,9 @@ def send_file(filepath_or_fp, mimetype=None, as_attachment=False, filename=None,
         rv.cache_control.max_age = cache_timeout
         rv.expires = int(time.time() + cache_timeout)
 
-    if add_etags and filename and mtime:
+    if add_etags and etag:
+        rv.set_etag(etag)
+    elif add_etags and filename and mtime:
         rv.set_etag('odoo-%s-%s-%s' % (
             mtime,
             size,
@@ -1562,14 +1897,88 @@ def send_file(filepath_or_fp, mimetype=None, as_attachment=False, filename=None,
                 else filename
             ) & 0xffffffff
         ))
-        if conditional:
-            rv = rv.make_conditional(request.httprequest)
-            # make sure we don't send x-sendfile for servers that
-            # ignore the 304 status code for x-sendfile.
-            if rv.status_code == 304:
-                rv.headers.pop('x-sendfile', None)
+    if conditional:
+        rv = rv.make_conditional(request.httprequest)
+        if rv.status_code == 304:
+            if file is not None:
+                file.close()
+            return rv
+
+    sendfile = filepath and _x_sendfile_header(filepath)
+    if sendfile:
+        # the front-end server sends the file, and handles ranges itself
+        rv.headers[sendfile[0]] = sendfile[1]
+        rv.headers.pop('Content-Length', None)
+        if file is not None:
+            file.close()
+        return rv
+
+    byte_range = _byte_range(rv, size) if conditional else None
+    if file is None:
+        file = open(filepath, 'rb')
+    if byte_range is None:
+        rv.response = wrap_file(request.httprequest.environ, file)
+        rv.headers['Content-Length'] = size
+    elif byte_range is False:
+        file.close()
+        rv.status_code = 416
+        rv.headers['Content-Range'] = 'bytes */%d' % size
+    else:
+        start, stop = byte_range
+        rv.response = _iter_file_range(file, start, stop)
+        rv.status_code = 206
+        rv.headers['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1, size)
+        rv.headers['Content-Length'] = stop - start
     return rv
 
+def _x_sendfile_header(filepath):
+    """ Return the header and its value for delegating the sending of the file
+    at ``filepath`` to the front-end web server, or ``None``. With
+    ``X-Accel-Redirect``, the front-end server must map the internal location
+    given by option ``x_sendfile_prefix`` on the data directory.
+    """
+    header = openerp.tools.config.get('x_sendfile')
+    if not header:
+        return None
+    if header.lower() == 'x-accel-redirect':
+        path = os.path.relpath(os.path.abspath(filepath), openerp.tools.config['data_dir'])
+        if path.startswith(os.pardir):
+            return None
+        prefix = openerp.tools.config.get('x_sendfile_prefix', '/x-sendfile')
+        return header, '%s/%s' % (prefix.rstrip('/'), path.replace(os.sep, '/'))
+    return header, os.path.abspath(filepath)
+
+def _byte_range(rv, size):
+    """ Return the byte range ``(start, stop)`` of a file of ``size`` bytes
+    requested by the current request, ``None`` for sending the whole file to
+    the client, or ``False`` if the range is not satisfiable.
+    """
+    httprequest = request.httprequest
+    byte_range = httprequest.range
+    if byte_range is None or byte_range.units != 'bytes' or len(byte_range.ranges) != 1:
+        return None
+    if_range = httprequest.headers.get('If-Range')
+    if if_range and if_range != rv.headers.get('ETag'):
+        # the file has changed since the client got its start
+        return None
+    return byte_range.range_for_length(size) or False
+
+def _iter_file_range(file, start, stop, buffer_size=8192):
+    """ Generate the content of ``file`` between offsets ``start`` and
+    ``stop``, and close it.
+    """
+    try:
+        file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = file.read(min(buffer_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
+
 #----------------------------------------------------------
 # RPC controller
 #----------------------------------------------------------
@@ -65,6 +65,7 @@ from .exceptions import except_orm, AccessError, MissingError, ValidationError
 from .osv import fields
 from .osv.query import Query
 from .tools import frozendict, lazy_property, ormcache
+from .tools.cache import PREFETCH_STAT, RECOMPUTE_STAT
 from .tools.config import config
 from .tools.func import frame_codeinfo
 from .tools.misc import CountingStream, DEFAULT_SERVER_DATETIME_FORMAT, DEFAULT_SERVER_DATE_FORMAT
@@ -262,8 +263,22 @@ class NewId(object):
 IdType = (int, long, basestring, NewId)
 
 
-# maximum number of prefetched records
+# minimum and maximum number of prefetched records; the actual number adapts
+# to the way each field is accessed
 PREFETCH_MAX = 200
+PREFETCH_LIMIT = 1000
+
+# types of columns only prefetched once they have been read in the environment
+PREFETCH_HEAVY_TYPES = ('text', 'html')
+
+# maximum number of rows inserted by a single INSERT query
+INSERT_BATCH_SIZE = 100
+
+# maximum number of records created together when loading data
+LOAD_BATCH_SIZE = 1000
+
+# number of records exported together by _export_data_iter()
+EXPORT_BATCH_SIZE = 1000
 
 # special columns automatically created by the ORM
 LOG_ACCESS_COLUMNS = ['create_uid', 'create_date', 'write_uid', 'write_date']
@@ -309,6 +324,9 @@ class BaseModel(object):
     _parent_name = 'parent_id'
     _parent_store = False
     _parent_order = False
+    # maintain the materialized path of each record in column parent_path,
+    # like "1/5/12/", used by the operators child_of and parent_of
+    _parent_path = False
     _date_name = 'date'
     _order = 'id'
     _sequence = None
@@ -344,6 +362,11 @@ class BaseModel(object):
     # {model_name: field_names, ...}
     _depends = {}
 
+    # set to True to keep the values of stored columns in a cache shared by
+    # all the transactions on the database; this is meant for read-mostly
+    # models, which must only be modified through the ORM
+    _cache_shared = False
+
     CONCURRENCY_CHECK_FIELD = '__last_update'
 
     def log(self, cr, uid, id, message, secondary=False, context=None):
@@ -937,6 +960,21 @@ class BaseModel(object):
             self = self.with_context(export_raw_data=True)
         return {'datas': self.__export_rows(fields_to_export)}
 
+    @api.multi
+    def _export_data_iter(self, fields_to_export, raw_data=False, batch_size=EXPORT_BATCH_SIZE):
+        """ Generate the rows of :meth:`export_data`, exporting the records by
+            batches of ``batch_size``. The cache is cleared after each batch,
+            so that the memory used does not grow with the number of records.
+        """
+        fields_to_export = map(fix_import_export_id_paths, fields_to_export)
+        if raw_data:
+            self = self.with_context(export_raw_data=True)
+        for index in xrange(0, len(self._ids), batch_size):
+            batch = self.browse(self._ids[index:index + batch_size])
+            for row in batch.__export_rows(fields_to_export):
+                yield row
+            self.invalidate_cache()
+
     def import_data(self, cr, uid, fields, datas, mode='init', current_module='', noupdate=False, context=None, filename=None):
         """
         .. deprecated:: 7.0
@@ -993,25 +1031,44 @@ class BaseModel(object):
                 data = pickle.load(partial_import_file)
                 position = data.get(filename, 0)
 
+        # new records are created in batch, except when the import state is
+        # saved every 100 lines
+        batch_size = 1
+        if mode == 'init' and not (config.get('import_partial') and filename):
+            batch_size = self._load_batch_size(fields)
+        create_context = dict(context, install_mode=True)
+
         position = 0
         try:
-            for res_id, xml_id, res, info in self._convert_records(cr, uid,
+            records = self._convert_records(cr, uid,
                             self._extract_records(cr, uid, fields, datas,
                                                   context=context, log=log),
-                            context=context, log=log):
-                ir_model_data_obj._update(cr, uid, self._name,
-                     current_module, res, mode=mode, xml_id=xml_id,
-                     noupdate=noupdate, res_id=res_id, context=context)
-                position = info.get('rows', {}).get('to', 0) + 1
-                if config.get('import_partial') and filename and (not (position%100)):
-                    with open(config.get('import_partial'), 'rb') as partial_import:
-                        data = pickle.load(partial_import)
-                    data[filename] = position
-                    with open(config.get('import_partial'), 'wb') as partial_import:
-                        pickle.dump(data, partial_import)
-                    if context.get('defer_parent_store_computation'):
-                        self._parent_store_compute(cr)
-                    cr.commit()
+                            context=context, log=log)
+            for chunk in self._load_chunks(records, batch_size):
+                if len(chunk) > 1:
+                    try:
+                        with cr.savepoint():
+                            self.create_multi(cr, uid, [res for _id, _xid, res, _info in chunk],
+                                              context=create_context)
+                        position = chunk[-1][3].get('rows', {}).get('to', 0) + 1
+                        continue
+                    except Exception:
+                        # import the records one by one to locate the error
+                        _logger.debug("Batch import failed, retrying record by record", exc_info=True)
+                for res_id, xml_id, res, info in chunk:
+                    ir_model_data_obj._update(cr, uid, self._name,
+                         current_module, res, mode=mode, xml_id=xml_id,
+                         noupdate=noupdate, res_id=res_id, context=context)
+                    position = info.get('rows', {}).get('to', 0) + 1
+                    if config.get('import_partial') and filename and (not (position%100)):
+                        with open(config.get('import_partial'), 'rb') as partial_import:
+                            data = pickle.load(partial_import)
+                        data[filename] = position
+                        with open(config.get('import_partial'), 'wb') as partial_import:
+                            pickle.dump(data, partial_import)
+                        if context.get('defer_parent_store_computation'):
+                            self._parent_store_compute(cr)
+                        cr.commit()
         except Exception, e:
             cr.rollback()
             return -1, {}, 'Line %d : %s' % (position + 1, tools.ustr(e)), ''
@@ -1050,49 +1107,103 @@ class BaseModel(object):
         noupdate = False
 
         ids = []
-        for id, xid, record, info in self._convert_records(cr, uid,
+        broken = False
+        create_context = dict(context or {}, install_mode=True)
+        records = self._convert_records(cr, uid,
                 self._extract_records(cr, uid, fields, data,
                                       context=context, log=messages.append),
-                context=context, log=messages.append):
-            try:
-                cr.execute('SAVEPOINT model_load_save')
-            except psycopg2.InternalError, e:
-                # broken transaction, exit and hope the source error was
-                # already logged
-                if not any(message['type'] == 'error' for message in messages):
-                    messages.append(dict(info, type='error',message=
-                        u"Unknown database error: '%s'" % e))
+                context=context, log=messages.append)
+        for chunk in self._load_chunks(records, self._load_batch_size(fields)):
+            if len(chunk) > 1:
+                # create new records in batch; in case of failure, they are
+                # created one by one in order to report errors per record
+                try:
+                    with cr.savepoint():
+                        ids.extend(self.create_multi(cr, uid, [record for _id, _xid, record, _info in chunk],
+                                                     context=create_context))
+                    continue
+                except Exception:
+                    _logger.debug("Batch load failed, retrying record by record", exc_info=True)
+            for id, xid, record, info in chunk:
+                try:
+                    cr.execute('SAVEPOINT model_load_save')
+                except psycopg2.InternalError, e:
+                    # broken transaction, exit and hope the source error was
+                    # already logged
+                    if not any(message['type'] == 'error' for message in messages):
+                        messages.append(dict(info, type='error',message=
+                            u"Unknown database error: '%s'" % e))
+                    broken = True
+                    break
+                try:
+                    ids.append(ModelData._update(cr, uid, self._name,
+                         current_module, record, mode=mode, xml_id=xid,
+                         noupdate=noupdate, res_id=id, context=context))
+                    cr.execute('RELEASE SAVEPOINT model_load_save')
+                except psycopg2.Warning, e:
+                    messages.append(dict(info, type='warning', message=str(e)))
+                    cr.execute('ROLLBACK TO SAVEPOINT model_load_save')
+                except psycopg2.Error, e:
+                    messages.append(dict(
+                        info, type='error',
+                        **PGERROR_TO_OE[e.pgcode](self, fg, info, e)))
+                    # Failed to write, log to messages, rollback savepoint (to
+                    # avoid broken transaction) and keep going
+                    cr.execute('ROLLBACK TO SAVEPOINT model_load_save')
+                except Exception, e:
+                    message = (_('Unknown error during import:') +
+                               ' %s: %s' % (type(e), unicode(e)))
+                    moreinfo = _('Resolve other errors first')
+                    messages.append(dict(info, type='error',
+                                         message=message,
+                                         moreinfo=moreinfo))
+                    # Failed for some reason, perhaps due to invalid data supplied,
+                    # rollback savepoint and keep going
+                    cr.execute('ROLLBACK TO SAVEPOINT model_load_save')
+            if broken:
                 break
-            try:
-                ids.append(ModelData._update(cr, uid, self._name,
-                     current_module, record, mode=mode, xml_id=xid,
-                     noupdate=noupdate, res_id=id, context=context))
-                cr.execute('RELEASE SAVEPOINT model_load_save')
-            except psycopg2.Warning, e:
-                messages.append(dict(info, type='warning', message=str(e)))
-                cr.execute('ROLLBACK TO SAVEPOINT model_load_save')
-            except psycopg2.Error, e:
-                messages.append(dict(
-                    info, type='error',
-                    **PGERROR_TO_OE[e.pgcode](self, fg, info, e)))
-                # Failed to write, log to messages, rollback savepoint (to
-                # avoid broken transaction) and keep going
-                cr.execute('ROLLBACK TO SAVEPOINT model_load_save')
-            except Exception, e:
-                message = (_('Unknown error during import:') +
-                           ' %s: %s' % (type(e), unicode(e)))
-                moreinfo = _('Resolve other errors first')
-                messages.append(dict(info, type='error',
-                                     message=message,
-                                     moreinfo=moreinfo))
-                # Failed for some reason, perhaps due to invalid data supplied,
-                # rollback savepoint and keep going
-                cr.execute('ROLLBACK TO SAVEPOINT model_load_save')
         if any(message['type'] == 'error' for message in messages):
             cr.execute('ROLLBACK TO SAVEPOINT model_load')
             ids = False
         return {'ids': ids, 'messages': messages}
 
+    def _load_batch_size(self, fields):
+        """ Return the number of new records that may be created together when
+            importing the given field paths. Records are created one by one
+            when they may refer to records of the same model imported before
+            them.
+        """
+        if not self._create_multi_supported():
+            return 1
+        models = [self._name] + self._inherits.keys()
+        for path in fields:
+            field = self._fields.get(path[0])
+            if field and field.relational and field.comodel_name in models:
+                return 1
+        return LOAD_BATCH_SIZE
+
+    def _load_chunks(self, records, batch_size):
+        """ Group the converted records generated by :meth:`~._convert_records`
+            into lists: consecutive records without external nor database id
+            are grouped by at most ``batch_size``, the other records are alone
+            in their list.
+        """
+        chunk = []
+        for record in records:
+            dbid, xid = record[:2]
+            if dbid or xid:
+                if chunk:
+                    yield chunk
+                    chunk = []
+                yield [record]
+            else:
+                chunk.append(record)
+                if len(chunk) >= batch_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
     def _extract_records(self, cr, uid, fields_, data,
                          context=None, log=lambda a: None):
         """ Generates record dicts from the data sequence.
@@ -1609,6 +1720,7 @@ class BaseModel(object):
         return self.pool['ir.ui.view'].postprocess_and_fields(
             cr, uid, self._name, node, view_id, context=context)
 
+    @api.readonly
     def search_count(self, cr, user, args, context=None):
         """ search_count(args) -> int
 
@@ -1815,7 +1927,7 @@ class BaseModel(object):
         """
         try:
             self.pool.cache.clear_prefix((self._name,))
-            self.pool._any_cache_cleared = True
+            self.pool.cache_cleared(self._name)
         except AttributeError:
             pass
 
@@ -2033,6 +2145,7 @@ class BaseModel(object):
         del data['id']
         return data
 
+    @api.readonly
     def read_group(self, cr, uid, domain, fields, groupby, offset=0, limit=None, context=None, orderby=False, lazy=True):
         """
         Get the list of records in list view grouped by the given ``groupby`` fields
@@ -2191,6 +2304,8 @@ class BaseModel(object):
         return '%s."%s"' % (parent_alias, field)
 
     def _parent_store_compute(self, cr):
+        if self._parent_path:
+            self._parent_path_compute(cr)
         if not self._parent_store:
             return
         _logger.info('Computing parent left and right for table %s...', self._table)
@@ -2217,6 +2332,55 @@ class BaseModel(object):
         self.invalidate_cache(cr, SUPERUSER_ID, ['parent_left', 'parent_right'])
         return True
 
+    def _parent_path_compute(self, cr):
+        """ Compute the column parent_path of all the records. """
+        _logger.info('Computing parent path for table %s...', self._table)
+        query = """
+            WITH RECURSIVE tree(id, path) AS (
+                    SELECT id, concat(id, '/') FROM "{table}" WHERE "{parent}" IS NULL
+                UNION ALL
+                    SELECT node.id, concat(tree.path, node.id, '/')
+                    FROM "{table}" node JOIN tree ON node."{parent}" = tree.id
+            )
+            UPDATE "{table}" SET parent_path = tree.path
+            FROM tree WHERE "{table}".id = tree.id
+        """.format(table=self._table, parent=self._parent_name)
+        cr.execute(query)
+        return True
+
+    def _parent_path_create(self, cr, ids):
+        """ Set the column parent_path of the new records ``ids``. """
+        query = """
+            UPDATE "{table}" node
+            SET parent_path = concat((SELECT parent.parent_path FROM "{table}" parent
+                                      WHERE parent.id = node."{parent}"), node.id, '/')
+            WHERE node.id IN %s
+        """.format(table=self._table, parent=self._parent_name)
+        for sub_ids in cr.split_for_in_conditions(ids):
+            cr.execute(query, (sub_ids,))
+
+    def _parent_path_move(self, cr, ids):
+        """ Update the column parent_path of the records ``ids`` whose parent
+        has changed, and of their descendants.
+        """
+        query = """
+            SELECT node.parent_path, concat(parent.parent_path, node.id, '/')
+            FROM "{table}" node LEFT JOIN "{table}" parent ON node."{parent}" = parent.id
+            WHERE node.id = %s
+        """.format(table=self._table, parent=self._parent_name)
+        for id in ids:
+            cr.execute(query, (id,))
+            old_path, new_path = cr.fetchone()
+            if old_path == new_path:
+                continue
+            if not old_path:
+                cr.execute('UPDATE "%s" SET parent_path=%%s WHERE id=%%s' % self._table, (new_path, id))
+                continue
+            if new_path.startswith(old_path):
+                raise except_orm(_('UserError'), _('Recursivity Detected.'))
+            cr.execute('UPDATE "%s" SET parent_path=%%s || substr(parent_path, %%s) WHERE parent_path LIKE %%s' % self._table,
+                       (new_path, len(old_path) + 1, old_path + '%'))
+
     def _update_store(self, cr, f, k):
         _logger.info("storing computed values of fields.function '%s'", k)
         ss = self._columns[k]._symbol_set
@@ -2429,6 +2593,7 @@ class BaseModel(object):
         context = dict(context or {}, prefetch_fields=False)
 
         store_compute = False
+        path_compute = False
         stored_fields = []              # new-style stored fields with compute
         todo_end = []
         update_custom_fields = context.get('update_custom_fields', False)
@@ -2448,6 +2613,10 @@ class BaseModel(object):
                 if not self._parent_columns_exist(cr):
                     self._create_parent_columns(cr)
                     store_compute = True
+            if self._parent_path:
+                if not self._parent_path_column_exists(cr):
+                    self._create_parent_path_column(cr)
+                    path_compute = True
 
             self._check_removed_columns(cr, log=False)
 
@@ -2670,6 +2839,9 @@ class BaseModel(object):
         if store_compute:
             self._parent_store_compute(cr)
             cr.commit()
+        elif path_compute:
+            self._parent_path_compute(cr)
+            cr.commit()
 
         if stored_fields:
             # trigger computation of new-style stored fields with a compute
@@ -2714,6 +2886,26 @@ class BaseModel(object):
         return cr.rowcount
 
 
+    def _parent_path_column_exists(self, cr):
+        cr.execute("""SELECT c.relname
+            FROM pg_class c, pg_attribute a
+            WHERE c.relname=%s AND a.attname=%s AND c.oid=a.attrelid
+            """, (self._table, 'parent_path'))
+        return cr.rowcount
+
+
+    def _create_parent_path_column(self, cr):
+        cr.execute('ALTER TABLE "%s" ADD COLUMN "parent_path" VARCHAR' % (self._table,))
+        # text_pattern_ops makes the index usable by "parent_path LIKE '1/5/%'"
+        cr.execute('CREATE INDEX "%s_parent_path_index" ON "%s" ("parent_path" text_pattern_ops)' % (self._table, self._table))
+        _schema.debug("Table '%s': added column '%s' with definition=%s",
+            self._table, 'parent_path', 'VARCHAR')
+        if self._columns[self._parent_name].ondelete not in ('cascade', 'restrict'):
+            _logger.error("The column %s on object %s must be set as ondelete='cascade' or 'restrict'",
+                          self._parent_name, self._name)
+        cr.commit()
+
+
     def _create_parent_columns(self, cr):
         cr.execute('ALTER TABLE "%s" ADD COLUMN "parent_left" INTEGER' % (self._table,))
         cr.execute('ALTER TABLE "%s" ADD COLUMN "parent_right" INTEGER' % (self._table,))
@@ -3180,27 +3372,49 @@ class BaseModel(object):
         """ Read from the database in order to fetch `field` (:class:`Field`
             instance) for `self` in cache.
         """
+        env = self.env
+
         # fetch the records of this model without field_name in their cache
         records = self._in_cache_without(field)
 
-        if len(records) > PREFETCH_MAX:
-            records = records[:PREFETCH_MAX] | self
+        # the number of prefetched records grows while the records left aside
+        # by the previous prefetching of the field are read, and shrinks back
+        # otherwise
+        stat = PREFETCH_STAT[(self._cr.dbname, self._name, field.name)]
+        if set(self._ids) <= env.prefetch_pending.get(field, set()):
+            stat.size = min(max(stat.size, PREFETCH_MAX) * 2, PREFETCH_LIMIT)
+        else:
+            stat.size = max(stat.size // 2, PREFETCH_MAX)
+
+        if len(records) > stat.size:
+            pending = set(records._ids)
+            records = records[:stat.size] | self
+            pending.difference_update(records._ids)
+            env.prefetch_pending[field] = pending
+        else:
+            env.prefetch_pending.pop(field, None)
+
+        # heavy fields are prefetched only once they have been read
+        if self._columns[field.name]._type in PREFETCH_HEAVY_TYPES:
+            env.prefetch_heavy.add(field)
 
         # determine which fields can be prefetched
-        if not self.env.in_draft and \
+        if not env.in_draft and \
                 self._context.get('prefetch_fields', True) and \
                 self._columns[field.name]._prefetch:
             # prefetch all classic and many2one fields that the user can access
             fnames = {fname
                 for fname, fcolumn in self._columns.iteritems()
                 if fcolumn._prefetch
+                if fcolumn._type not in PREFETCH_HEAVY_TYPES or \
+                    self._fields[fname] in env.prefetch_heavy
                 if not fcolumn.groups or self.user_has_groups(fcolumn.groups)
             }
         else:
             fnames = {field.name}
 
         # important: never prefetch fields to recompute!
-        get_recs_todo = self.env.field_todo
+        get_recs_todo = env.field_todo
         for fname in list(fnames):
             if get_recs_todo(self._fields[fname]):
                 if fname == field.name:
@@ -3215,6 +3429,14 @@ class BaseModel(object):
             result = records.read(list(fnames), load='_classic_write')
         except AccessError:
             pass
+        stat.miss += 1
+        # the records fetched for the others are counted as hits once accessed
+        prefetched = set(values['id'] for values in result).difference(self._ids)
+        stat.prefetched += len(prefetched)
+        prefetched.update(env.prefetched.pop(field, ()))
+        prefetched.difference_update(self._ids)
+        if prefetched:
+            env.prefetched[field] = prefetched
 
         # check the cache, and update it if necessary
         if not self._cache.contains(field):
@@ -3225,6 +3447,18 @@ class BaseModel(object):
                 e = AccessError("No value found for %s.%s" % (self, field.name))
                 self._cache[field] = FailedValue(e)
 
+    def _prefetch_hit(self, field):
+        """ Count the access to `field` on record `self` as a hit if its value
+            was prefetched for another record.
+        """
+        env = self.env
+        ids = env.prefetched.get(field)
+        if ids and self._ids[0] in ids:
+            ids.discard(self._ids[0])
+            if not ids:
+                del env.prefetched[field]
+            PREFETCH_STAT[(self._cr.dbname, self._name, field.name)].hit += 1
+
     @api.multi
     def _read_from_database(self, field_names, inherited_field_names=[]):
         """ Read the given fields of the records in `self` from the database,
@@ -3243,6 +3477,22 @@ class BaseModel(object):
         self._apply_ir_rules(query, 'read')
         order_str = self._generate_order_by(None, query)
 
+        # take the records from the shared cache when the values can be read
+        # without access rule restriction
+        shared_cache = None
+        if self._cache_shared and not inherited_field_names and \
+                len(query.tables) == 1 and len(query.where_clause) == 1 and \
+                all(self._columns[f]._classic_write and self._columns[f]._type != 'binary'
+                    for f in field_names):
+            shared_cache = self.pool.shared_cache
+            cached = shared_cache.get(cr.dbname, self._name, self._ids, field_names, context.get('lang'))
+            for id, vals in cached.iteritems():
+                record = self.browse(id)
+                record._cache.update(record._convert_to_cache(vals, validate=False))
+            self -= self.browse(cached.keys())
+            if not self:
+                return
+
         # determine the fields that are stored as columns in tables;
         # for the sake of simplicity, discard inherited translated fields
         fields = map(self._fields.get, field_names + inherited_field_names)
@@ -3306,6 +3556,9 @@ class BaseModel(object):
                     for vals in result:
                         vals[f] = symbol_get(vals[f])
 
+            if shared_cache is not None:
+                shared_cache.update(cr, self._name, result, field_names, context.get('lang'))
+
             # store result in cache for POST fields
             for vals in result:
                 record = self.browse(vals['id'])
@@ -3630,17 +3883,8 @@ class BaseModel(object):
         # changes made in the database, like cascading delete!
         recs.invalidate_cache()
 
-        for order, obj_name, store_ids, fields in result_store:
-            if obj_name == self._name:
-                effective_store_ids = set(store_ids) - set(ids)
-            else:
-                effective_store_ids = store_ids
-            if effective_store_ids:
-                obj = self.pool[obj_name]
-                cr.execute('select id from '+obj._table+' where id IN %s', (tuple(effective_store_ids),))
-                rids = map(lambda x: x[0], cr.fetchall())
-                if rids:
-                    obj._store_set_values(cr, uid, rids, fields, context)
+        # the deleted records are skipped by the recomputation
+        self._store_todo(cr, uid, result_store, context)
 
         # recompute new-style fields
         recs.recompute()
@@ -3775,7 +4019,6 @@ class BaseModel(object):
 
         readonly = None
         self.check_field_access_rights(cr, user, 'write', vals.keys())
-        deleted_related = defaultdict(list)
         for field in vals.keys():
             fobj = None
             if field in self._columns:
@@ -3784,10 +4027,6 @@ class BaseModel(object):
                 fobj = self._inherit_fields[field][2]
             if not fobj:
                 continue
-            if fobj._type in ['one2many', 'many2many'] and vals[field]:
-                for wtuple in vals[field]:
-                    if isinstance(wtuple, (tuple, list)) and wtuple[0] == 2:
-                        deleted_related[fobj._obj].append(wtuple[1])
             groups = fobj.write
 
             if groups:
@@ -3902,6 +4141,11 @@ class BaseModel(object):
             for id in ids:
                 result += self._columns[field].set(cr, self, id, field, vals[field], user, context=rel_context) or []
 
+        # recompute once the stored function fields queued by the writes and
+        # deletions of related records, before checking the constraints
+        if upd_todo and recs.env.recompute:
+            self._store_flush(cr, user, context)
+
         # for recomputing new-style fields
         recs.modified(upd_todo)
 
@@ -3985,23 +4229,153 @@ class BaseModel(object):
                         cr.execute('update '+self._table+' set parent_left=parent_left-%s, parent_right=parent_right-%s where parent_left>=%s and parent_left<%s', (pleft-position+distance, pleft-position+distance, pleft+distance, pright+distance))
                     recs.invalidate_cache(['parent_left', 'parent_right'])
 
+        if self._parent_path and self._parent_name in vals:
+            self._parent_path_move(cr, ids)
+
         result += self._store_get_values(cr, user, ids, vals.keys(), context)
-        result.sort()
-
-        done = {}
-        for order, model_name, ids_to_update, fields_to_recompute in result:
-            key = (model_name, tuple(fields_to_recompute))
-            done.setdefault(key, {})
-            # avoid to do several times the same computation
-            todo = []
-            for id in ids_to_update:
-                if id not in done[key]:
-                    done[key][id] = True
-                    if id not in deleted_related[model_name]:
-                        todo.append(id)
-            self.pool[model_name]._store_set_values(cr, user, todo, fields_to_recompute, context)
+        self._store_todo(cr, user, result, context)
+
+        # recompute new-style fields
+        if recs.env.recompute and context.get('recompute', True):
+            recs.recompute()
+
+        self.step_workflow(cr, user, ids, context=context)
+        return True
+
+    @api.model
+    def write_multi(self, vals_by_id):
+        """ write_multi(vals_by_id)
+
+        Updates several records, each one with its own values. This is
+        equivalent to calling :meth:`~.write` on every record, but the records
+        to update with the same values are written together, and the classic
+        stored columns of the model are updated with one
+        ``UPDATE ... FROM (VALUES ...)`` query per set of columns, after which
+        the stored function fields are recomputed once for all records.
+
+        Models overriding :meth:`~.write` only benefit from the grouping of
+        records with the same values.
+
+        :param dict vals_by_id: dictionary mapping record ids to dictionaries
+            of values, see :meth:`~.write` for their format
+        """
+        # group records to update with the same values
+        groups = {}
+        for id, vals in vals_by_id.iteritems():
+            key = tuple(sorted(vals.iteritems()))
+            try:
+                hash(key)
+            except TypeError:
+                key = repr(key)
+            groups.setdefault(key, (vals, []))[1].append(int(id))
+
+        direct_vals = {}
+        if self._write_multi_supported():
+            direct_fields = self._write_multi_direct_fields()
+            for key, (vals, ids) in groups.items():
+                vals = dict(vals)
+                for field in itertools.chain(MAGIC_COLUMNS, ('parent_left', 'parent_right')):
+                    vals.pop(field, None)
+                if vals and direct_fields.issuperset(vals):
+                    direct_vals.update((id, vals) for id in ids)
+                    del groups[key]
+
+        if direct_vals:
+            self._write_multi(direct_vals)
+        for vals, ids in groups.itervalues():
+            self.browse(ids).write(vals)
+        return True
+
+    @classmethod
+    def _write_multi_supported(cls):
+        """ Return whether :meth:`~.write_multi` may bypass :meth:`~.write`
+            for this model, i.e., whether neither ``write`` nor ``_write`` are
+            overridden.
+        """
+        return cls.write.im_func is BaseModel.write.im_func and \
+            cls._write.im_func is BaseModel._write.im_func
+
+    @api.model
+    def _write_multi_direct_fields(self):
+        """ Return the names of the fields that :meth:`~._write_multi` may
+            update directly: the classic stored columns of the model's table
+            that have no side effect when written.
+        """
+        totranslate = self._context.get('lang', 'en_US') != 'en_US'
+        return set(
+            name for name, column in self._columns.iteritems()
+            if column._classic_write and not hasattr(column, '_fnct_inv')
+            and not column.write and not (totranslate and column.translate)
+            and not ((self._parent_store or self._parent_path) and name == self._parent_name)
+            and get_pg_type(column)
+        )
+
+    def _write_multi(self, cr, user, vals_by_id, context=None):
+        # low-level implementation of write_multi() for the values of direct
+        # fields only, see _write_multi_direct_fields()
+        if not context:
+            context = {}
+
+        ids = vals_by_id.keys()
+        self._check_concurrency(cr, ids, context)
+        self.check_access_rights(cr, user, 'write')
+        self.check_field_access_rights(cr, user, 'write',
+                                       list(set(itertools.chain(*vals_by_id.itervalues()))),
+                                       context=context)
+        self.check_access_rule(cr, user, ids, 'write', context=context)
+
+        # group the records by set of columns to update
+        ids_by_columns = defaultdict(list)
+        for id, vals in vals_by_id.iteritems():
+            for field, value in vals.iteritems():
+                if hasattr(self._columns[field], 'selection') and value:
+                    self._check_selection_field_value(cr, user, field, value, context=context)
+            ids_by_columns[tuple(sorted(vals))].append(id)
+
+        result = []
+        for columns, sub_ids in ids_by_columns.iteritems():
+            result += self._store_get_values(cr, user, sub_ids, list(columns), context) or []
+
+            # for recomputing new-style fields
+            recs = self.browse(cr, user, sub_ids, context)
+            modified_fields = list(columns)
+            if self._log_access:
+                modified_fields += ['write_date', 'write_uid']
+            recs.modified(modified_fields)
+
+            updates = ['"%s"=v."%s"::%s' % (f, f, get_pg_type(self._columns[f])[0]) for f in columns]
+            params = []
+            if self._log_access:
+                updates.append('"write_uid"=%s')
+                updates.append("\"write_date\"=(now() at time zone 'UTC')")
+                params.append(user)
+            row = '(%s)' % ', '.join(['%s'] * (len(columns) + 1))
+            for chunk in cr.split_for_in_conditions(sub_ids):
+                query = 'UPDATE "%s" SET %s FROM (VALUES %s) AS v(id, %s) WHERE "%s".id = v.id' % (
+                    self._table, ','.join(updates), ', '.join([row] * len(chunk)),
+                    ', '.join('"%s"' % f for f in columns), self._table,
+                )
+                chunk_params = list(params)
+                for id in chunk:
+                    chunk_params.append(id)
+                    chunk_params.extend(self._columns[f]._symbol_set[1](vals_by_id[id][f]) for f in columns)
+                cr.execute(query, chunk_params)
+                if cr.rowcount != len(chunk):
+                    raise MissingError(_('One of the records you are trying to modify has already been deleted (Document type: %s).') % self._description)
+
+            # invalidate and mark new-style fields to recompute
+            recs.modified(list(columns))
+
+            # check Python constraints
+            recs._validate_fields(columns)
+
+            result += self._store_get_values(cr, user, sub_ids, list(columns), context)
+
+        # recompute each stored function field once for all records
+        self._store_todo(cr, user, result, context)
 
         # recompute new-style fields
+        recs = self.browse(cr, user, ids, context)
         if recs.env.recompute and context.get('recompute', True):
             recs.recompute()
 
@@ -4065,173 +4439,282 @@ class BaseModel(object):
 
         return record
 
+    @api.model
+    @api.returns('self')
+    def create_multi(self, vals_list):
+        """ create_multi(vals_list) -> records
+
+        Creates new records for the model, one for each dictionary of values
+        in ``vals_list``. This is equivalent to calling :meth:`~.create` on
+        every element of ``vals_list``, but the records are inserted with
+        multi-row ``INSERT`` queries (one per set of columns), the rows of
+        many2many relations are inserted together, and the stored function
+        fields are recomputed once for the whole batch.
+
+        Models overriding :meth:`~.create` fall back on calling it once per
+        record, so that their specific logic is preserved.
+
+        :param list vals_list: list of dictionaries of values, see
+            :meth:`~.create` for their format
+        :return: new records created, in the same order as ``vals_list``
+        """
+        if not self._create_multi_supported():
+            records = self.browse()
+            for vals in vals_list:
+                records += self.create(vals)
+            return records
+
+        self.check_access_rights('create')
+
+        old_vals_list, new_vals_list = [], []
+        for vals in vals_list:
+            # add missing defaults, and drop fields that may not be set by user
+            vals = self._add_missing_default_values(vals)
+            for field in itertools.chain(MAGIC_COLUMNS, ('parent_left', 'parent_right')):
+                vals.pop(field, None)
+
+            # split up fields into old-style and pure new-style ones
+            old_vals, new_vals, unknown = {}, {}, []
+            for key, val in vals.iteritems():
+                field = self._fields.get(key)
+                if field:
+                    if field.column or field.inherited:
+                        old_vals[key] = val
+                    if field.inverse and not field.inherited:
+                        new_vals[key] = val
+                else:
+                    unknown.append(key)
+
+            if unknown:
+                _logger.warning("%s.create_multi() with unknown fields: %s", self._name, ', '.join(sorted(unknown)))
+
+            old_vals_list.append(old_vals)
+            new_vals_list.append(new_vals)
+
+        # create records with old-style fields
+        records = self.browse(self._create_multi(old_vals_list))
+
+        # put the values of pure new-style fields into cache, and inverse them
+        for record, new_vals in itertools.izip(records, new_vals_list):
+            record._cache.update(record._convert_to_cache(new_vals))
+            for key in new_vals:
+                self._fields[key].determine_inverse(record)
+
+        return records
+
+    @classmethod
+    def _create_multi_supported(cls):
+        """ Return whether :meth:`~.create_multi` may bypass :meth:`~.create`
+            for this model, i.e., whether neither ``create`` nor ``_create``
+            are overridden.
+        """
+        return cls.create.im_func is BaseModel.create.im_func and \
+            cls._create.im_func is BaseModel._create.im_func
+
     def _create(self, cr, user, vals, context=None):
         # low-level implementation of create()
+        return self._create_multi(cr, user, [vals], context=context)[0]
+
+    def _create_multi(self, cr, user, vals_list, context=None):
+        # low-level implementation of create_multi(); return the ids of the
+        # new records, in the same order as vals_list
         if not context:
             context = {}
+        if not vals_list:
+            return []
 
         if self.is_transient():
             self._transient_vacuum(cr, user)
 
-        tocreate = {}
-        for v in self._inherits:
-            if self._inherits[v] not in vals:
-                tocreate[v] = {}
-            else:
-                tocreate[v] = {'id': vals[self._inherits[v]]}
+        vals_list = [dict(vals) for vals in vals_list]
 
-        updates = [
-            # list of column assignments defined as tuples like:
-            #   (column_name, format_string, column_value)
-            #   (column_name, sql_formula)
-            # Those tuples will be used by the string formatting for the INSERT
-            # statement below.
-            ('id', "nextval('%s')" % self._sequence),
-        ]
-
-        upd_todo = []
-        unknown_fields = []
-        for v in vals.keys():
-            if v in self._inherit_fields and v not in self._columns:
-                (table, col, col_detail, original_parent) = self._inherit_fields[v]
-                tocreate[table][v] = vals[v]
-                del vals[v]
-            else:
-                if (v not in self._inherit_fields) and (v not in self._columns):
+        # parent records to create or update, for each parent model
+        tocreate_list = []
+        unknown_fields = set()
+        for vals in vals_list:
+            tocreate = {}
+            for v in self._inherits:
+                if self._inherits[v] not in vals:
+                    tocreate[v] = {}
+                else:
+                    tocreate[v] = {'id': vals[self._inherits[v]]}
+            for v in vals.keys():
+                if v in self._inherit_fields and v not in self._columns:
+                    (table, col, col_detail, original_parent) = self._inherit_fields[v]
+                    tocreate[table][v] = vals[v]
                     del vals[v]
-                    unknown_fields.append(v)
+                else:
+                    if (v not in self._inherit_fields) and (v not in self._columns):
+                        del vals[v]
+                        unknown_fields.add(v)
+            tocreate_list.append(tocreate)
         if unknown_fields:
             _logger.warning(
                 'No such field(s) in model %s: %s.',
-                self._name, ', '.join(unknown_fields))
+                self._name, ', '.join(sorted(unknown_fields)))
 
-        for table in tocreate:
-            if self._inherits[table] in vals:
-                del vals[self._inherits[table]]
-
-            record_id = tocreate[table].pop('id', None)
-
-            if record_id is None or not record_id:
-                record_id = self.pool[table].create(cr, user, tocreate[table], context=context)
-            else:
-                self.pool[table].write(cr, user, [record_id], tocreate[table], context=context)
+        updates_list = [
+            # for each record, list of column assignments defined as tuples like:
+            #   (column_name, format_string, column_value)
+            #   (column_name, sql_formula)
+            # Those tuples will be used by the string formatting for the INSERT
+            # statement below.
+            [('id', "nextval('%s')" % self._sequence)]
+            for vals in vals_list
+        ]
 
-            updates.append((self._inherits[table], '%s', record_id))
+        for table, parent_field in self._inherits.iteritems():
+            # create the missing parent records in batch
+            indexes, parent_vals_list = [], []
+            for index, (vals, tocreate) in enumerate(itertools.izip(vals_list, tocreate_list)):
+                vals.pop(parent_field, None)
+                record_id = tocreate[table].pop('id', None)
+                if record_id is None or not record_id:
+                    indexes.append(index)
+                    parent_vals_list.append(tocreate[table])
+                else:
+                    self.pool[table].write(cr, user, [record_id], tocreate[table], context=context)
+                    updates_list[index].append((parent_field, '%s', record_id))
+            if parent_vals_list:
+                parent_ids = self.pool[table].create_multi(cr, user, parent_vals_list, context=context)
+                for index, record_id in itertools.izip(indexes, parent_ids):
+                    updates_list[index].append((parent_field, '%s', record_id))
 
         #Start : Set bool fields to be False if they are not touched(to make search more powerful)
         bool_fields = [x for x in self._columns.keys() if self._columns[x]._type=='boolean']
 
-        for bool_field in bool_fields:
-            if bool_field not in vals:
-                vals[bool_field] = False
-        #End
-        for field in vals.keys():
-            fobj = None
-            if field in self._columns:
-                fobj = self._columns[field]
-            else:
-                fobj = self._inherit_fields[field][2]
-            if not fobj:
-                continue
-            groups = fobj.write
-            if groups:
-                edit = False
-                for group in groups:
-                    module = group.split(".")[0]
-                    grp = group.split(".")[1]
-                    cr.execute("select count(*) from res_groups_users_rel where gid IN (select res_id from ir_model_data where name='%s' and module='%s' and model='%s') and uid=%s" % \
-                               (grp, module, 'res.groups', user))
-                    readonly = cr.fetchall()
-                    if readonly[0][0] >= 1:
-                        edit = True
-                        break
-                    elif readonly[0][0] == 0:
-                        edit = False
-                    else:
+        # whether the user may set the fields protected by groups
+        editable = {}
+
+        upd_todo_list = []
+        for vals, updates in itertools.izip(vals_list, updates_list):
+            for bool_field in bool_fields:
+                if bool_field not in vals:
+                    vals[bool_field] = False
+            #End
+            for field in vals.keys():
+                fobj = None
+                if field in self._columns:
+                    fobj = self._columns[field]
+                else:
+                    fobj = self._inherit_fields[field][2]
+                if not fobj:
+                    continue
+                groups = fobj.write
+                if groups:
+                    if field not in editable:
                         edit = False
-
-                if not edit:
-                    vals.pop(field)
-        for field in vals:
-            current_field = self._columns[field]
-            if current_field._classic_write:
-                updates.append((field, '%s', current_field._symbol_set[1](vals[field])))
-
-                #for the function fields that receive a value, we set them directly in the database
-                #(they may be required), but we also need to trigger the _fct_inv()
-                if (hasattr(current_field, '_fnct_inv')) and not isinstance(current_field, fields.related):
-                    #TODO: this way to special case the related fields is really creepy but it shouldn't be changed at
-                    #one week of the release candidate. It seems the only good way to handle correctly this is to add an
-                    #attribute to make a field `really readonly´ and thus totally ignored by the create()... otherwise
-                    #if, for example, the related has a default value (for usability) then the fct_inv is called and it
-                    #may raise some access rights error. Changing this is a too big change for now, and is thus postponed
-                    #after the release but, definitively, the behavior shouldn't be different for related and function
-                    #fields.
-                    upd_todo.append(field)
-            else:
-                #TODO: this `if´ statement should be removed because there is no good reason to special case the fields
-                #related. See the above TODO comment for further explanations.
-                if not isinstance(current_field, fields.related):
-                    upd_todo.append(field)
-            if field in self._columns \
-                    and hasattr(current_field, 'selection') \
-                    and vals[field]:
-                self._check_selection_field_value(cr, user, field, vals[field], context=context)
-        if self._log_access:
-            updates.append(('create_uid', '%s', user))
-            updates.append(('write_uid', '%s', user))
-            updates.append(('create_date', "(now() at time zone 'UTC')"))
-            updates.append(('write_date', "(now() at time zone 'UTC')"))
+                        for group in groups:
+                            module = group.split(".")[0]
+                            grp = group.split(".")[1]
+                            cr.execute("select count(*) from res_groups_users_rel where gid IN (select res_id from ir_model_data where name=%s and module=%s and model=%s) and uid=%s", \
+                                       (grp, module, 'res.groups', user))
+                            readonly = cr.fetchall()
+                            if readonly[0][0] >= 1:
+                                edit = True
+                                break
+                        editable[field] = edit
+
+                    if not editable[field]:
+                        vals.pop(field)
+            upd_todo = []
+            for field in vals:
+                current_field = self._columns[field]
+                if current_field._classic_write:
+                    updates.append((field, '%s', current_field._symbol_set[1](vals[field])))
+
+                    #for the function fields that receive a value, we set them directly in the database
+                    #(they may be required), but we also need to trigger the _fct_inv()
+                    if (hasattr(current_field, '_fnct_inv')) and not isinstance(current_field, fields.related):
+                        #TODO: this way to special case the related fields is really creepy but it shouldn't be changed at
+                        #one week of the release candidate. It seems the only good way to handle correctly this is to add an
+                        #attribute to make a field `really readonly´ and thus totally ignored by the create()... otherwise
+                        #if, for example, the related has a default value (for usability) then the fct_inv is called and it
+                        #may raise some access rights error. Changing this is a too big change for now, and is thus postponed
+                        #after the release but, definitively, the behavior shouldn't be different for related and function
+                        #fields.
+                        upd_todo.append(field)
+                else:
+                    #TODO: this `if´ statement should be removed because there is no good reason to special case the fields
+                    #related. See the above TODO comment for further explanations.
+                    if not isinstance(current_field, fields.related):
+                        upd_todo.append(field)
+                if field in self._columns \
+                        and hasattr(current_field, 'selection') \
+                        and vals[field]:
+                    self._check_selection_field_value(cr, user, field, vals[field], context=context)
+            if self._log_access:
+                updates.append(('create_uid', '%s', user))
+                updates.append(('write_uid', '%s', user))
+                updates.append(('create_date', "(now() at time zone 'UTC')"))
+                updates.append(('write_date', "(now() at time zone 'UTC')"))
+            upd_todo_list.append(upd_todo)
 
         # the list of tuples used in this formatting corresponds to
         # tuple(field_name, format, value)
         # In some case, for example (id, create_date, write_date) we does not
         # need to read the third value of the tuple, because the real value is
         # encoded in the second value (the format).
-        cr.execute(
-            """INSERT INTO "%s" (%s) VALUES(%s) RETURNING id""" % (
-                self._table,
-                ', '.join('"%s"' % u[0] for u in updates),
-                ', '.join(u[1] for u in updates)
-            ),
-            tuple([u[2] for u in updates if len(u) > 2])
-        )
+        # Records are grouped by columns and formats, and each group is
+        # inserted with multi-row INSERT queries; the ids are returned in the
+        # same order as the rows.
+        new_ids = [None] * len(vals_list)
+        groups = defaultdict(list)
+        for index, updates in enumerate(updates_list):
+            groups[tuple(u[:2] for u in updates)].append(index)
+        for columns, group in groups.iteritems():
+            row = '(%s)' % ', '.join(u[1] for u in columns)
+            for indexes in tools.misc.split_every(INSERT_BATCH_SIZE, group):
+                cr.execute(
+                    """INSERT INTO "%s" (%s) VALUES %s RETURNING id""" % (
+                        self._table,
+                        ', '.join('"%s"' % u[0] for u in columns),
+                        ', '.join([row] * len(indexes)),
+                    ),
+                    tuple(u[2] for index in indexes for u in updates_list[index] if len(u) > 2)
+                )
+                for index, (id_new,) in itertools.izip(indexes, cr.fetchall()):
+                    new_ids[index] = id_new
 
-        id_new, = cr.fetchone()
-        recs = self.browse(cr, user, id_new, context)
+        recs = self.browse(cr, user, new_ids, context)
 
         if self._parent_store and not context.get('defer_parent_store_computation'):
             if self.pool._init:
                 self.pool._init_parent[self._name] = True
             else:
-                parent = vals.get(self._parent_name, False)
-                if parent:
-                    cr.execute('select parent_right from '+self._table+' where '+self._parent_name+'=%s order by '+(self._parent_order or self._order), (parent,))
-                    pleft_old = None
-                    result_p = cr.fetchall()
-                    for (pleft,) in result_p:
-                        if not pleft:
-                            break
-                        pleft_old = pleft
-                    if not pleft_old:
-                        cr.execute('select parent_left from '+self._table+' where id=%s', (parent,))
-                        pleft_old = cr.fetchone()[0]
-                    pleft = pleft_old
-                else:
-                    cr.execute('select max(parent_right) from '+self._table)
-                    pleft = cr.fetchone()[0] or 0
-                cr.execute('update '+self._table+' set parent_left=parent_left+2 where parent_left>%s', (pleft,))
-                cr.execute('update '+self._table+' set parent_right=parent_right+2 where parent_right>%s', (pleft,))
-                cr.execute('update '+self._table+' set parent_left=%s,parent_right=%s where id=%s', (pleft+1, pleft+2, id_new))
+                for id_new, vals in itertools.izip(new_ids, vals_list):
+                    parent = vals.get(self._parent_name, False)
+                    if parent:
+                        cr.execute('select parent_right from '+self._table+' where '+self._parent_name+'=%s order by '+(self._parent_order or self._order), (parent,))
+                        pleft_old = None
+                        result_p = cr.fetchall()
+                        for (pleft,) in result_p:
+                            if not pleft:
+                                break
+                            pleft_old = pleft
+                        if not pleft_old:
+                            cr.execute('select parent_left from '+self._table+' where id=%s', (parent,))
+                            pleft_old = cr.fetchone()[0]
+                        pleft = pleft_old
+                    else:
+                        cr.execute('select max(parent_right) from '+self._table)
+                        pleft = cr.fetchone()[0] or 0
+                    cr.execute('update '+self._table+' set parent_left=parent_left+2 where parent_left>%s', (pleft,))
+                    cr.execute('update '+self._table+' set parent_right=parent_right+2 where parent_right>%s', (pleft,))
+                    cr.execute('update '+self._table+' set parent_left=%s,parent_right=%s where id=%s', (pleft+1, pleft+2, id_new))
                 recs.invalidate_cache(['parent_left', 'parent_right'])
 
+        if self._parent_path:
+            self._parent_path_create(cr, new_ids)
+
         # invalidate and mark new-style fields to recompute; do this before
         # setting other fields, because it can require the value of computed
         # fields, e.g., a one2many checking constraints on records
         recs.modified(self._fields)
 
         # call the 'set' method of fields which are not classic_write
-        upd_todo.sort(lambda x, y: self._columns[x].priority-self._columns[y].priority)
+        upd_todo = sorted(set(itertools.chain(*upd_todo_list)),
+                          key=lambda x: self._columns[x].priority)
 
         # default element in context must be remove when call a one2many or many2many
         rel_context = context.copy()
@@ -4241,37 +4724,49 @@ class BaseModel(object):
 
         result = []
         for field in upd_todo:
-            result += self._columns[field].set(cr, self, id_new, field, vals[field], user, rel_context) or []
+            column = self._columns[field]
+            values_list = [
+                (id_new, vals[field])
+                for id_new, vals, todo in itertools.izip(new_ids, vals_list, upd_todo_list)
+                if field in todo
+            ]
+            if isinstance(column, fields.many2many):
+                # the relation rows of new records can be inserted together
+                column.set_on_create(cr, self, values_list, field, user, rel_context)
+            else:
+                for id_new, value in values_list:
+                    result += column.set(cr, self, id_new, field, value, user, rel_context) or []
 
         # for recomputing new-style fields
         recs.modified(upd_todo)
 
         # check Python constraints
-        recs._validate_fields(vals)
+        recs._validate_fields(set(itertools.chain(*vals_list)))
 
         if recs.env.recompute and context.get('recompute', True):
-            result += self._store_get_values(cr, user, [id_new],
-                list(set(vals.keys() + self._inherits.values())),
-                context)
-            result.sort()
-            done = []
-            for order, model_name, ids, fields2 in result:
-                if not (model_name, ids, fields2) in done:
-                    self.pool[model_name]._store_set_values(cr, user, ids, fields2, context)
-                    done.append((model_name, ids, fields2))
+            # collect the store triggers of records written on the same fields
+            ids_by_fields = defaultdict(list)
+            for id_new, vals in itertools.izip(new_ids, vals_list):
+                fnames = tuple(sorted(set(vals.keys() + self._inherits.values())))
+                ids_by_fields[fnames].append(id_new)
+            for fnames, ids in ids_by_fields.iteritems():
+                result += self._store_get_values(cr, user, ids, list(fnames), context)
+
+            # recompute each stored function field once for the whole batch
+            self._store_todo(cr, user, result, context)
             # recompute new-style fields
             recs.recompute()
 
         if self._log_create and recs.env.recompute and context.get('recompute', True):
-            message = self._description + \
-                " '" + \
-                self.name_get(cr, user, [id_new], context=context)[0][1] + \
-                "' " + _("created.")
-            self.log(cr, user, id_new, message, True, context=context)
+            for id_new, name in self.name_get(cr, user, new_ids, context=context):
+                message = self._description + \
+                    " '" + name + \
+                    "' " + _("created.")
+                self.log(cr, user, id_new, message, True, context=context)
 
-        self.check_access_rule(cr, user, [id_new], 'create', context=context)
-        self.create_workflow(cr, user, [id_new], context=context)
-        return id_new
+        self.check_access_rule(cr, user, new_ids, 'create', context=context)
+        self.create_workflow(cr, user, new_ids, context=context)
+        return new_ids
 
     def _store_get_values(self, cr, uid, ids, fields, context):
         """Returns an ordered list of fields.function to call due to
@@ -4332,9 +4827,49 @@ class BaseModel(object):
             result = reduce(operator.add, (call_map[k] for k in sorted(call_map)))
         return result
 
+    def _store_todo(self, cr, uid, result, context):
+        """ Queue the stored function fields ``result`` returned by
+            :meth:`_store_get_values` for recomputation in the current
+            transaction, and recompute the queued fields unless
+            recomputations are delayed (see
+            :meth:`~openerp.api.Environment.norecompute`). A field is
+            recomputed once on a record, whatever the number of times it has
+            been queued for that record.
+        """
+        env = api.Environment(cr, uid, context or {})
+        todo = env.all.store_todo.setdefault(cr, defaultdict(set))
+        for priority, model_name, ids, fnames in result:
+            for fname in fnames:
+                todo[(priority, model_name, fname)].update(ids)
+        if env.recompute:
+            self._store_flush(cr, uid, context)
+
+    def _store_flush(self, cr, uid, context):
+        """ Recompute the stored function fields queued by :meth:`_store_todo`
+            in the order of their priorities. The fields of the same priority
+            are computed together on all their queued records.
+        """
+        store_todo = api.Environment(cr, uid, context or {}).all.store_todo
+        todo = store_todo.get(cr)
+        while todo:
+            priority, model_name = min(key[:2] for key in todo)
+            model = self.pool[model_name]
+            fnames_by_ids = defaultdict(list)
+            for key in [key for key in todo if key[:2] == (priority, model_name)]:
+                fnames_by_ids[frozenset(todo.pop(key))].append(key[2])
+            for ids, fnames in fnames_by_ids.iteritems():
+                # skip the records deleted since they have been queued
+                existing = []
+                for sub_ids in cr.split_for_in_conditions(ids):
+                    cr.execute('SELECT id FROM "%s" WHERE id IN %%s' % model._table, (sub_ids,))
+                    existing.extend(row[0] for row in cr.fetchall())
+                model._store_set_values(cr, uid, sorted(existing), sorted(fnames), context)
+        store_todo.pop(cr, None)
+
     def _store_set_values(self, cr, uid, ids, fields, context):
         """Calls the fields.function's "implementation function" for all ``fields``, on records with ``ids`` (taking care of
-           respecting ``multi`` attributes), and stores the resulting values in the database directly."""
+           respecting ``multi`` attributes), and stores the resulting values in the database directly, with one query
+           per set of fields."""
         if not ids:
             return True
         field_flag = False
@@ -4364,6 +4899,8 @@ class BaseModel(object):
             todo[self._columns[f]._multi].append(f)
         for key in keys:
             val = todo[key]
+            start = time.time()
+            values_by_id = defaultdict(dict)     # {id: {column: value}}
             if key:
                 # use admin user for accessing objects having rules defined on store fields
                 result = self._columns[val[0]].get(cr, self, ids, val, SUPERUSER_ID, context=context)
@@ -4372,7 +4909,6 @@ class BaseModel(object):
                         for f in value.keys():
                             if f in field_dict[id]:
                                 value.pop(f)
-                    updates = []        # list of (column, pattern, value)
                     for v in value:
                         if v not in val:
                             continue
@@ -4382,13 +4918,7 @@ class BaseModel(object):
                                 value[v] = value[v][0]
                             except:
                                 pass
-                        updates.append((v, '%s', column._symbol_set[1](value[v])))
-                    if updates:
-                        query = 'UPDATE "%s" SET %s WHERE id = %%s' % (
-                            self._table, ','.join('"%s"=%s' % u[:2] for u in updates),
-                        )
-                        params = tuple(u[2] for u in updates)
-                        cr.execute(query, params + (id,))
+                        values_by_id[id][v] = column._symbol_set[1](value[v])
 
             else:
                 for f in val:
@@ -4406,16 +4936,43 @@ class BaseModel(object):
                                 value = value[0]
                             except:
                                 pass
-                        query = 'UPDATE "%s" SET "%s"=%%s WHERE id = %%s' % (
-                            self._table, f,
-                        )
-                        cr.execute(query, (column._symbol_set[1](value), id))
+                        values_by_id[id][f] = column._symbol_set[1](value)
+
+            self._store_update_values(cr, values_by_id)
+
+            stat = RECOMPUTE_STAT[(cr.dbname, self._name, ','.join(val))]
+            stat.calls += 1
+            stat.records += len(ids)
+            stat.time += time.time() - start
 
         # invalidate and mark new-style fields to recompute
         self.browse(cr, uid, ids, context).modified(fields)
 
         return True
 
+    def _store_update_values(self, cr, values_by_id):
+        """ Save the values ``{id: {column: value}}`` of stored function fields,
+            already converted for the database, with one
+            ``UPDATE ... FROM (VALUES ...)`` query per set of columns.
+        """
+        ids_by_columns = defaultdict(list)
+        for id, vals in values_by_id.iteritems():
+            if vals:
+                ids_by_columns[tuple(sorted(vals))].append(id)
+        for columns, ids in ids_by_columns.iteritems():
+            updates = ['"%s"=v."%s"::%s' % (f, f, get_pg_type(self._columns[f])[0]) for f in columns]
+            row = '(%s)' % ', '.join(['%s'] * (len(columns) + 1))
+            for chunk in cr.split_for_in_conditions(sorted(ids)):
+                query = 'UPDATE "%s" SET %s FROM (VALUES %s) AS v(id, %s) WHERE "%s".id = v.id' % (
+                    self._table, ','.join(updates), ', '.join([row] * len(chunk)),
+                    ', '.join('"%s"' % f for f in columns), self._table,
+                )
+                params = []
+                for id in chunk:
+                    params.append(id)
+                    params.extend(values_by_id[id][f] for f in columns)
+                cr.execute(query, params)
+
     # TODO: ameliorer avec NULL
     def _where_calc(self, cr, user, domain, active_test=True, context=None):
         """Computes the WHERE clause needed to implement an OpenERP domain.
@@ -4600,6 +5157,21 @@ class BaseModel(object):
 
         return order_by_clause and (' ORDER BY %s ' % order_by_clause) or ''
 
+    def _search_query(self, cr, user, args, context=None, access_rights_uid=None):
+        """ Return the :class:`~openerp.osv.query.Query` of the records
+        matching ``args``, after checking the access rights and applying the
+        record rules of ``user``, like :meth:`_search` does.
+        """
+        self.check_access_rights(cr, access_rights_uid or user, 'read')
+
+        # For transient models, restrict access to the current user, except for the super-user
+        if self.is_transient() and self._log_access and user != SUPERUSER_ID:
+            args = expression.AND(([('create_uid', '=', user)], args or []))
+
+        query = self._where_calc(cr, user, args, context=context)
+        self._apply_ir_rules(cr, user, query, 'read', context=context)
+        return query
+
     def _search(self, cr, user, args, offset=0, limit=None, order=None, context=None, count=False, access_rights_uid=None):
         """
         Private implementation of search() method, allowing specifying the uid to use for the access right check.
@@ -4612,14 +5184,7 @@ class BaseModel(object):
         """
         if context is None:
             context = {}
-        self.check_access_rights(cr, access_rights_uid or user, 'read')
-
-        # For transient models, restrict access to the current user, except for the super-user
-        if self.is_transient() and self._log_access and user != SUPERUSER_ID:
-            args = expression.AND(([('create_uid', '=', user)], args or []))
-
-        query = self._where_calc(cr, user, args, context=context)
-        self._apply_ir_rules(cr, user, query, 'read', context=context)
+        query = self._search_query(cr, user, args, context=context, access_rights_uid=access_rights_uid)
         order_by = self._generate_order_by(order, query)
         from_clause, where_clause, where_clause_params = query.get_sql()
 
@@ -5093,6 +5658,7 @@ class BaseModel(object):
     # for backward compatibility
     resolve_o2m_commands_to_record_dicts = resolve_2many_commands
 
+    @api.readonly
     def search_read(self, cr, uid, domain=None, fields=None, offset=0, limit=None, order=None, context=None):
         """
         Performs a ``search()`` followed by a ``read()``.
@@ -5263,6 +5829,33 @@ class BaseModel(object):
         """
         return self.with_env(self.env(user=user))
 
+    def with_delay(self, priority=None, eta=None, channel=None, max_retries=None, description=None):
+        """ with_delay([priority][, eta][, channel][, max_retries][, description])
+
+        Returns a proxy of this recordset on which method calls are not
+        executed, but enqueued as jobs (see ``ir.job``) that the job workers
+        process later on, with the current user and context::
+
+            # returns the job, a record of ir.job
+            job = picking.with_delay(channel='stock').action_done()
+
+        The arguments of the method must be serializable in JSON, except for
+        recordsets.
+
+        :param int priority: the jobs of lower priority are processed first
+            (default 10)
+        :param eta: the job is not processed before this date (a UTC
+            ``datetime``) or number of seconds
+        :param str channel: the channel of the job (default ``'root'``),
+            which limits the number of its jobs processed at the same time
+        :param int max_retries: number of times the job is retried after an
+            unexpected failure (default 5)
+        :param str description: description of the job
+        """
+        options = dict(priority=priority, eta=eta, channel=channel,
+                       max_retries=max_retries, description=description)
+        return self.env['ir.job']._delayed(self, options)
+
     def with_context(self, *args, **kwargs):
         """ with_context([context][, **overrides]) -> records
 
@@ -5626,6 +6219,12 @@ class BaseModel(object):
         for fname in fnames:
             spec += self._fields[fname].modified(self)
 
+        if self._cache_shared:
+            # moving a node in a hierarchy modifies parent_left/right of others
+            ids = None if self._parent_store else self._ids
+            self.pool.shared_cache.invalidate(self._cr, self._name, ids)
+            self.pool.cache_cleared(self._name)
+
         cached_fields = {
             field
             for env in self.env.all
@@ -5654,23 +6253,52 @@ class BaseModel(object):
     @api.model
     def recompute(self):
         """ Recompute stored function fields. The fields and records to
-            recompute have been determined by method :meth:`modified`.
+            recompute have been determined by method :meth:`modified`, and by
+            the store triggers of old-style function fields.
         """
-        while self.env.has_todo():
+        store_todo = self.env.all.store_todo
+        while self.env.has_todo() or store_todo.get(self._cr):
+            if store_todo.get(self._cr):
+                self._store_flush()
+                continue
             field, recs = self.env.get_todo()
+            start = time.time()
             # evaluate the fields to recompute, and save them to database
             names = [f.name for f in field.computed_fields if f.store]
-            for rec in recs:
+            values_by_id = {}
+            for rec in recs.exists():
                 try:
-                    values = rec._convert_to_write({
+                    values_by_id[rec.id] = rec._convert_to_write({
                         name: rec[name] for name in names
                     })
-                    with rec.env.norecompute():
-                        rec._write(values)
                 except MissingError:
                     pass
+            with recs.env.norecompute():
+                recs._recompute_write(values_by_id)
             # mark the computed fields as done
             map(recs._recompute_done, field.computed_fields)
+            stat = RECOMPUTE_STAT[(self._cr.dbname, recs._name, ','.join(names))]
+            stat.calls += 1
+            stat.records += len(values_by_id)
+            stat.time += time.time() - start
+
+    @api.model
+    def _recompute_write(self, values_by_id):
+        """ Save the recomputed values ``{id: values}`` of stored fields. When
+            possible, the records are updated together by :meth:`_write_multi`.
+        """
+        if not values_by_id:
+            return
+        fnames = set(itertools.chain(*values_by_id.itervalues()))
+        if type(self)._write.im_func is BaseModel._write.im_func and \
+                self._write_multi_direct_fields().issuperset(fnames):
+            self._write_multi(values_by_id)
+            return
+        for id, values in values_by_id.iteritems():
+            try:
+                self.browse(id)._write(values)
+            except MissingError:
+                pass
 
     #
     # Generic onchange method
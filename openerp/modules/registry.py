@@ -25,15 +25,52 @@
 from collections import Mapping, defaultdict
 import logging
 import os
+import socket
 import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
 
 import openerp
 from .. import SUPERUSER_ID
 from openerp.tools import assertion_report, lazy_property, classproperty, config
+from openerp.tools.cache import shared_record_cache
 from openerp.tools.lru import LRU
 
 _logger = logging.getLogger(__name__)
 
+# channel of the notifications sent to the other processes when the registry
+# or the caches of a database change
+SIGNALING_CHANNEL = 'openerp_registry_signaling'
+# maximal length of the list of models of a cache notification, whose
+# payload is limited to 8000 bytes; beyond it, all caches are cleared
+MAX_SIGNALING_SCOPE = 4000
+# delay before trying again to listen to the notifications of a database
+LISTEN_RETRY_INTERVAL = 60
+
+# listening connections inherited from the parent process, which still uses
+# them: closing them would close the parent's ones
+_inherited_connections = []
+
+
+def _signaling_token():
+    """ Return the identifier of the current process in notifications. """
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def _signal(cr, kind, sequence, scope=('*',)):
+    """ Notify the other processes of a change of the registry (``kind`` is
+    ``'registry'``) or of the caches of the models of ``scope`` (``kind`` is
+    ``'cache'``), when the transaction of ``cr`` is committed.
+    """
+    scope = ','.join(sorted(scope))
+    if len(scope) > MAX_SIGNALING_SCOPE or '*' in scope.split(','):
+        scope = '*'
+    payload = '%s %s %s %s' % (kind, _signaling_token(), sequence, scope)
+    cr.execute("SELECT pg_notify(%s, %s)", (SIGNALING_CHANNEL, payload))
+
+
 class Registry(Mapping):
     """ Model registry for a particular database.
 
@@ -74,9 +111,25 @@ class Registry(Mapping):
         self.base_cache_signaling_sequence = None
 
         self.cache = LRU(8192)
-        # Flag indicating if at least one model cache has been cleared.
+        # Flag indicating if at least one model cache has been cleared, and
+        # the models whose caches have been cleared ('*' for all models).
         # Useful only in a multi-process context.
         self._any_cache_cleared = False
+        self._cleared_models = set()
+
+        # connection listening to the notifications of the other processes,
+        # the process that opened it, and the time of the last attempt
+        self._signal_conn = None
+        self._signal_pid = None
+        self._signal_time = 0
+        # values of the signaling sequences (registry, cache) checked when
+        # the listener was opened; the notified changes up to them are
+        # already taken into account
+        self._signal_watermarks = (0, 0)
+
+        # record values of the models with `_cache_shared`, shared by all
+        # the transactions of this process
+        self.shared_cache = shared_record_cache(int(config.get('shared_cache_size', 8192)))
 
         cr = self.cursor()
         has_unaccent = openerp.modules.db.has_unaccent(cr)
@@ -205,16 +258,86 @@ class Registry(Mapping):
         ir_ui_menu = self.models.get('ir.ui.menu')
         if ir_ui_menu is not None:
             ir_ui_menu.clear_cache()
+        self.shared_cache.clear()
+        self.cache_cleared()
+
 
+    def clear_model_caches(self, model_names):
+        """ Clear the caches of the given models only. """
+        for model_name in model_names:
+            model = self.models.get(model_name)
+            if model is not None:
+                model.clear_caches()
+                if model_name == 'ir.ui.menu':
+                    model.clear_cache()
+            self.shared_cache.clear_model(model_name)
+
+    # Useful only in a multi-process context.
+    def cache_cleared(self, model_name=None):
+        """ Mark the caches of model ``model_name`` (or of all models) as
+        cleared, to signal it to the other processes.
+        """
+        self._any_cache_cleared = True
+        self._cleared_models.add(model_name or '*')
 
     # Useful only in a multi-process context.
     def reset_any_cache_cleared(self):
         self._any_cache_cleared = False
+        self._cleared_models.clear()
 
     # Useful only in a multi-process context.
     def any_cache_cleared(self):
         return self._any_cache_cleared
 
+    # Useful only in a multi-process context.
+    def receive_signals(self):
+        """ Return the signals ``(kind, sequence, scope)`` notified by the
+        other processes since the last call, or ``None`` if some of them may
+        have been missed, e.g., when the listening connection has just been
+        opened.
+        """
+        conn = self._signal_conn
+        if conn is not None and self._signal_pid == os.getpid():
+            try:
+                conn.poll()
+            except psycopg2.Error:
+                _logger.warning("Lost the connection listening to the signaling of database %s.", self.db_name)
+            else:
+                token = _signaling_token()
+                signals = []
+                for notify in conn.notifies:
+                    kind, sender, sequence, scope = notify.payload.split(' ', 3)
+                    if sender != token:
+                        signals.append((kind, int(sequence), set(scope.split(','))))
+                del conn.notifies[:]
+                return signals
+        elif self._signal_pid != os.getpid():
+            # the process has been forked: the parent keeps its connection
+            if conn is not None:
+                _inherited_connections.append(conn)
+            self._signal_time = 0
+        self._signal_conn = None
+        self._signal_pid = os.getpid()
+        if time.time() - self._signal_time >= LISTEN_RETRY_INTERVAL:
+            self._signal_time = time.time()
+            try:
+                conn = psycopg2.connect(openerp.sql_db.dsn(self.db_name)[1])
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute("LISTEN %s" % SIGNALING_CHANNEL)
+                self._signal_conn = conn
+            except psycopg2.Error:
+                _logger.warning("Cannot listen to the signaling of database %s.", self.db_name, exc_info=True)
+        return None
+
+    def close_signal_listener(self):
+        """ Close the connection listening to the other processes. """
+        conn, self._signal_conn = self._signal_conn, None
+        if conn is not None and self._signal_pid == os.getpid():
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
     @classmethod
     def setup_multi_process_signaling(cls, cr):
         if not openerp.multi_process:
@@ -225,6 +348,9 @@ class Registry(Mapping):
         # must be reloaded.
         # The `base_cache_signaling sequence` indicates all caches must be
         # invalidated (i.e. cleared).
+        # Both are notified on SIGNALING_CHANNEL with the sequence's value and,
+        # for caches, the models whose caches must be invalidated; the
+        # sequences are checked when notifications may have been missed.
         cr.execute("""SELECT sequence_name FROM information_schema.sequences WHERE sequence_name='base_registry_signaling'""")
         if not cr.fetchall():
             cr.execute("""CREATE SEQUENCE base_registry_signaling INCREMENT BY 1 START WITH 1""")
@@ -255,9 +381,12 @@ class Registry(Mapping):
         self.test_cr = None
         RegistryManager.leave_test_mode()
 
-    def cursor(self):
+    def cursor(self, readonly=False):
         """ Return a new cursor for the database. The cursor itself may be used
             as a context manager to commit/rollback and close automatically.
+
+            :param readonly: whether the cursor is only used for reading; it is
+                then opened on a replica of the database if one is available
         """
         cr = self.test_cr
         if cr is not None:
@@ -267,6 +396,10 @@ class Registry(Mapping):
             # cursor itself in its method close().
             cr.acquire()
             return cr
+        if readonly:
+            cr = openerp.sql_db.replica_cursor(self.db_name)
+            if cr is not None:
+                return cr
         return self._db.cursor()
 
 class DummyRLock(object):
@@ -395,6 +528,7 @@ class RegistryManager(object):
         with cls.lock():
             if db_name in cls.registries:
                 cls.registries[db_name].clear_caches()
+                cls.registries[db_name].close_signal_listener()
                 del cls.registries[db_name]
 
     @classmethod
@@ -425,41 +559,85 @@ class RegistryManager(object):
         Check if the modules have changed and performs all necessary operations to update
         the registry of the corresponding database.
 
+        The changes are notified by the other processes through a connection
+        listening to the database, which is only queried when some
+        notifications may have been missed. Only the caches of the models
+        given by the notifications are cleared.
 
         :returns: True if changes has been detected in the database and False otherwise.
         """
         changed = False
         if openerp.multi_process and db_name in cls.registries:
             registry = cls.get(db_name)
-            cr = registry.cursor()
-            try:
-                cr.execute("""
-                    SELECT base_registry_signaling.last_value,
-                           base_cache_signaling.last_value
-                    FROM base_registry_signaling, base_cache_signaling""")
-                r, c = cr.fetchone()
-                _logger.debug("Multiprocess signaling check: [Registry - old# %s new# %s] "\
-                    "[Cache - old# %s new# %s]",
-                    registry.base_registry_signaling_sequence, r,
-                    registry.base_cache_signaling_sequence, c)
-                # Check if the model registry must be reloaded (e.g. after the
-                # database has been updated by another process).
-                if registry.base_registry_signaling_sequence is not None and registry.base_registry_signaling_sequence != r:
-                    changed = True
-                    _logger.info("Reloading the model registry after database signaling.")
-                    registry = cls.new(db_name)
-                # Check if the model caches must be invalidated (e.g. after a write
-                # occured on another process). Don't clear right after a registry
-                # has been reload.
-                elif registry.base_cache_signaling_sequence is not None and registry.base_cache_signaling_sequence != c:
-                    changed = True
+            signals = registry.receive_signals()
+            if signals is None:
+                return cls._check_signaling_sequences(registry)
+            # Skip the signals already taken into account by checking the
+            # sequences when the listener was opened. The later ones are all
+            # applied, as they are received in commit order, not in sequence
+            # order.
+            registry_watermark, cache_watermark = registry._signal_watermarks
+            reload = False
+            scope = set()
+            for kind, sequence, models in signals:
+                if kind == 'registry':
+                    reload = reload or sequence > registry_watermark
+                elif sequence > cache_watermark:
+                    scope.update(models)
+            if reload:
+                changed = True
+                _logger.info("Reloading the model registry after database signaling.")
+                registry.close_signal_listener()
+                registry = cls.new(db_name)
+            elif scope:
+                changed = True
+                if '*' in scope:
                     _logger.info("Invalidating all model caches after database signaling.")
                     registry.clear_caches()
-                    registry.reset_any_cache_cleared()
-                registry.base_registry_signaling_sequence = r
-                registry.base_cache_signaling_sequence = c
-            finally:
-                cr.close()
+                else:
+                    _logger.info("Invalidating the caches of %s after database signaling.", ', '.join(sorted(scope)))
+                    registry.clear_model_caches(scope)
+                registry.reset_any_cache_cleared()
+        return changed
+
+    @classmethod
+    def _check_signaling_sequences(cls, registry):
+        """ Check the signaling sequences of the database of ``registry``, and
+        reload the registry or clear all its caches accordingly.
+        """
+        changed = False
+        db_name = registry.db_name
+        cr = registry.cursor()
+        try:
+            cr.execute("""
+                SELECT base_registry_signaling.last_value,
+                       base_cache_signaling.last_value
+                FROM base_registry_signaling, base_cache_signaling""")
+            r, c = cr.fetchone()
+            _logger.debug("Multiprocess signaling check: [Registry - old# %s new# %s] "\
+                "[Cache - old# %s new# %s]",
+                registry.base_registry_signaling_sequence, r,
+                registry.base_cache_signaling_sequence, c)
+            # Check if the model registry must be reloaded (e.g. after the
+            # database has been updated by another process).
+            if registry.base_registry_signaling_sequence is not None and registry.base_registry_signaling_sequence != r:
+                changed = True
+                _logger.info("Reloading the model registry after database signaling.")
+                registry.close_signal_listener()
+                registry = cls.new(db_name)
+            # Check if the model caches must be invalidated (e.g. after a write
+            # occured on another process). Don't clear right after a registry
+            # has been reload.
+            elif registry.base_cache_signaling_sequence is not None and registry.base_cache_signaling_sequence != c:
+                changed = True
+                _logger.info("Invalidating all model caches after database signaling.")
+                registry.clear_caches()
+                registry.reset_any_cache_cleared()
+            registry.base_registry_signaling_sequence = r
+            registry.base_cache_signaling_sequence = c
+            registry._signal_watermarks = (r, c)
+        finally:
+            cr.close()
         return changed
 
     @classmethod
@@ -475,6 +653,8 @@ class RegistryManager(object):
                 try:
                     cr.execute("select nextval('base_cache_signaling')")
                     r = cr.fetchone()[0]
+                    _signal(cr, 'cache', r, registry._cleared_models)
+                    cr.commit()
                 finally:
                     cr.close()
                 registry.base_cache_signaling_sequence = r
@@ -490,6 +670,8 @@ class RegistryManager(object):
             try:
                 cr.execute("select nextval('base_registry_signaling')")
                 r = cr.fetchone()[0]
+                _signal(cr, 'registry', r)
+                cr.commit()
             finally:
                 cr.close()
             registry.base_registry_signaling_sequence = r
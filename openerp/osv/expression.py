@@ -157,7 +157,10 @@ DOMAIN_OPERATORS = (NOT_OPERATOR, OR_OPERATOR, AND_OPERATOR)
 # operators are also used. In this case its right operand has the form (subselect, params).
 TERM_OPERATORS = ('=', '!=', '<=', '<', '>', '>=', '=?', '=like', '=ilike',
                   'like', 'not like', 'ilike', 'not ilike', 'in', 'not in',
-                  'child_of')
+                  'child_of', 'parent_of')
+
+# Operators on hierarchies, replaced by other leaves while parsing
+HIERARCHY_OPERATORS = ('child_of', 'parent_of')
 
 # A subset of the above operators, with a 'negative' semantic. When the
 # expressions 'in NEGATIVE_TERM_OPERATORS' or 'not in NEGATIVE_TERM_OPERATORS' are used in the code
@@ -430,6 +433,37 @@ def select_distinct_from_where_not_null(cr, select_field, from_table):
     cr.execute('SELECT distinct("%s") FROM "%s" where "%s" is not null' % (select_field, from_table, select_field))
     return [r[0] for r in cr.fetchall()]
 
+
+def select_distinct_from_where_not_null_query(select_field, from_table):
+    """ Subquery version of :func:`select_distinct_from_where_not_null`. """
+    return 'SELECT distinct("%s") FROM "%s" WHERE "%s" IS NOT NULL' % (select_field, from_table, select_field), []
+
+
+def use_subqueries(model, context=None):
+    """ Return whether the searches on ``model`` made while parsing a domain
+    can be replaced by subqueries, evaluated by PostgreSQL together with the
+    main query. This is enabled by the config file option or the context key
+    ``search_subqueries``, and only for the models that do not override
+    ``search``.
+    """
+    if not (context or {}).get('search_subqueries', tools.config.get('search_subqueries', False)):
+        return False
+    cls = type(model)
+    return cls.search.im_func is BaseModel.search.im_func and \
+        cls._search.im_func is BaseModel._search.im_func
+
+
+def select_from_search(cr, uid, model, domain, context=None):
+    """ Return the subquery ``(query, params)`` selecting the ids returned by
+    ``model.search(cr, uid, domain, context=context)``, with the same access
+    rights and record rules.
+    """
+    query = model._search_query(cr, uid, domain, context=context)
+    from_clause, where_clause, params = query.get_sql()
+    where_str = where_clause and (" WHERE %s" % where_clause) or ''
+    return 'SELECT "%s".id FROM %s%s' % (model._table, from_clause, where_str), params
+
+
 def get_unaccent_wrapper(cr):
     if openerp.modules.registry.RegistryManager.get(cr.dbname).has_unaccent:
         return lambda x: "unaccent(%s)" % (x,)
@@ -581,7 +615,7 @@ class ExtendedLeaf(object):
             - a valid leaf has a field objects unless
                 - it is not a tuple
                 - it is an inherited field
-                - left is id, operator is 'child_of'
+                - left is id, operator is 'child_of' or 'parent_of'
                 - left is in MAGIC_COLUMNS
         """
         if not is_operator(self.leaf) and not is_leaf(self.leaf, True):
@@ -709,10 +743,36 @@ class expression(object):
                 return list(set(name_get_list))
             return list(value)
 
+        def get_parent_paths(ids, left_model):
+            """ Return the materialized paths of the records ``ids``. """
+            paths = []
+            for sub_ids in cr.split_for_in_conditions(ids):
+                cr.execute('SELECT parent_path FROM "%s" WHERE id IN %%s' % left_model._table, (sub_ids,))
+                paths.extend(path for (path,) in cr.fetchall() if path)
+            return paths
+
+        def use_parent_path(left_model, parent):
+            return left_model._parent_path and (parent or left_model._parent_name) == left_model._parent_name
+
         def child_of_domain(left, ids, left_model, parent=None, prefix='', context=None):
             """ Return a domain implementing the child_of operator for [(left,child_of,ids)],
-                either as a range using the parent_left/right tree lookup fields
+                either as a prefix search on the materialized path parent_path,
+                as a range using the parent_left/right tree lookup fields
                 (when available), or as an expanded [(left,in,child_ids)] """
+            if use_parent_path(left_model, parent):
+                paths = get_parent_paths(ids, left_model)
+                if not paths:
+                    return [FALSE_LEAF]
+                subselect = 'SELECT id FROM "%s" WHERE %s' % \
+                    (left_model._table, ' OR '.join(['parent_path LIKE %s'] * len(paths)))
+                params = [path + '%' for path in paths]
+                if prefix:
+                    # apply the access rules of left_model, like search() does
+                    dom = [('id', 'inselect', (subselect, params))]
+                    if use_subqueries(left_model, context):
+                        return [(left, 'inselect', select_from_search(cr, uid, left_model, dom, context=context))]
+                    return [(left, 'in', left_model.search(cr, uid, dom, context=context))]
+                return [(left, 'inselect', (subselect, params))]
             if left_model._parent_store and (not left_model.pool._init):
                 # TODO: Improve where joins are implemented for many with '.', replace by:
                 # doms += ['&',(prefix+'.parent_left','<',o.parent_right),(prefix+'.parent_left','>=',o.parent_left)]
@@ -722,6 +782,8 @@ class expression(object):
                         doms.insert(0, OR_OPERATOR)
                     doms += [AND_OPERATOR, ('parent_left', '<', o.parent_right), ('parent_left', '>=', o.parent_left)]
                 if prefix:
+                    if use_subqueries(left_model, context):
+                        return [(left, 'inselect', select_from_search(cr, uid, left_model, doms, context=context))]
                     return [(left, 'in', left_model.search(cr, uid, doms, context=context))]
                 return doms
             else:
@@ -732,6 +794,33 @@ class expression(object):
                     return ids + recursive_children(ids2, model, parent_field)
                 return [(left, 'in', recursive_children(ids, left_model, parent or left_model._parent_name))]
 
+        def parent_of_domain(left, ids, left_model, parent=None, prefix='', context=None):
+            """ Return a domain implementing the parent_of operator for [(left,parent_of,ids)],
+                from the materialized path parent_path (when available), or
+                by reading the parents level by level, as an expanded
+                [(left,in,parent_ids)] """
+            if use_parent_path(left_model, parent):
+                parent_ids = set(
+                    int(parent_id)
+                    for path in get_parent_paths(ids, left_model)
+                    for parent_id in path.split('/')[:-1]
+                )
+            else:
+                parent_name = parent or left_model._parent_name
+                parent_ids = set()
+                records = left_model.browse(cr, uid, ids, context=context)
+                while records:
+                    parent_ids.update(records.ids)
+                    records = records.mapped(parent_name).filtered(lambda rec: rec.id not in parent_ids)
+            if prefix:
+                return [(left, 'in', left_model.search(cr, uid, [('id', 'in', list(parent_ids))], context=context))]
+            return [(left, 'in', list(parent_ids))]
+
+        def hierarchy_domain(operator, *args, **kwargs):
+            if operator == 'child_of':
+                return child_of_domain(*args, **kwargs)
+            return parent_of_domain(*args, **kwargs)
+
         def pop():
             """ Pop a leaf to process. """
             return self.stack.pop()
@@ -798,9 +887,9 @@ class expression(object):
                 leaf.add_join_context(next_model, model._inherits[next_model._name], 'id', model._inherits[next_model._name])
                 push(leaf)
 
-            elif left == 'id' and operator == 'child_of':
+            elif left == 'id' and operator in HIERARCHY_OPERATORS:
                 ids2 = to_ids(right, model, context)
-                dom = child_of_domain(left, ids2, model)
+                dom = hierarchy_domain(operator, left, ids2, model, context=context)
                 for dom_leaf in reversed(dom):
                     new_leaf = create_substitution_leaf(leaf, dom_leaf, model)
                     push(new_leaf)
@@ -843,11 +932,31 @@ class expression(object):
             elif len(path) > 1 and column._auto_join:
                 raise NotImplementedError('_auto_join attribute not supported on many2many column %s' % left)
 
+            elif len(path) > 1 and column._type == 'many2one' and use_subqueries(comodel, context) and \
+                    not (isinstance(column, fields.function) and not column.store):
+                # res_partner.country_id in (SELECT id FROM res_country WHERE ...)
+                subquery = select_from_search(cr, uid, comodel, [(path[1], operator, right)], context=context)
+                leaf.leaf = (path[0], 'inselect', subquery)
+                push(leaf)
+
             elif len(path) > 1 and column._type == 'many2one':
                 right_ids = comodel.search(cr, uid, [(path[1], operator, right)], context=context)
                 leaf.leaf = (path[0], 'in', right_ids)
                 push(leaf)
 
+            elif len(path) > 1 and column._type in ['many2many', 'one2many'] and \
+                    not isinstance(column, fields.function) and \
+                    use_subqueries(comodel, context) and use_subqueries(model, context):
+                # res_partner.id in (SELECT partner_id FROM res_partner_bank WHERE id in (SELECT id ...))
+                subquery, params = select_from_search(cr, uid, comodel, [(path[1], operator, right)], context=context)
+                if column._type == 'one2many':
+                    select_field, from_table, where_field = column._fields_id, comodel._table, 'id'
+                else:
+                    from_table, select_field, where_field = column._sql_names(model)
+                subquery = 'SELECT "%s" FROM "%s" WHERE "%s" IN (%s)' % (select_field, from_table, where_field, subquery)
+                leaf.leaf = ('id', 'inselect', (subquery, params))
+                push(leaf)
+
             # Making search easier when there is a left operand as column.o2m or column.m2m
             elif len(path) > 1 and column._type in ['many2many', 'one2many']:
                 right_ids = comodel.search(cr, uid, [(path[1], operator, right)], context=context)
@@ -913,12 +1022,12 @@ class expression(object):
             # -------------------------------------------------
 
             # Applying recursivity on field(one2many)
-            elif column._type == 'one2many' and operator == 'child_of':
+            elif column._type == 'one2many' and operator in HIERARCHY_OPERATORS:
                 ids2 = to_ids(right, comodel, context)
                 if column._obj != model._name:
-                    dom = child_of_domain(left, ids2, comodel, prefix=column._obj)
+                    dom = hierarchy_domain(operator, left, ids2, comodel, prefix=column._obj, context=context)
                 else:
-                    dom = child_of_domain('id', ids2, model, parent=left)
+                    dom = hierarchy_domain(operator, 'id', ids2, model, parent=left, context=context)
                 for dom_leaf in reversed(dom):
                     push(create_substitution_leaf(leaf, dom_leaf, model))
 
@@ -947,21 +1056,24 @@ class expression(object):
                             o2m_op = 'not in' if operator in NEGATIVE_TERM_OPERATORS else 'in'
                             push(create_substitution_leaf(leaf, ('id', o2m_op, ids2), model))
 
-                if call_null:
+                if call_null and use_subqueries(comodel, context):
+                    o2m_op = 'inselect' if operator in NEGATIVE_TERM_OPERATORS else 'not inselect'
+                    push(create_substitution_leaf(leaf, ('id', o2m_op, select_distinct_from_where_not_null_query(column._fields_id, comodel._table)), model))
+                elif call_null:
                     o2m_op = 'in' if operator in NEGATIVE_TERM_OPERATORS else 'not in'
                     push(create_substitution_leaf(leaf, ('id', o2m_op, select_distinct_from_where_not_null(cr, column._fields_id, comodel._table)), model))
 
             elif column._type == 'many2many':
                 rel_table, rel_id1, rel_id2 = column._sql_names(model)
                 #FIXME
-                if operator == 'child_of':
+                if operator in HIERARCHY_OPERATORS:
                     def _rec_convert(ids):
                         if comodel == model:
                             return ids
                         return select_from_where(cr, rel_id1, rel_table, rel_id2, ids, operator)
 
                     ids2 = to_ids(right, comodel, context)
-                    dom = child_of_domain('id', ids2, comodel)
+                    dom = hierarchy_domain(operator, 'id', ids2, comodel, context=context)
                     ids2 = comodel.search(cr, uid, dom, context=context)
                     push(create_substitution_leaf(leaf, ('id', 'in', _rec_convert(ids2)), model))
                 else:
@@ -988,17 +1100,20 @@ class expression(object):
                             m2m_op = 'not in' if operator in NEGATIVE_TERM_OPERATORS else 'in'
                             push(create_substitution_leaf(leaf, ('id', m2m_op, select_from_where(cr, rel_id1, rel_table, rel_id2, res_ids, operator) or [0]), model))
 
-                    if call_null_m2m:
+                    if call_null_m2m and use_subqueries(comodel, context):
+                        m2m_op = 'inselect' if operator in NEGATIVE_TERM_OPERATORS else 'not inselect'
+                        push(create_substitution_leaf(leaf, ('id', m2m_op, select_distinct_from_where_not_null_query(rel_id1, rel_table)), model))
+                    elif call_null_m2m:
                         m2m_op = 'in' if operator in NEGATIVE_TERM_OPERATORS else 'not in'
                         push(create_substitution_leaf(leaf, ('id', m2m_op, select_distinct_from_where_not_null(cr, rel_id1, rel_table)), model))
 
             elif column._type == 'many2one':
-                if operator == 'child_of':
+                if operator in HIERARCHY_OPERATORS:
                     ids2 = to_ids(right, comodel, context)
                     if column._obj != model._name:
-                        dom = child_of_domain(left, ids2, comodel, prefix=column._obj)
+                        dom = hierarchy_domain(operator, left, ids2, comodel, prefix=column._obj, context=context)
                     else:
-                        dom = child_of_domain('id', ids2, model, parent=left)
+                        dom = hierarchy_domain(operator, 'id', ids2, model, parent=left, context=context)
                     for dom_leaf in reversed(dom):
                         push(create_substitution_leaf(leaf, dom_leaf, model))
                 else:
@@ -1032,6 +1032,35 @@ class many2many(_column):
                 for act_nbr in act[2]:
                     cr.execute('insert into '+rel+' ('+id1+','+id2+') values (%s, %s)', (id, act_nbr))
 
+    def set_on_create(self, cr, model, values_list, name, user=None, context=None):
+        """ Set the field on newly created records, where ``values_list`` is a
+            list of pairs ``(id, commands)``. The relation rows resulting from
+            commands ``4``, ``5`` and ``6`` are inserted together; the records
+            with other commands are processed by :meth:`set`.
+        """
+        rel, id1, id2 = self._sql_names(model)
+        rows = []
+        for id, values in values_list:
+            acts = [act for act in values or [] if isinstance(act, (list, tuple)) and act]
+            if any(act[0] not in (4, 5, 6) for act in acts):
+                self.set(cr, model, id, name, values, user, context=context)
+                continue
+            # the record is new, hence has no relation rows yet
+            targets = []
+            for act in acts:
+                if act[0] == 4:
+                    if act[1] not in targets:
+                        targets.append(act[1])
+                elif act[0] == 5:
+                    targets = []
+                else:
+                    targets = list(act[2])
+            rows.extend((id, target) for target in targets)
+
+        for sub_rows in tools.misc.split_every(cr.IN_MAX, rows):
+            cr.execute('insert into '+rel+' ('+id1+','+id2+') values ' + ','.join(['(%s,%s)'] * len(sub_rows)),
+                       [value for row in sub_rows for value in row])
+
     #
     # TODO: use a name_search
     #
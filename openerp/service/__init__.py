@@ -21,6 +21,8 @@
 ##############################################################################
 
 import common
+import cron
+import job
 import db
 import model
 import report
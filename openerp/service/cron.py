@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+""" Scheduling of the cron jobs of the databases.
+
+Instead of polling every database at a fixed interval, the scheduler keeps
+the delay before the next job of each database, as returned by
+``ir.cron._poll_jobs``, and sleeps until a database is due. It listens to
+the notifications sent by ``ir.cron`` when the jobs of a database change,
+and polls that database again right away.
+"""
+import calendar
+import errno
+import fcntl
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+import psycopg2.extensions
+
+import openerp
+from openerp.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# maximal delay between two polls of a database
+MAX_POLL_INTERVAL = 60 * 60
+# delay between two updates of the list of databases
+DB_LIST_INTERVAL = 60
+# delay before polling again a database that failed
+ERROR_POLL_INTERVAL = 60
+# delay before dispatching again a job processed by another process
+LOCKED_JOB_INTERVAL = 60
+
+
+class CronStat(object):
+    """ Statistics of the runs of a cron job """
+    __slots__ = ('count', 'time', 'max_time', 'delay')
+
+    def __init__(self):
+        self.count = 0          # number of runs
+        self.time = 0.0         # total run time
+        self.max_time = 0.0     # longest run time
+        self.delay = 0.0        # total delay between planned and actual start
+
+    def add(self, run_time, delay):
+        self.count += 1
+        self.time += run_time
+        self.max_time = max(self.max_time, run_time)
+        self.delay += max(delay, 0.0)
+
+# {(dbname, job name): CronStat}
+CRON_STAT = defaultdict(CronStat)
+
+
+def log_stats():
+    """ Log the statistics of the cron jobs run by this process. """
+    for (db_name, name), stat in sorted(CRON_STAT.items()):
+        _logger.info("%6d runs, %8.3fs avg time, %8.3fs max time, %8.3fs avg delay, for cron %r of %s",
+                     stat.count, stat.time / stat.count, stat.max_time,
+                     stat.delay / stat.count, name, db_name)
+
+
+class CronScheduler(object):
+    """ Schedules the cron jobs of the databases returned by ``db_names()``.
+
+    Due jobs are passed to ``dispatch(db_name, job)`` by :meth:`run_due`, and
+    their processing must be reported to :meth:`done`. A job is never
+    dispatched while it is being processed, and at most
+    ``cron_max_jobs_per_db`` jobs of a database are processed at the same
+    time (config file option, 0 means no limit).
+    """
+    def __init__(self, db_names):
+        self.db_names = db_names
+        self.max_jobs_per_db = int(config.get('cron_max_jobs_per_db', 0))
+        self.lock = threading.RLock()
+        self.due = {}                   # {db_name: time of the next poll}
+        self.running = set()            # {(db_name, job_id)} being processed
+        self.db_running = defaultdict(int)  # {db_name: number of jobs being processed}
+        self.skipped = {}               # {(db_name, job_id): time before which it is not dispatched}
+        self.listeners = {}             # {db_name: connection listening to CRON_CHANNEL}
+        self.db_list_time = 0
+        self.pipe = os.pipe()           # wakes up wait()
+        for fd in self.pipe:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags)
+
+    def _refresh_databases(self, now):
+        """ Update the databases to schedule. """
+        db_names = set(self.db_names())
+        with self.lock:
+            for db_name in db_names.difference(self.due):
+                self.due[db_name] = now
+            for db_name in set(self.due).difference(db_names):
+                del self.due[db_name]
+                self._unlisten(db_name)
+        self.db_list_time = now
+
+    def _listen(self, db_name):
+        if db_name in self.listeners:
+            return
+        try:
+            conn = psycopg2.connect(openerp.sql_db.dsn(db_name)[1])
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute("LISTEN %s" % openerp.addons.base.ir.ir_cron.CRON_CHANNEL)
+        except psycopg2.Error:
+            _logger.warning("Cannot listen to the cron jobs changes of database %s", db_name, exc_info=True)
+        else:
+            self.listeners[db_name] = conn
+
+    def _unlisten(self, db_name):
+        conn = self.listeners.pop(db_name, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def wake_up(self, db_name=None):
+        """ Poll the database ``db_name`` (or all of them) as soon as possible. """
+        with self.lock:
+            for name in ([db_name] if db_name else self.due.keys()):
+                if name in self.due:
+                    self.due[name] = 0
+        try:
+            os.write(self.pipe[1], '.')
+        except OSError, e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def wait(self, timeout):
+        """ Sleep until a database is due, a database is notified, or
+        ``timeout`` seconds elapsed.
+        """
+        now = time.time()
+        if now - self.db_list_time >= DB_LIST_INTERVAL:
+            self._refresh_databases(now)
+        with self.lock:
+            next_due = min(self.due.values()) if self.due else now + timeout
+        if next_due <= now:
+            return
+        timeout = min(next_due - now, timeout, self.db_list_time + DB_LIST_INTERVAL - now)
+        conns = dict((conn, db_name) for db_name, conn in self.listeners.items())
+        try:
+            ready = select.select(conns.keys() + [self.pipe[0]], [], [], max(timeout, 0))[0]
+        except select.error, e:
+            if e[0] != errno.EINTR:
+                raise
+            return
+        for fd in ready:
+            if fd == self.pipe[0]:
+                try:
+                    os.read(fd, 4096)
+                except OSError, e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+                continue
+            db_name = conns[fd]
+            try:
+                fd.poll()
+            except psycopg2.Error:
+                self._unlisten(db_name)
+            if fd.notifies:
+                del fd.notifies[:]
+                with self.lock:
+                    if db_name in self.due:
+                        self.due[db_name] = 0
+
+    def run_due(self, dispatch):
+        """ Poll the databases that are due, and dispatch their due jobs.
+        Returns the number of dispatched jobs.
+        """
+        now = time.time()
+        with self.lock:
+            db_names = [db_name for db_name, due in self.due.iteritems() if due <= now]
+        count = 0
+        for db_name in db_names:
+            with self.lock:
+                # a notification received while polling resets this
+                self.due[db_name] = now + MAX_POLL_INTERVAL
+            self._listen(db_name)
+            jobs, delay = openerp.addons.base.ir.ir_cron.ir_cron._poll_jobs(db_name)
+            due_jobs = []
+            with self.lock:
+                next_due = now + min(MAX_POLL_INTERVAL if delay is None else delay, MAX_POLL_INTERVAL)
+                if db_name not in self.listeners:
+                    next_due = min(next_due, now + ERROR_POLL_INTERVAL)
+                for job in jobs:
+                    if (db_name, job['id']) in self.running:
+                        continue
+                    skipped = self.skipped.get((db_name, job['id']))
+                    if skipped is not None:
+                        if skipped > now:
+                            # processed by another process, check it later
+                            next_due = min(next_due, skipped)
+                            continue
+                        del self.skipped[(db_name, job['id'])]
+                    if self.max_jobs_per_db and self.db_running[db_name] >= self.max_jobs_per_db:
+                        # polled again when a job of the database is done
+                        break
+                    self.running.add((db_name, job['id']))
+                    self.db_running[db_name] += 1
+                    due_jobs.append(job)
+                if self.due.get(db_name):
+                    self.due[db_name] = next_due
+            for job in due_jobs:
+                dispatch(db_name, job)
+                count += 1
+        return count
+
+    def process(self, db_name, job):
+        """ Process ``job`` and record its statistics. Returns whether the
+        job was processed by this process.
+        """
+        start = time.time()
+        processed = False
+        try:
+            processed = openerp.addons.base.ir.ir_cron.ir_cron._run_job(db_name, job)
+        except Exception:
+            _logger.exception("Failed to process cron job %r of database %s", job['name'], db_name)
+        finally:
+            self.done(db_name, job, processed)
+        if processed:
+            try:
+                planned = calendar.timegm(time.strptime(str(job['nextcall'])[:19], '%Y-%m-%d %H:%M:%S'))
+            except ValueError:
+                planned = start
+            CRON_STAT[(db_name, job['name'])].add(time.time() - start, start - planned)
+        return processed
+
+    def done(self, db_name, job, processed=True):
+        """ Report the end of the processing of ``job``: its database is
+        polled again to get its next planned job. A job that was not
+        processed because another process is processing it is not
+        dispatched again before ``LOCKED_JOB_INTERVAL`` seconds.
+        """
+        with self.lock:
+            self.running.discard((db_name, job['id']))
+            self.db_running[db_name] -= 1
+            if not processed:
+                retry = time.time() + LOCKED_JOB_INTERVAL
+                self.skipped[(db_name, job['id'])] = retry
+                if db_name in self.due:
+                    self.due[db_name] = min(self.due[db_name], retry)
+        if processed:
+            self.wake_up(db_name)
+
+
+class ThreadedCronScheduler(CronScheduler):
+    """ Scheduler running in a thread, and processing the jobs with a pool of
+    ``workers`` threads.
+    """
+    def __init__(self, db_names, workers):
+        super(ThreadedCronScheduler, self).__init__(db_names)
+        self.workers = workers
+        self.queue = []
+        self.queue_cond = threading.Condition()
+
+    def dispatch(self, db_name, job):
+        with self.queue_cond:
+            self.queue.append((db_name, job))
+            self.queue_cond.notify()
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self.work, name="openerp.service.cron.cron%d" % i)
+            t.setDaemon(True)
+            t.start()
+        t = threading.Thread(target=self.run, name="openerp.service.cron.scheduler")
+        t.setDaemon(True)
+        t.start()
+
+    def run(self):
+        while True:
+            try:
+                self.wait(MAX_POLL_INTERVAL)
+                self.run_due(self.dispatch)
+            except Exception:
+                _logger.exception("Exception in cron scheduler")
+                time.sleep(ERROR_POLL_INTERVAL)
+
+    def work(self):
+        while True:
+            with self.queue_cond:
+                while not self.queue:
+                    self.queue_cond.wait()
+                db_name, job = self.queue.pop(0)
+            self.process(db_name, job)
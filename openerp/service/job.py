@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+""" Processing of the queued jobs of the databases, see ``ir.job``.
+
+The job runners process the pending jobs of each database until none is
+left, then sleep until ``ir.job`` notifies them that jobs have been
+enqueued, or until the next poll. The ``job_channels`` option of the
+configuration file limits the number of jobs of each channel processed at
+the same time on a database, e.g. ``job_channels = root:4,mail:2``; the jobs
+of a channel that is not listed count as jobs of channel ``root``.
+"""
+import errno
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+import openerp
+from openerp.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# maximal delay between two polls of a database, for the retried and
+# planned jobs
+POLL_INTERVAL = 10
+# delay before processing again the jobs after an unexpected error
+ERROR_INTERVAL = 60
+
+
+def parse_channels(spec):
+    """ Return the capacity of the channels described by ``spec``, as a
+    dictionary ``{channel: capacity}``, e.g. ``"root:4,mail:2"`` gives
+    ``{'root': 4, 'mail': 2}``. The capacity of a channel defaults to 1.
+    """
+    channels = {'root': 1}
+    for item in (spec or '').split(','):
+        name, _sep, capacity = item.strip().partition(':')
+        if name:
+            channels[name] = max(int(capacity or 1), 1)
+    return channels
+
+
+class JobRunner(object):
+    """ Processes the jobs of the databases returned by ``db_names()``. """
+    def __init__(self, db_names):
+        self.db_names = db_names
+        self.channels = parse_channels(config.get('job_channels', 'root:1'))
+        self.listeners = {}             # {db_name: connection listening to JOB_CHANNEL}
+
+    def _listen(self, db_name):
+        if db_name in self.listeners:
+            return
+        try:
+            conn = psycopg2.connect(openerp.sql_db.dsn(db_name)[1])
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute("LISTEN %s" % openerp.addons.base.ir.ir_job.JOB_CHANNEL)
+        except psycopg2.Error:
+            _logger.warning("Cannot listen to the jobs of database %s", db_name, exc_info=True)
+        else:
+            self.listeners[db_name] = conn
+
+    def _unlisten(self, db_name):
+        conn = self.listeners.pop(db_name, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def wait(self, timeout):
+        """ Sleep until jobs are enqueued on a database, or ``timeout``
+        seconds elapsed.
+        """
+        conns = dict((conn, db_name) for db_name, conn in self.listeners.items())
+        try:
+            ready = select.select(conns.keys(), [], [], min(timeout, POLL_INTERVAL))[0]
+        except select.error, e:
+            if e[0] != errno.EINTR:
+                raise
+            return
+        for conn in ready:
+            try:
+                conn.poll()
+            except psycopg2.Error:
+                self._unlisten(conns[conn])
+                continue
+            del conn.notifies[:]
+
+    def run_next(self):
+        """ Process the next pending job of each database, and return the
+        names of the databases whose job was processed.
+        """
+        db_names = self.db_names()
+        for db_name in set(self.listeners).difference(db_names):
+            self._unlisten(db_name)
+        processed = []
+        for db_name in db_names:
+            self._listen(db_name)
+            if openerp.addons.base.ir.ir_job.ir_job._run_next(db_name, self.channels):
+                processed.append(db_name)
+        return processed
+
+
+class ThreadedJobRunner(JobRunner):
+    """ Job runner processing the jobs in a thread. """
+    def start(self, name):
+        t = threading.Thread(target=self.run, name=name)
+        t.setDaemon(True)
+        t.start()
+
+    def run(self):
+        while True:
+            try:
+                if not self.run_next():
+                    self.wait(POLL_INTERVAL)
+            except Exception:
+                _logger.exception("Exception in job runner")
+                time.sleep(ERROR_INTERVAL)
@@ -164,7 +164,10 @@ def execute_kw(db, uid, obj, method, args, kw=None):
 @check
 def execute(db, uid, obj, method, *args, **kw):
     threading.currentThread().dbname = db
-    with openerp.registry(db).cursor() as cr:
+    registry = openerp.registry(db)
+    # methods that do not write may run on a replica of the database
+    readonly = getattr(getattr(registry.get(obj), method, None), '_readonly', False)
+    with registry.cursor(readonly=readonly) as cr:
         if method.startswith('_'):
             raise except_orm('Access Denied', 'Private methods (such as %s) cannot be called remotely.' % (method,))
         res = execute_cr(cr, uid, obj, method, *args, **kw)
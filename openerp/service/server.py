@@ -1,16 +1,20 @@
 #-----------------------------------------------------------
 # Threaded, Gevent and Prefork Servers
 #-----------------------------------------------------------
+import collections
 import datetime
 import errno
+import gc
 import logging
 import os
 import os.path
 import platform
 import random
+import re
 import select
 import signal
 import socket
+import struct
 import subprocess
 import sys
 import threading
@@ -44,6 +48,15 @@ _logger = logging.getLogger(__name__)
 
 SLEEP_INTERVAL = 60     # 1 min
 
+# autoscaling of the HTTP workers: the latency of the requests of the last
+# AUTOSCALE_WINDOW seconds is considered, and the number of workers changes
+# at most once every AUTOSCALE_COOLDOWN seconds
+AUTOSCALE_WINDOW = 10
+AUTOSCALE_COOLDOWN = 2
+
+# threshold of full garbage collections after preloading the registries
+GC_FULL_THRESHOLD = 1000
+
 #----------------------------------------------------------
 # Werkzeug WSGI servers patched
 #----------------------------------------------------------
@@ -245,36 +258,34 @@ class ThreadedServer(CommonServer):
             openerp.phoenix = True
             self.quit_signals_received += 1
 
-    def cron_thread(self, number):
-        while True:
-            time.sleep(SLEEP_INTERVAL + number)     # Steve Reich timing style
-            registries = openerp.modules.registry.RegistryManager.registries
-            _logger.debug('cron%d polling for jobs', number)
-            for db_name, registry in registries.iteritems():
-                while registry.ready:
-                    acquired = openerp.addons.base.ir.ir_cron.ir_cron._acquire_job(db_name)
-                    if not acquired:
-                        break
-
     def cron_spawn(self):
-        """ Start the above runner function in a daemon thread.
+        """ Start the cron scheduler and its worker threads.
 
-        The thread is a typical daemon thread: it will never quit and must be
-        terminated when the main process exits - with no consequence (the processing
-        threads it spawns are not marked daemon).
+        The threads are typical daemon threads: they will never quit and must
+        be terminated when the main process exits - with no consequence (the
+        processing threads they spawn are not marked daemon).
 
         """
         # Force call to strptime just before starting the cron thread
         # to prevent time.strptime AttributeError within the thread.
         # See: http://bugs.python.org/issue7980
         datetime.datetime.strptime('2012-01-01', '%Y-%m-%d')
-        for i in range(openerp.tools.config['max_cron_threads']):
-            def target():
-                self.cron_thread(i)
-            t = threading.Thread(target=target, name="openerp.service.cron.cron%d" % i)
-            t.setDaemon(True)
-            t.start()
-            _logger.debug("cron%d started!" % i)
+        def db_names():
+            registries = openerp.modules.registry.RegistryManager.registries
+            return [db_name for db_name, registry in registries.items() if registry.ready]
+        scheduler = openerp.service.cron.ThreadedCronScheduler(db_names, openerp.tools.config['max_cron_threads'])
+        scheduler.start()
+        _logger.debug("cron scheduler started with %d threads", scheduler.workers)
+
+    def job_spawn(self):
+        """ Start the threads processing the queued jobs. """
+        def db_names():
+            registries = openerp.modules.registry.RegistryManager.registries
+            return [db_name for db_name, registry in registries.items() if registry.ready]
+        for i in range(openerp.tools.config['max_job_threads']):
+            runner = openerp.service.job.ThreadedJobRunner(db_names)
+            runner.start("openerp.service.job.job%d" % i)
+        _logger.debug("job runner started with %d threads", openerp.tools.config['max_job_threads'])
 
     def http_thread(self):
         def app(e, s):
@@ -306,10 +317,13 @@ class ThreadedServer(CommonServer):
             # some tests need the http deamon to be available...
             self.http_spawn()
 
-        if not stop:
+        if not stop and config['max_cron_threads']:
             # only relevant if we are not in "--stop-after-init" mode
             self.cron_spawn()
 
+        if not stop and config['max_job_threads']:
+            self.job_spawn()
+
     def stop(self):
         """ Shutdown the WSGI server. Wait for non deamon threads.
         """
@@ -419,7 +433,15 @@ class PreforkServer(CommonServer):
     def __init__(self, app):
         # config
         self.address = (config['xmlrpc_interface'] or '0.0.0.0', config['xmlrpc_port'])
-        self.population = config['workers']
+        # the number of HTTP workers is scaled between min_population and
+        # max_population, from the accept queue and the latency of requests
+        self.max_population = config['workers']
+        self.min_population = min(config['min_workers'] or self.max_population, self.max_population)
+        self.population = self.min_population
+        self.autoscale_latency = float(config.get('autoscale_latency', 2.0))
+        self.autoscale_idle_time = float(config.get('autoscale_idle_time', 60))
+        self.latencies = collections.deque()    # [(time, duration)] of the recent requests
+        self.scale_time = 0
         self.timeout = config['limit_time_real']
         self.limit_request = config['limit_request']
         # working vars
@@ -429,6 +451,7 @@ class PreforkServer(CommonServer):
         self.socket = None
         self.workers_http = {}
         self.workers_cron = {}
+        self.workers_job = {}
         self.workers = {}
         self.generation = 0
         self.queue = []
@@ -445,10 +468,10 @@ class PreforkServer(CommonServer):
             fcntl.fcntl(fd, fcntl.F_SETFD, flags)
         return pipe
 
-    def pipe_ping(self, pipe):
+    def pipe_ping(self, pipe, data='.'):
         try:
-            os.write(pipe[1], '.')
-        except IOError, e:
+            os.write(pipe[1], data)
+        except (IOError, OSError), e:
             if e.errno not in [errno.EAGAIN, errno.EINTR]:
                 raise
 
@@ -488,6 +511,7 @@ class PreforkServer(CommonServer):
             try:
                 self.workers_http.pop(pid, None)
                 self.workers_cron.pop(pid, None)
+                self.workers_job.pop(pid, None)
                 u = self.workers.pop(pid)
                 u.close()
             except OSError:
@@ -515,6 +539,7 @@ class PreforkServer(CommonServer):
             elif sig == signal.SIGUSR1:
                 # log ormcache stats on kill -SIGUSR1
                 log_ormcache_stats()
+                self.log_memory()
             elif sig == signal.SIGTTIN:
                 # increase number of workers
                 self.population += 1
@@ -522,6 +547,32 @@ class PreforkServer(CommonServer):
                 # decrease number of workers
                 self.population -= 1
 
+    def log_memory(self):
+        """ Log the memory used by each process: its private resident
+        memory, and the resident memory it shares with the other processes,
+        e.g., the registries preloaded by the master.
+        """
+        for pid, name in [(self.pid, 'Master')] + \
+                [(pid, worker.__class__.__name__) for pid, worker in sorted(self.workers.items())]:
+            usage = memory_usage(pid)
+            if usage:
+                _logger.info("%8dk unique, %8dk shared, for %s (%s)",
+                             usage[0] // 1024, usage[1] // 1024, name, pid)
+
+    def preload_databases(self, preload):
+        """ Return the databases to preload in the master: the ones given,
+        and the ones matching --db-filter.
+        """
+        db_names = list(preload or [])
+        dbfilter = config['dbfilter']
+        if '%h' in dbfilter or '%d' in dbfilter:
+            _logger.warning("Cannot preload the databases of a host-dependent --db-filter")
+            return db_names
+        for db_name in openerp.service.db.exp_list(True):
+            if re.match(dbfilter, db_name) and db_name not in db_names:
+                db_names.append(db_name)
+        return db_names
+
     def process_zombie(self):
         # reap dead workers
         while 1:
@@ -547,6 +598,49 @@ class PreforkServer(CommonServer):
                 _logger.error("Worker (%s) timeout", pid)
                 self.worker_kill(pid, signal.SIGKILL)
 
+    def socket_backlog(self):
+        """ Return the number of connections waiting to be accepted on the
+        listening socket, when the platform provides it (Linux).
+        """
+        try:
+            # tcpi_unacked of struct tcp_info is the accept queue length
+            info = self.socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+            return struct.unpack('8B6I', info[:32])[12]
+        except (AttributeError, socket.error, struct.error):
+            return 0
+
+    def process_autoscale(self):
+        """ Add an HTTP worker when connections wait to be accepted or the
+        requests are slow, and stop gracefully a worker idle for
+        ``autoscale_idle_time`` seconds when the workers keep up.
+        """
+        if not config['xmlrpc'] or self.min_population >= self.max_population:
+            return
+        now = time.time()
+        while self.latencies and self.latencies[0][0] < now - AUTOSCALE_WINDOW:
+            self.latencies.popleft()
+        if now - self.scale_time < AUTOSCALE_COOLDOWN:
+            return
+        backlog = self.socket_backlog()
+        latencies = sorted(duration for _time, duration in self.latencies)
+        latency = latencies[len(latencies) * 9 // 10] if latencies else 0.0
+        if (backlog or latency > self.autoscale_latency) and self.population < self.max_population:
+            self.population += 1
+            self.scale_time = now
+            _logger.info("Scaling up to %d HTTP workers (backlog: %d, latency: %.3fs)",
+                         self.population, backlog, latency)
+        elif not backlog and self.population > self.min_population:
+            idle = [worker for worker in self.workers_http.itervalues()
+                    if not worker.stopping and now - worker.request_time >= self.autoscale_idle_time]
+            if idle:
+                worker = min(idle, key=lambda worker: worker.request_time)
+                worker.stopping = True
+                self.population -= 1
+                self.scale_time = now
+                _logger.info("Scaling down to %d HTTP workers", self.population)
+                # the worker exits after its current request
+                self.worker_kill(worker.pid, signal.SIGINT)
+
     def process_spawn(self):
         if config['xmlrpc']:
             while len(self.workers_http) < self.population:
@@ -555,6 +649,8 @@ class PreforkServer(CommonServer):
                 self.long_polling_spawn()
         while len(self.workers_cron) < config['max_cron_threads']:
             self.worker_spawn(WorkerCron, self.workers_cron)
+        while len(self.workers_job) < config['max_job_threads']:
+            self.worker_spawn(WorkerJob, self.workers_job)
 
     def sleep(self):
         try:
@@ -564,20 +660,34 @@ class PreforkServer(CommonServer):
             # check for ping or internal wakeups
             ready = select.select(fd_in, [], [], self.beat)
             # update worker watchdogs
+            now = time.time()
             for fd in ready[0]:
-                if fd in fds:
-                    fds[fd].watchdog_time = time.time()
+                data = []
                 try:
                     # empty pipe
-                    while os.read(fd, 1):
-                        pass
+                    while True:
+                        chunk = os.read(fd, 4096)
+                        if not chunk:
+                            break
+                        data.append(chunk)
                 except OSError, e:
                     if e.errno not in [errno.EAGAIN]:
                         raise
+                if fd in fds:
+                    fds[fd].watchdog_time = now
+                    self.worker_report(fds[fd], ''.join(data), now)
         except select.error, e:
             if e[0] not in [errno.EINTR]:
                 raise
 
+    def worker_report(self, worker, data, now):
+        """ Process the reports ``r<milliseconds>;`` of the requests
+        processed by ``worker``.
+        """
+        for duration in re.findall(r'r(\d+);', data):
+            worker.request_time = now
+            self.latencies.append((now, int(duration) / 1000.0))
+
     def start(self):
         # wakeup pipe, python doesnt throw EINTR when a syscall is interrupted
         # by a signal simulating a pseudo SA_RESTART. We write to a pipe in the
@@ -598,7 +708,7 @@ class PreforkServer(CommonServer):
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.socket.setblocking(0)
         self.socket.bind(self.address)
-        self.socket.listen(8 * self.population)
+        self.socket.listen(8 * self.max_population)
 
     def stop(self, graceful=True):
         if self.long_polling_pid is not None:
@@ -628,9 +738,21 @@ class PreforkServer(CommonServer):
             self.stop()
             return rc
 
+        if config['preload_databases']:
+            # the registries built before forking are shared by the workers
+            for db_name in self.preload_databases(preload):
+                if db_name not in RegistryManager.registries:
+                    try:
+                        RegistryManager.new(db_name)
+                    except Exception:
+                        _logger.exception("Failed to preload database %s", db_name)
+
         # Empty the cursor pool, we dont want them to be shared among forked workers.
         openerp.sql_db.close_all()
 
+        if config['preload_databases']:
+            gc_freeze()
+
         _logger.debug("Multiprocess starting")
         while 1:
             try:
@@ -638,6 +760,7 @@ class PreforkServer(CommonServer):
                 self.process_signals()
                 self.process_zombie()
                 self.process_timeout()
+                self.process_autoscale()
                 self.process_spawn()
                 self.sleep()
             except KeyboardInterrupt:
@@ -663,6 +786,9 @@ class Worker(object):
         # should we rename into lifetime ?
         self.request_max = multi.limit_request
         self.request_count = 0
+        # used by the master for autoscaling
+        self.request_time = time.time()
+        self.stopping = False
 
     def setproctitle(self, title=""):
         setproctitle('openerp: %s %s %s' % (self.__class__.__name__, self.pid, title))
@@ -761,12 +887,15 @@ class WorkerHTTP(Worker):
         self.server.socket = client
         # tolerate broken pipe when the http client closes the socket before
         # receiving the full reply
+        start = time.time()
         try:
             self.server.process_request(client, addr)
         except IOError, e:
             if e.errno != errno.EPIPE:
                 raise
         self.request_count += 1
+        # report the duration of the request for autoscaling
+        self.multi.pipe_ping(self.watchdog_pipe, 'r%d;' % ((time.time() - start) * 1000))
 
     def process_work(self):
         try:
@@ -785,16 +914,15 @@ class WorkerCron(Worker):
 
     def __init__(self, multi):
         super(WorkerCron, self).__init__(multi)
-        # process_work() below process a single database per call.
-        # The variable db_index is keeping track of the next database to
-        # process.
-        self.db_index = 0
+        # The scheduler keeps track of the next planned job of each database,
+        # and is created in the worker process by start().
+        self.scheduler = None
 
     def sleep(self):
-        # Really sleep once all the databases have been processed.
-        if self.db_index == 0:
-            interval = SLEEP_INTERVAL + self.pid % 10   # chorus effect
-            time.sleep(interval)
+        # Sleep until a job is due, or a database has been notified of a
+        # change of its jobs; wake up regularly for the watchdog.
+        interval = SLEEP_INTERVAL + self.pid % 10   # chorus effect
+        self.scheduler.wait(interval)
 
     def _db_list(self):
         if config['db_name']:
@@ -807,42 +935,73 @@ class WorkerCron(Worker):
         rpc_request = logging.getLogger('openerp.netsvc.rpc.request')
         rpc_request_flag = rpc_request.isEnabledFor(logging.DEBUG)
         _logger.debug("WorkerCron (%s) polling for jobs", self.pid)
-        db_names = self._db_list()
-        if len(db_names):
-            self.db_index = (self.db_index + 1) % len(db_names)
-            db_name = db_names[self.db_index]
+        processed = set()
+
+        def process(db_name, job):
             self.setproctitle(db_name)
             if rpc_request_flag:
                 start_time = time.time()
                 start_rss, start_vms = psutil.Process(os.getpid()).get_memory_info()
 
-            import openerp.addons.base as base
-            base.ir.ir_cron.ir_cron._acquire_job(db_name)
-            openerp.modules.registry.RegistryManager.delete(db_name)
+            if not self.scheduler.process(db_name, job):
+                # processed by another process meanwhile
+                return
+            processed.add(db_name)
+            self.request_count += 1
 
-            # dont keep cursors in multi database mode
-            if len(db_names) > 1:
-                openerp.sql_db.close_db(db_name)
             if rpc_request_flag:
                 run_time = time.time() - start_time
                 end_rss, end_vms = psutil.Process(os.getpid()).get_memory_info()
                 vms_diff = (end_vms - start_vms) / 1024
-                logline = '%s time:%.3fs mem: %sk -> %sk (diff: %sk)' % \
-                    (db_name, run_time, start_vms / 1024, end_vms / 1024, vms_diff)
+                logline = '%s %r time:%.3fs mem: %sk -> %sk (diff: %sk)' % \
+                    (db_name, job['name'], run_time, start_vms / 1024, end_vms / 1024, vms_diff)
                 _logger.debug("WorkerCron (%s) %s", self.pid, logline)
 
-            self.request_count += 1
-            if self.request_count >= self.request_max and self.request_max < len(db_names):
-                _logger.error("There are more dabatases to process than allowed "
-                              "by the `limit_request` configuration variable: %s more.",
-                              len(db_names) - self.request_max)
-        else:
-            self.db_index = 0
+        self.scheduler.run_due(process)
+
+        db_count = len(self.scheduler.due)
+        for db_name in processed:
+            openerp.modules.registry.RegistryManager.delete(db_name)
+            # dont keep cursors in multi database mode
+            if db_count > 1:
+                openerp.sql_db.close_db(db_name)
+        self.setproctitle()
+
+        if self.request_count >= self.request_max and self.request_max < db_count:
+            _logger.error("There are more dabatases to process than allowed "
+                          "by the `limit_request` configuration variable: %s more.",
+                          db_count - self.request_max)
 
     def start(self):
         os.nice(10)     # mommy always told me to be nice with others...
         Worker.start(self)
         self.multi.socket.close()
+        self.scheduler = openerp.service.cron.CronScheduler(self._db_list)
+
+class WorkerJob(WorkerCron):
+    """ Queued job workers """
+
+    def __init__(self, multi):
+        super(WorkerJob, self).__init__(multi)
+        self.runner = None
+        self.processed = False
+
+    def sleep(self):
+        # Sleep only when no job was processed, until jobs are enqueued; wake
+        # up regularly for the watchdog and the planned jobs.
+        if not self.processed:
+            self.runner.wait(SLEEP_INTERVAL)
+
+    def process_work(self):
+        processed = self.runner.run_next()
+        self.processed = bool(processed)
+        self.request_count += len(processed)
+
+    def start(self):
+        os.nice(10)
+        Worker.start(self)
+        self.multi.socket.close()
+        self.runner = openerp.service.job.JobRunner(self._db_list)
 
 #----------------------------------------------------------
 # start/stop public api
@@ -902,6 +1061,36 @@ def load_test_file_py(registry, test_file):
                 if not success:
                     _logger.error('%s: at least one error occurred in a test', test_file)
 
+def memory_usage(pid):
+    """ Return the private and shared resident memory in bytes of process
+    ``pid``, from ``/proc/<pid>/smaps`` (Linux), or ``None``.
+    """
+    private = shared = 0
+    try:
+        with open('/proc/%d/smaps' % pid) as smaps:
+            for line in smaps:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    private += int(line.split()[1]) * 1024
+                elif line.startswith(('Shared_Clean:', 'Shared_Dirty:')):
+                    shared += int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        return None
+    return private, shared
+
+def gc_freeze():
+    """ Keep the garbage collector of the forked processes from writing to
+    the objects created so far, which would copy the memory pages they share
+    with the master.
+    """
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    else:
+        # Without gc.freeze(), only the full collections traverse the
+        # long-lived objects; make them rare.
+        threshold0, threshold1, threshold2 = gc.get_threshold()
+        gc.set_threshold(threshold0, threshold1, max(threshold2, GC_FULL_THRESHOLD))
+
 def preload_registries(dbnames):
     """ Preload a registries, possibly run a test file."""
     # TODO: move all config checks to args dont check tools.config here
@@ -27,9 +27,12 @@ the database, *not* a database abstraction toolkit. Database abstraction is what
 the ORM does, in fact.
 """
 
+from collections import defaultdict, deque, OrderedDict
 from contextlib import contextmanager
 from functools import wraps
+import itertools
 import logging
+import time
 import urlparse
 import uuid
 import psycopg2.extras
@@ -63,7 +66,9 @@ psycopg2.extensions.register_type(psycopg2.extensions.new_type((700, 701, 1700,)
 
 
 import tools
+from tools.cache import ormcache_counter
 from tools.func import frame_codeinfo
+from tools.lru import LRU
 from datetime import datetime as mdt
 from datetime import timedelta
 import threading
@@ -75,6 +80,10 @@ re_into = re.compile('.* into "?([a-zA-Z_0-9]+)"? .*$')
 
 sql_counter = 0
 
+# statistics of prepared statements: hit counts the executions of prepared
+# statements, miss the statements prepared, and err the failed preparations
+prepared_stat = ormcache_counter()
+
 class Cursor(object):
     """Represents an open transaction to the PostgreSQL DB backend,
        acting as a lightweight wrapper around psycopg2's
@@ -158,7 +167,7 @@ class Cursor(object):
             return f(self, *args, **kwargs)
         return wrapper
 
-    def __init__(self, pool, dbname, dsn, serialized=True):
+    def __init__(self, pool, dbname, dsn, serialized=True, replica=False):
         self.sql_from_log = {}
         self.sql_into_log = {}
 
@@ -177,6 +186,9 @@ class Cursor(object):
         # Whether to enable snapshot isolation level for this cursor.
         # see also the docstring of Cursor.
         self._serialized = serialized
+        # Whether the cursor is connected to a read-only replica of the
+        # database, which may lag behind the primary.
+        self.replica = replica
 
         self._cnx = pool.borrow(dsn)
         self._obj = self._cnx.cursor()
@@ -192,6 +204,9 @@ class Cursor(object):
 
         self.cache = {}
 
+        # the current transaction started at this time, at the earliest
+        self.transaction_start = time.time()
+
     def __build_dict(self, row):
         return {d.name: row[i] for i, d in enumerate(self._obj.description)}
     def dictfetchone(self):
@@ -231,7 +246,11 @@ class Cursor(object):
 
         try:
             params = params or None
-            res = self._obj.execute(query, params)
+            if self._cnx.prepared is not None and params:
+                query_exec = self._cnx.prepared.lookup(self, query, params)
+            else:
+                query_exec = query
+            res = self._obj.execute(query_exec, params)
         except psycopg2.ProgrammingError, pe:
             if self._default_log_exceptions if log_exceptions is None else log_exceptions:
                 _logger.error("Programming error: %s, in query %s", pe, query)
@@ -328,7 +347,7 @@ class Cursor(object):
         self._cnx.rollback()
 
         if leak:
-            self._cnx.leaked = True
+            self.__pool.leak(self._cnx)
         else:
             chosen_template = tools.config['db_template']
             templates_list = tuple(set(['template0', 'template1', 'postgres', chosen_template]))
@@ -360,13 +379,17 @@ class Cursor(object):
     def commit(self):
         """ Perform an SQL `COMMIT`
         """
-        return self._cnx.commit()
+        result = self._cnx.commit()
+        self.transaction_start = time.time()
+        return result
 
     @check
     def rollback(self):
         """ Perform an SQL `ROLLBACK`
         """
-        return self._cnx.rollback()
+        result = self._cnx.rollback()
+        self.transaction_start = time.time()
+        return result
 
     def __enter__(self):
         """ Using the cursor as a contextmanager automatically commits and
@@ -439,8 +462,134 @@ class TestCursor(Cursor):
         self.execute("ROLLBACK TO SAVEPOINT test_cursor")
         self.execute("SAVEPOINT test_cursor")
 
+class PreparedStatements(object):
+    """ The server-side prepared statements of a connection.
+
+        A query executed with positional parameters is prepared on the
+        connection once it has been executed `threshold` times; it is then
+        executed with ``EXECUTE``. The `size` most recently used statements
+        are kept, the others are deallocated.
+    """
+    def __init__(self, size, threshold):
+        self.size = max(size, 1)
+        self.threshold = max(threshold, 1)
+        self.counts = LRU(4 * self.size)     # {query: count}
+        self.names = OrderedDict()                      # {query: name}
+        self.sequence = 0
+
+    def lookup(self, cr, query, params):
+        """ Return the query to execute on cursor `cr` for `query` with
+            `params`: either `query` itself, or the execution of a prepared
+            statement for it.
+        """
+        if not isinstance(params, (tuple, list)) or not all(map(_preparable, params)):
+            return query
+
+        name = self.names.pop(query, None)
+        if name is not None:
+            self.names[query] = name
+            prepared_stat.hit += 1
+            return self._execute_query(name, params)
+
+        count = self.counts[query] + 1 if query in self.counts else 1
+        self.counts[query] = count
+        if count != self.threshold:
+            return query
+
+        name = self._prepare(cr, query, len(params))
+        if name is None:
+            return query
+        prepared_stat.hit += 1
+        return self._execute_query(name, params)
+
+    def _execute_query(self, name, params):
+        return 'EXECUTE %s (%s)' % (name, ','.join(['%s'] * len(params)))
+
+    def _prepare(self, cr, query, nparams):
+        """ Prepare a statement for `query` on the connection of `cr`, and
+            return its name, or ``None`` if the query cannot be prepared.
+        """
+        # PostgreSQL expects numbered placeholders; named placeholders, and
+        # star selections whose columns may change, are not prepared
+        placeholders = []
+        def replace(match):
+            if match.group(1) == '%':
+                return '%'
+            placeholders.append(match)
+            return '$%d' % len(placeholders)
+        pg_query = re_placeholder.sub(replace, query)
+        if len(placeholders) != nparams or '%(' in query or '*' in query or \
+                not query.lstrip()[:6].lower() in ('select', 'insert', 'update', 'delete'):
+            return None
+
+        self.sequence += 1
+        name = 'openerp_stmt_%d' % self.sequence
+        cnx = cr._cnx
+        # a failed preparation must not abort the current transaction
+        savepoint = cnx.isolation_level != ISOLATION_LEVEL_AUTOCOMMIT
+        obj = cnx.cursor()
+        try:
+            if savepoint:
+                obj.execute('SAVEPOINT prepare_statement')
+            try:
+                obj.execute('PREPARE %s AS %s' % (name, pg_query))
+            except psycopg2.Error:
+                if savepoint:
+                    obj.execute('ROLLBACK TO SAVEPOINT prepare_statement')
+                _logger.debug("Cannot prepare query: %s", query)
+                prepared_stat.err += 1
+                return None
+            if savepoint:
+                obj.execute('RELEASE SAVEPOINT prepare_statement')
+            prepared_stat.miss += 1
+
+            self.names[query] = name
+            if len(self.names) > self.size:
+                old_query, old_name = self.names.popitem(last=False)
+                obj.execute('DEALLOCATE %s' % old_name)
+                # the query is prepared again once executed `threshold` times
+                if old_query in self.counts:
+                    del self.counts[old_query]
+        finally:
+            obj.close()
+        return name
+
+    def clear(self):
+        """ Forget the prepared statements, deallocated by the server. """
+        self.counts.clear()
+        self.names.clear()
+
+    def __nonzero__(self):
+        return bool(self.names)
+
+re_placeholder = re.compile(r'%(%|s)')
+
+def _preparable(param):
+    """ Return whether a query parameter adapts to a literal that PostgreSQL
+        converts to the type of the corresponding parameter of a prepared
+        statement, with the same meaning.
+    """
+    if isinstance(param, list):
+        return all(map(_preparable, param))
+    return param is None or isinstance(param, (bool, int, long, basestring))
+
 class PsycoConnection(psycopg2.extensions.connection):
-    pass
+    # the server-side prepared statements of the connection, if enabled
+    prepared = None
+
+    def reset(self):
+        if not self.prepared:
+            return super(PsycoConnection, self).reset()
+        # psycopg2 resets the session with DISCARD ALL, which deallocates
+        # the prepared statements; do the same except for those
+        self.rollback()
+        self.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cr = self.cursor()
+        try:
+            cr.execute("CLOSE ALL; SET SESSION AUTHORIZATION DEFAULT; RESET ALL; "
+                       "UNLISTEN *; SELECT pg_advisory_unlock_all(); DISCARD TEMP")
+        finally:
+            cr.close()
 
 class ConnectionPool(object):
     """ The pool of connections to database(s)
@@ -448,111 +597,218 @@ class ConnectionPool(object):
         Keep a set of connections to pg databases open, and reuse them
         to open cursors for all transactions.
 
-        The connections are *not* automatically closed. Only a close_db()
-        can trigger that.
+        The idle connections are kept in one sub-pool per DSN, and are closed
+        after `idle_timeout` seconds of inactivity. When `maxconn` connections
+        are in use, borrowing a connection waits up to `timeout` seconds for
+        another one to be given back.
     """
 
     def locked(fun):
         @wraps(fun)
         def _locked(self, *args, **kwargs):
-            self._lock.acquire()
-            try:
+            with self._lock:
                 return fun(self, *args, **kwargs)
-            finally:
-                self._lock.release()
         return _locked
 
-    def __init__(self, maxconn=64):
-        self._connections = []
+    def __init__(self, maxconn=64, prepare_threshold=0, prepare_size=100,
+                 timeout=10, idle_timeout=600):
+        self._idle = defaultdict(deque)     # {dsn: deque([(cnx, idle_since), ...])}
+        self._used = {}                     # {cnx: dsn}
+        self._leaked = deque()              # leaked connections to free
+        self._count = 0                     # connections open or being opened
         self._maxconn = max(maxconn, 1)
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+        self._last_reap = time.time()
         self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # server-side prepared statements are enabled by a positive threshold
+        self._prepare_threshold = prepare_threshold
+        self._prepare_size = prepare_size
+        # metrics
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
 
     def __repr__(self):
-        used = len([1 for c, u in self._connections[:] if u])
-        count = len(self._connections)
-        return "ConnectionPool(used=%d/count=%d/max=%d)" % (used, count, self._maxconn)
+        return "ConnectionPool(used=%d/count=%d/max=%d)" % (len(self._used), self._count, self._maxconn)
 
     def _debug(self, msg, *args):
         _logger.debug(('%r ' + msg), self, *args)
 
-    @locked
+    def stats(self):
+        """ Return a dictionary with the metrics of the pool. """
+        return {
+            'borrowed': len(self._used),
+            'idle': sum(len(idle) for idle in self._idle.values()),
+            'count': self._count,
+            'max': self._maxconn,
+            'waits': self._waits,
+            'wait_time': self._wait_time,
+            'timeouts': self._timeouts,
+        }
+
     def borrow(self, dsn):
-        # free dead and leaked connections
-        for i, (cnx, _) in tools.reverse_enumerate(self._connections):
-            if cnx.closed:
-                self._connections.pop(i)
-                self._debug('Removing closed connection at index %d: %r', i, cnx.dsn)
+        while True:
+            cnx, new = self._acquire(dsn)
+            if new:
+                break
+            try:
+                cnx.reset()
+            except psycopg2.OperationalError:
+                self._debug('Cannot reset connection: %r', cnx.dsn)
+                # psycopg2 2.4.4 and earlier do not allow closing a closed connection
+                if not cnx.closed:
+                    cnx.close()
+                self._forget(cnx)
                 continue
-            if getattr(cnx, 'leaked', False):
-                delattr(cnx, 'leaked')
-                self._connections.pop(i)
-                self._connections.append((cnx, False))
-                _logger.warning('%r: Free leaked connection to %r', self, cnx.dsn)
-
-        for i, (cnx, used) in enumerate(self._connections):
-            if not used and cnx._original_dsn == dsn:
-                try:
-                    cnx.reset()
-                except psycopg2.OperationalError:
-                    self._debug('Cannot reset connection at index %d: %r', i, cnx.dsn)
-                    # psycopg2 2.4.4 and earlier do not allow closing a closed connection
-                    if not cnx.closed:
-                        cnx.close()
-                    continue
-                self._connections.pop(i)
-                self._connections.append((cnx, True))
-                self._debug('Borrow existing connection to %r at index %d', cnx.dsn, i)
-
-                return cnx
-
-        if len(self._connections) >= self._maxconn:
-            # try to remove the oldest connection not used
-            for i, (cnx, used) in enumerate(self._connections):
-                if not used:
-                    self._connections.pop(i)
-                    if not cnx.closed:
-                        cnx.close()
-                    self._debug('Removing old connection at index %d: %r', i, cnx.dsn)
-                    break
-            else:
-                # note: this code is called only if the for loop has completed (no break)
-                raise PoolError('The Connection Pool Is Full')
+            self._debug('Borrow existing connection to %r', cnx.dsn)
+            return cnx
 
+        # open a new connection, outside of the lock
         try:
             result = psycopg2.connect(dsn=dsn, connection_factory=PsycoConnection)
         except psycopg2.Error:
             _logger.exception('Connection to the database failed')
+            with self._cond:
+                self._count -= 1
+                self._cond.notify()
             raise
         result._original_dsn = dsn
-        self._connections.append((result, True))
+        if self._prepare_threshold > 0:
+            result.prepared = PreparedStatements(self._prepare_size, self._prepare_threshold)
+        with self._lock:
+            self._used[result] = dsn
         self._debug('Create new connection')
         return result
 
+    def _acquire(self, dsn):
+        """ Return a pair ``(cnx, False)`` with an idle connection to `dsn`,
+            or ``(None, True)`` if a new connection may be opened. Wait for a
+            connection to be given back while the pool is full.
+        """
+        start = None
+        with self._cond:
+            self._free_leaked()
+            self._reap_idle()
+            while True:
+                idle = self._idle[dsn]
+                while idle:
+                    # reuse the most recently used connection first
+                    cnx, _ = idle.pop()
+                    if not cnx.closed:
+                        self._used[cnx] = dsn
+                        return cnx, False
+                    self._count -= 1
+                    self._debug('Removing closed connection to %r', cnx.dsn)
+
+                if self._count < self._maxconn or self._close_oldest_idle():
+                    # reserve a slot for the new connection
+                    self._count += 1
+                    return None, True
+
+                now = time.time()
+                if start is None:
+                    start = now
+                    self._waits += 1
+                remaining = start + self._timeout - now
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolError('The Connection Pool Is Full')
+                self._cond.wait(remaining)
+                self._wait_time += time.time() - now
+                self._free_leaked()
+
+    def _close_oldest_idle(self):
+        """ Close the oldest idle connection, and return whether there was one. """
+        oldest = None
+        for idle in self._idle.itervalues():
+            if idle and (oldest is None or idle[0][1] < oldest[0][1]):
+                oldest = idle
+        if oldest is None:
+            return False
+        cnx, _ = oldest.popleft()
+        if not cnx.closed:
+            cnx.close()
+        self._count -= 1
+        self._debug('Removing old connection to %r', cnx.dsn)
+        return True
+
+    def _reap_idle(self):
+        """ Close the connections idle for more than `idle_timeout` seconds. """
+        now = time.time()
+        if now - self._last_reap < min(self._idle_timeout, 60):
+            return
+        self._last_reap = now
+        limit = now - self._idle_timeout
+        for dsn, idle in self._idle.items():
+            # idle connections are given back in chronological order
+            while idle and idle[0][1] < limit:
+                cnx, _ = idle.popleft()
+                if not cnx.closed:
+                    cnx.close()
+                self._count -= 1
+                self._debug('Closing idle connection to %r', cnx.dsn)
+            if not idle:
+                del self._idle[dsn]
+
+    def _free_leaked(self):
+        while self._leaked:
+            cnx = self._leaked.popleft()
+            dsn = self._used.pop(cnx, None)
+            if dsn is not None:
+                self._idle[dsn].append((cnx, time.time()))
+                _logger.warning('%r: Free leaked connection to %r', self, cnx.dsn)
+
+    def _forget(self, connection):
+        """ Remove a closed connection borrowed from the pool. """
+        with self._cond:
+            if self._used.pop(connection, None) is not None:
+                self._count -= 1
+                self._cond.notify()
+
+    def leak(self, connection):
+        """ Mark a borrowed connection as leaked; it will be freed by the next
+            borrower. This does not take the lock, as it is called by cursor
+            finalizers, which may run in any thread at any time.
+        """
+        self._leaked.append(connection)
+
     @locked
     def give_back(self, connection, keep_in_pool=True):
         self._debug('Give back connection to %r', connection.dsn)
-        for i, (cnx, used) in enumerate(self._connections):
-            if cnx is connection:
-                self._connections.pop(i)
-                if keep_in_pool:
-                    self._connections.append((cnx, False))
-                    self._debug('Put connection to %r in pool', cnx.dsn)
-                else:
-                    self._debug('Forgot connection to %r', cnx.dsn)
-                    cnx.close()
-                break
-        else:
+        dsn = self._used.pop(connection, None)
+        if dsn is None:
             raise PoolError('This connection does not below to the pool')
+        if keep_in_pool and not connection.closed:
+            self._idle[dsn].append((connection, time.time()))
+            self._debug('Put connection to %r in pool', connection.dsn)
+        else:
+            self._debug('Forgot connection to %r', connection.dsn)
+            if not connection.closed:
+                connection.close()
+            self._count -= 1
+        self._cond.notify()
 
     @locked
     def close_all(self, dsn=None):
         count = 0
         last = None
-        for i, (cnx, used) in tools.reverse_enumerate(self._connections):
-            if dsn is None or cnx._original_dsn == dsn:
+        for cnx, cnx_dsn in self._used.items():
+            if dsn is None or cnx_dsn == dsn:
                 cnx.close()
-                last = self._connections.pop(i)[0]
+                del self._used[cnx]
+                last = cnx
                 count += 1
+        for cnx_dsn, idle in self._idle.items():
+            if dsn is None or cnx_dsn == dsn:
+                for cnx, _ in idle:
+                    cnx.close()
+                    last = cnx
+                    count += 1
+                del self._idle[cnx_dsn]
+        self._count -= count
+        self._cond.notify_all()
         _logger.info('%r: Closed %d connections %s', self, count,
                     (dsn and last and 'to %r' % last.dsn) or '')
 
@@ -609,17 +865,90 @@ def dsn(db_or_uri):
 
     return db_or_uri, '%sdbname=%s' % (_dsn, db_or_uri)
 
+def replica_dsns(db_name):
+    """ Return the list of pairs ``(replica, dsn)`` for the replicas of the
+        database `db_name`. The replicas are given by the option
+        ``db_replicas``, a comma-separated list of ``host`` or ``host:port``.
+    """
+    result = []
+    for replica in filter(None, map(str.strip, str(tools.config.get('db_replicas') or '').split(','))):
+        host, _, port = replica.partition(':')
+        _dsn = 'host=%s ' % host
+        if port:
+            _dsn += 'port=%s ' % port
+        for p in ('user', 'password'):
+            cfg = tools.config['db_' + p]
+            if cfg:
+                _dsn += '%s=%s ' % (p, cfg)
+        result.append((replica, '%sdbname=%s' % (_dsn, db_name)))
+    return result
+
+# the replication lag of replicas is checked at most once per interval
+REPLICA_CHECK_INTERVAL = 5
+
+REPLICA_LAG_QUERY = """
+    SELECT CASE WHEN pg_last_xlog_receive_location() = pg_last_xlog_replay_location() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+_replica_lags = {}                  # {dsn: (time of check, lag in seconds)}
+_replica_counter = itertools.count()
+
+def replica_cursor(db_name):
+    """ Return a cursor on a replica of the database `db_name` that lags at
+        most ``db_replica_max_lag`` seconds behind the primary, or ``None``
+        if there is no such replica. The replicas are used in turn.
+    """
+    replicas = replica_dsns(db_name)
+    if not replicas:
+        return None
+    max_lag = float(tools.config.get('db_replica_max_lag', 30))
+    start = next(_replica_counter)
+    for index in xrange(len(replicas)):
+        replica, uri = replicas[(start + index) % len(replicas)]
+        now = time.time()
+        checked, lag = _replica_lags.get(uri, (0, 0))
+        check = now - checked >= REPLICA_CHECK_INTERVAL
+        if not check and lag > max_lag:
+            continue
+        try:
+            cr = Cursor(_get_pool(), db_name, uri, replica=True)
+        except (psycopg2.Error, PoolError):
+            _logger.warning("Cannot connect to replica %s of %s", replica, db_name, exc_info=True)
+            _replica_lags[uri] = (now, float('inf'))
+            continue
+        if check:
+            try:
+                cr.execute(REPLICA_LAG_QUERY, log_exceptions=False)
+                lag = cr.fetchone()[0] or 0
+            except psycopg2.Error:
+                _logger.warning("Cannot determine the lag of replica %s of %s", replica, db_name, exc_info=True)
+                lag = float('inf')
+            _replica_lags[uri] = (now, lag)
+            if lag > max_lag:
+                _logger.info("Replica %s of %s lags %.1fs behind, not used", replica, db_name, lag)
+                cr.close()
+                continue
+        return cr
+    return None
+
 _Pool = None
 
-def db_connect(to, allow_uri=False):
+def _get_pool():
     global _Pool
     if _Pool is None:
-        _Pool = ConnectionPool(int(tools.config['db_maxconn']))
+        _Pool = ConnectionPool(int(tools.config['db_maxconn']),
+                               int(tools.config.get('db_prepare_threshold', 0)),
+                               int(tools.config.get('db_prepare_size', 100)),
+                               float(tools.config.get('db_pool_timeout', 10)),
+                               float(tools.config.get('db_pool_idle_timeout', 600)))
+    return _Pool
 
+def db_connect(to, allow_uri=False):
     db, uri = dsn(to)
     if not allow_uri and db != to:
         raise ValueError('URI connections not allowed')
-    return Connection(_Pool, db, uri)
+    return Connection(_get_pool(), db, uri)
 
 def close_db(db_name):
     """ You might want to call openerp.modules.registry.RegistryManager.delete(db_name) along this function."""
@@ -24,7 +24,12 @@
 from collections import defaultdict
 from decorator import decorator
 from inspect import getargspec
+from weakref import WeakSet
 import logging
+import threading
+import time
+
+from lru import LRU
 
 _logger = logging.getLogger(__name__)
 
@@ -46,6 +51,54 @@ class ormcache_counter(object):
 STAT = defaultdict(ormcache_counter)
 
 
+class prefetch_counter(object):
+    """ Statistic counters and adaptive size for the prefetching of a field.
+        A miss is an access to the field that required a query, and a hit is
+        an access to a record whose value was fetched by the query of another
+        record. The records fetched that way and not accessed are wasted.
+    """
+    __slots__ = ['hit', 'miss', 'prefetched', 'size']
+
+    def __init__(self):
+        self.hit = 0
+        self.miss = 0
+        self.prefetched = 0
+        self.size = 0
+
+    @property
+    def ratio(self):
+        return 100.0 * self.hit / (self.hit + self.miss or 1)
+
+    @property
+    def wasted(self):
+        return self.prefetched - self.hit
+
+# prefetch counters dictionary, maps (dbname, modelname, fieldname) to counter
+PREFETCH_STAT = defaultdict(prefetch_counter)
+
+
+class recompute_counter(object):
+    """ Statistic counters for the recomputation of stored computed fields:
+        the number of computations, of records computed, and the time spent.
+    """
+    __slots__ = ['calls', 'records', 'time']
+
+    def __init__(self):
+        self.calls = 0
+        self.records = 0
+        self.time = 0.0
+
+# recompute counters dictionary, maps (dbname, modelname, fieldnames) to counter
+RECOMPUTE_STAT = defaultdict(recompute_counter)
+
+
+def _on_replica(args):
+    """ Return whether an orm method is called with a cursor on a replica of
+        the database; its result may then be outdated, and must not be cached.
+    """
+    return len(args) > 1 and getattr(args[1], 'replica', False)
+
+
 class ormcache(object):
     """ LRU cache decorator for orm methods. """
 
@@ -70,6 +123,8 @@ class ormcache(object):
             return r
         except KeyError:
             STAT[key0].miss += 1
+            if _on_replica(args):
+                return self.method(*args, **kwargs)
             value = d[key] = self.method(*args, **kwargs)
             return value
         except TypeError:
@@ -84,7 +139,7 @@ class ormcache(object):
                          "(while clearing caches on (%s).%s)",
                          model._name, self.method.__name__)
         d.clear_prefix(key0)
-        model.pool._any_cache_cleared = True
+        model.pool.cache_cleared(model._name)
 
 
 class ormcache_context(ormcache):
@@ -118,6 +173,8 @@ class ormcache_context(ormcache):
             return r
         except KeyError:
             STAT[key0].miss += 1
+            if _on_replica(args):
+                return self.method(*args, **kwargs)
             value = d[key] = self.method(*args, **kwargs)
             return value
         except TypeError:
@@ -155,6 +212,8 @@ class ormcache_multi(ormcache):
             result.update(method(*args, **kwargs))
 
             # store those new results back in the cache
+            if _on_replica(args):
+                return result
             for i in missed:
                 key = base_key + (i,)
                 d[key] = result[i]
@@ -162,6 +221,105 @@ class ormcache_multi(ormcache):
         return result
 
 
+class shared_record_cache(object):
+    """ Cache of field values shared by all the transactions on a registry,
+        for the models with ``_cache_shared = True``. Values are keyed by
+        model name, record id, field name and language.
+
+        Only committed values may be stored in the cache. A cursor that
+        modifies a model invalidates the corresponding entries, and the cache
+        is not filled for that model until the cursor has been closed.
+        Moreover, values read by a transaction started before the last
+        invalidation, or on a replica of the database, are discarded, as they
+        may be outdated.
+    """
+    def __init__(self, size=8192):
+        self._lock = threading.RLock()
+        self._data = LRU(size)              # {(model_name, id): {(field_name, lang): value}}
+        self._writers = defaultdict(WeakSet)    # {model_name: cursors}
+        self._invalidated = defaultdict(float)  # {model_name: time}
+        self._cleared = 0.0
+
+    def get(self, dbname, model_name, ids, field_names, lang=None):
+        """ Return a dictionary ``{id: {field_name: value}}`` with the
+            records of ``ids`` that have a value for all ``field_names``.
+        """
+        stat = STAT[(dbname, model_name, 'shared_cache')]
+        result = {}
+        for id in ids:
+            try:
+                values = self._data[(model_name, id)]
+                result[id] = dict((name, values[(name, lang)]) for name in field_names)
+                stat.hit += 1
+            except KeyError:
+                stat.miss += 1
+        return result
+
+    def update(self, cr, model_name, rows, field_names, lang=None):
+        """ Store the values of ``field_names`` given by ``rows`` (a list of
+            dictionaries with an ``'id'`` key) if they were committed.
+        """
+        with self._lock:
+            if cr.replica or not self._committed(cr, model_name):
+                return
+            for row in rows:
+                key = (model_name, row['id'])
+                try:
+                    values = self._data[key]
+                except KeyError:
+                    values = self._data[key] = {}
+                for name in field_names:
+                    values[(name, lang)] = row[name]
+
+    def invalidate(self, cr, model_name, ids=None):
+        """ Invalidate the values of the records ``ids`` (or all records) of
+            the given model, which are being modified by cursor ``cr``.
+        """
+        with self._lock:
+            self._writers[model_name].add(cr)
+            self._invalidated[model_name] = time.time()
+            if ids is None:
+                self._data.clear_prefix((model_name,))
+            else:
+                for id in ids:
+                    if (model_name, id) in self._data:
+                        del self._data[(model_name, id)]
+
+    def clear_model(self, model_name):
+        """ Invalidate all the values of the given model, which have been
+            modified by another process.
+        """
+        with self._lock:
+            self._invalidated[model_name] = time.time()
+            self._data.clear_prefix((model_name,))
+
+    def clear(self):
+        """ Invalidate the whole cache. """
+        with self._lock:
+            self._cleared = time.time()
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _committed(self, cr, model_name):
+        """ Return whether the values of the given model read by ``cr`` are
+            committed ones.
+        """
+        writers = self._writers[model_name]
+        if cr in writers:
+            return False
+        for writer in list(writers):
+            if not writer._closed:
+                return False
+            # the writer is done: the transactions started before it was
+            # closed may have read outdated values
+            writers.discard(writer)
+            self._invalidated[model_name] = time.time()
+        started = cr.transaction_start
+        return started > self._cleared and started > self._invalidated[model_name]
+
+
 class dummy_cache(object):
     """ Cache decorator replacement to actually do no caching. """
     def __init__(self, *l, **kw):
@@ -178,6 +336,9 @@ class dummy_cache(object):
 def log_ormcache_stats(sig=None, frame=None):
     """ Log statistics of ormcache usage by database, model, and method. """
     from openerp.modules.registry import RegistryManager
+    from openerp.sql_db import prepared_stat
+    import openerp.service.cron
+    import openerp.sql_db
     import threading
 
     me = threading.currentThread()
@@ -193,7 +354,46 @@ def log_ormcache_stats(sig=None, frame=None):
         _logger.info("%6d entries, %6d hit, %6d miss, %6d err, %4.1f%% ratio, for %s.%s",
                      count, stat.hit, stat.miss, stat.err, stat.ratio, model_name, method.__name__)
 
+    for reg in RegistryManager.registries.itervalues():
+        me.dbname = reg.db_name
+        entries = defaultdict(int)
+        for model_name, id in reg.shared_cache._data.iterkeys():
+            entries[model_name] += 1
+        for model_name, count in sorted(entries.items()):
+            stat = STAT[(reg.db_name, model_name, 'shared_cache')]
+            _logger.info("%6d records, %6d hit, %6d miss, %4.1f%% ratio, in shared cache of %s",
+                         count, stat.hit, stat.miss, stat.ratio, model_name)
+
+    for reg in RegistryManager.registries.itervalues():
+        if 'ir.rule' not in reg:
+            continue
+        me.dbname = reg.db_name
+        for model_name, (sets, count) in sorted(reg['ir.rule']._compiled_rules_stats().items()):
+            _logger.info("%6d group sets, %6d compiled rules, for record rules of %s",
+                         sets, count, model_name)
+
+    _logger.info("%6d hit, %6d miss, %6d err, %4.1f%% ratio, for prepared statements",
+                 prepared_stat.hit, prepared_stat.miss, prepared_stat.err, prepared_stat.ratio)
+
+    if openerp.sql_db._Pool is not None:
+        _logger.info("%(borrowed)6d borrowed, %(idle)6d idle, %(waits)6d waits, "
+                     "%(wait_time).3fs wait time, %(timeouts)6d timeouts, in connection pool",
+                     openerp.sql_db._Pool.stats())
+
+    for key, stat in sorted(PREFETCH_STAT.items()):
+        dbname, model_name, field_name = key
+        me.dbname = dbname
+        _logger.info("%6d size, %6d hit, %6d miss, %6d wasted, %4.1f%% ratio, for prefetching %s.%s",
+                     stat.size, stat.hit, stat.miss, stat.wasted, stat.ratio, model_name, field_name)
+
+    for key, stat in sorted(RECOMPUTE_STAT.items()):
+        dbname, model_name, field_names = key
+        me.dbname = dbname
+        _logger.info("%6d calls, %8d records, %8.3fs time, for recomputing %s.%s",
+                     stat.calls, stat.records, stat.time, model_name, field_names)
+
     me.dbname = me_dbname
+    openerp.service.cron.log_stats()
 
 # For backward compatibility
 cache = ormcache
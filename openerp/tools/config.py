@@ -300,6 +300,10 @@ class configmanager(object):
         group.add_option("--max-cron-threads", dest="max_cron_threads", my_default=2,
                          help="Maximum number of threads processing concurrently cron jobs (default 2).",
                          type="int")
+        group.add_option("--max-job-threads", dest="max_job_threads", my_default=0,
+                         help="Maximum number of threads (or worker processes in prefork mode) "
+                              "processing concurrently queued jobs (default 0).",
+                         type="int")
         group.add_option("--unaccent", dest="unaccent", my_default=False, action="store_true",
                          help="Use the unaccent function provided by the database when available.")
         group.add_option("--geoip-db", dest="geoip_database", my_default='/usr/share/GeoIP/GeoLiteCity.dat',
@@ -312,6 +316,15 @@ class configmanager(object):
             group.add_option("--workers", dest="workers", my_default=0,
                              help="Specify the number of workers, 0 disable prefork mode.",
                              type="int")
+            group.add_option("--min-workers", dest="min_workers", my_default=0,
+                             help="Minimum number of HTTP workers; when lower than --workers, the "
+                                  "number of HTTP workers scales between both according to the load "
+                                  "(default 0, no scaling).",
+                             type="int")
+            group.add_option("--preload-databases", dest="preload_databases", my_default=False,
+                             action="store_true",
+                             help="Load the registries of the databases matching --db-filter in the "
+                                  "master process, to share them with the workers.")
             group.add_option("--limit-memory-soft", dest="limit_memory_soft", my_default=2048 * 1024 * 1024,
                              help="Maximum allowed virtual memory per worker, when reached the worker be reset after the current request (default 671088640 aka 640MB).",
                              type="int")
@@ -440,12 +453,12 @@ class configmanager(object):
             'stop_after_init', 'logrotate', 'without_demo', 'xmlrpc', 'syslog',
             'list_db', 'xmlrpcs', 'proxy_mode',
             'test_file', 'test_enable', 'test_commit', 'test_report_directory',
-            'osv_memory_count_limit', 'osv_memory_age_limit', 'max_cron_threads', 'unaccent',
+            'osv_memory_count_limit', 'osv_memory_age_limit', 'max_cron_threads', 'max_job_threads', 'unaccent',
             'data_dir',
         ]
 
         posix_keys = [
-            'auto_reload', 'workers',
+            'auto_reload', 'workers', 'min_workers', 'preload_databases',
             'limit_memory_hard', 'limit_memory_soft',
             'limit_time_cpu', 'limit_time_real', 'limit_request',
         ]
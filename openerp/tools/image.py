@@ -19,6 +19,11 @@
 #
 ##############################################################################
 
+import hashlib
+import logging
+import os
+import tempfile
+import threading
 try:
     import cStringIO as StringIO
 except ImportError:
@@ -28,6 +33,10 @@ from PIL import Image
 from PIL import ImageEnhance
 from random import randint
 
+from .config import config
+
+_logger = logging.getLogger(__name__)
+
 # ----------------------------------------
 # Image resizing
 # ----------------------------------------
@@ -167,6 +176,111 @@ def image_resize_image_small(base64_source, size=(64, 64), encoding='base64', fi
     """
     return image_resize_image(base64_source, size, encoding, filetype, avoid_if_small)
 
+# ----------------------------------------
+# Resized images cache
+# ----------------------------------------
+
+class ImageCache(object):
+    """ Content-addressed cache of resized images, stored as files in
+        directory ``path``. The images are identified by the checksum of
+        their source, their size and their format. The total size of the
+        files is kept under ``max_bytes`` by removing the least recently used
+        ones, which are the oldest by modification time.
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.total_bytes = None         # computed when storing the first image
+        self.lock = threading.Lock()
+
+    def _file_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def resize(self, base64_source, size, filetype='PNG'):
+        """ Return the raw data of the image ``base64_source`` resized with
+            :func:`image_resize_image` to ``size`` in format ``filetype``.
+        """
+        key = '%s-%dx%d.%s' % (hashlib.sha1(base64_source).hexdigest(),
+                               size[0], size[1], filetype.lower())
+        path = self._file_path(key)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            # mark the image as recently used
+            os.utime(path, None)
+            return data
+        except (IOError, OSError):
+            pass
+        data = image_resize_image(base64_source, size, filetype=filetype).decode('base64')
+        self._store(path, data)
+        return data
+
+    def _store(self, path, data):
+        dirname = os.path.dirname(path)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            # write to a temporary file, so that other processes never read a
+            # partially written image
+            fd, temp_path = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(data)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            _logger.warning("Cannot store resized image %s", path, exc_info=True)
+            return
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _mtime, size, _path in self._files())
+            else:
+                self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        """ Return the list of ``(mtime, size, path)`` of the cached images. """
+        result = []
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result.append((stat.st_mtime, stat.st_size, path))
+        return result
+
+    def _evict(self):
+        """ Remove the least recently used images, down to 80% of the maximal
+            size, to avoid scanning the cache on every new image. The total
+            size is recomputed, as other processes share the directory.
+        """
+        files = sorted(self._files())
+        total_bytes = sum(size for _mtime, size, _path in files)
+        for _mtime, size, path in files:
+            if total_bytes <= self.max_bytes * 0.8:
+                break
+            try:
+                os.unlink(path)
+                total_bytes -= size
+            except OSError:
+                pass
+        self.total_bytes = total_bytes
+
+_image_caches = {}
+
+def image_cache(dbname):
+    """ Return the :class:`ImageCache` of database ``dbname``, in its
+        filestore. Its size is given by option ``image_cache_size`` (in bytes)
+        of the configuration file.
+    """
+    path = os.path.join(config.filestore(dbname), 'image_cache')
+    cache = _image_caches.get(path)
+    if cache is None:
+        max_bytes = int(config.get('image_cache_size', 128 * 1024 * 1024))
+        cache = _image_caches.setdefault(path, ImageCache(path, max_bytes))
+    return cache
+
 # ----------------------------------------
 # Colors
 # ---------------------------------------
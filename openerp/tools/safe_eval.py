@@ -36,6 +36,7 @@ from psycopg2 import OperationalError
 from types import CodeType
 import logging
 
+from .lru import LRU
 from .misc import ustr
 
 import openerp
@@ -80,6 +81,9 @@ _SAFE_OPCODES = _EXPR_OPCODES.union(set(opmap[x] for x in [
     'LOAD_GLOBAL', # Only allows access to restricted globals
     ] if x in opmap))
 
+# code objects of the expressions checked by safe_eval, by (expr, mode)
+_safe_codes = LRU(4096)
+
 _logger = logging.getLogger(__name__)
 
 def _get_opcodes(codeobj):
@@ -309,7 +313,10 @@ def safe_eval(expr, globals_dict=None, locals_dict=None, mode="eval", nocopy=Fal
         if locals_dict is None:
             locals_dict = {}
         locals_dict.update(globals_dict.get('__builtins__'))
-    c = test_expr(expr, _SAFE_OPCODES, mode=mode)
+    try:
+        c = _safe_codes[(expr, mode)]
+    except KeyError:
+        c = _safe_codes[(expr, mode)] = test_expr(expr, _SAFE_OPCODES, mode=mode)
     try:
         return eval(c, globals_dict, locals_dict)
     except openerp.osv.orm.except_orm: